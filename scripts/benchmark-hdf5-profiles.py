@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+Benchmark the HDF5 writer profiles on the target file system.
+
+Synthetic camera frames (smooth background plus Poisson noise, like a
+flat-field) are written with the compression and chunk layout of each profile
+in ``startup/16-hdf5-writer-profiles.py``, then read back frame by frame. The
+write and read throughput and the compression ratio are reported per profile.
+
+The file is dropped from the page cache (``posix_fadvise``) before it is read
+back, so the read throughput is that of the file system. File systems which
+ignore the advice (some network file systems do) report cached reads.
+
+Blosc filters need the ``hdf5plugin`` package; profiles whose filter is not
+available are skipped.
+
+Usage::
+
+    ./scripts/benchmark-hdf5-profiles.py --directory /nsls2/data/tst/scratch
+"""
+
+import argparse
+import ast
+import os
+import sys
+import tempfile
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+import h5py
+import numpy as np
+
+PROFILES_FILE = (
+    Path(__file__).resolve().parent.parent / "startup" / "16-hdf5-writer-profiles.py"
+)
+
+
+def load_writer_profiles(path=PROFILES_FILE):
+    """
+    Return ``WRITER_PROFILES`` of the startup file.
+
+    Only the ``HDF5WriterProfile`` class and the ``WRITER_PROFILES`` assignment
+    are run, so the detectors of the profile are not instantiated.
+    """
+    tree = ast.parse(Path(path).read_text(), filename=str(path))
+    nodes = [
+        node
+        for node in tree.body
+        if (isinstance(node, ast.ClassDef) and node.name == "HDF5WriterProfile")
+        or (
+            isinstance(node, ast.Assign)
+            and any(getattr(t, "id", None) == "WRITER_PROFILES" for t in node.targets)
+        )
+    ]
+    ns = {"dataclass": dataclass, "Optional": Optional}
+    exec(compile(ast.Module(body=nodes, type_ignores=[]), str(path), "exec"), ns)
+    return ns["WRITER_PROFILES"]
+
+
+def filter_kwargs(profile):
+    """Return the h5py dataset filter arguments of the AD HDF5 plugin settings."""
+    if profile.compression == "None":
+        return {}
+    if profile.compression == "zlib":
+        return {"compression": "gzip", "compression_opts": profile.zlib_level}
+    if profile.compression != "Blosc":
+        raise ValueError(f"compression {profile.compression!r} is not supported")
+    import hdf5plugin
+
+    shuffles = {
+        "None": hdf5plugin.Blosc.NOSHUFFLE,
+        "Byte": hdf5plugin.Blosc.SHUFFLE,
+        "Bit": hdf5plugin.Blosc.BITSHUFFLE,
+    }
+    return dict(
+        hdf5plugin.Blosc(
+            cname=profile.blosc_compressor.lower(),
+            clevel=profile.blosc_level,
+            shuffle=shuffles[profile.blosc_shuffle],
+        )
+    )
+
+
+def drop_page_cache(path):
+    """Evict the (synced) pages of ``path`` from the page cache."""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+    finally:
+        os.close(fd)
+
+
+def synthetic_frames(num_frames, shape, dtype, seed=0):
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[: shape[0], : shape[1]]
+    background = (
+        0.6
+        * np.iinfo(dtype).max
+        * np.exp(
+            -(
+                ((x - shape[1] / 2) / shape[1]) ** 2
+                + ((y - shape[0] / 2) / shape[0]) ** 2
+            )
+        )
+    )
+    for _ in range(num_frames):
+        yield np.clip(rng.poisson(background), 0, np.iinfo(dtype).max).astype(dtype)
+
+
+def benchmark(path, profile, num_frames, shape, dtype):
+    kwargs = filter_kwargs(profile)
+    rows = profile.rows_per_chunk or shape[0]
+    frames = list(synthetic_frames(num_frames, shape, dtype))
+    raw_bytes = sum(frame.nbytes for frame in frames)
+
+    t0 = time.perf_counter()
+    with h5py.File(path, "w", libver="latest") as f:
+        dataset = f.create_dataset(
+            "/entry/data/data",
+            shape=(0, *shape),
+            maxshape=(None, *shape),
+            dtype=dtype,
+            chunks=(profile.frames_per_chunk, rows, shape[1]),
+            **kwargs,
+        )
+        f.swmr_mode = True
+        for i, frame in enumerate(frames):
+            dataset.resize(i + 1, axis=0)
+            dataset[i] = frame
+            if profile.flush_frames and (i + 1) % profile.flush_frames == 0:
+                dataset.flush()
+    os.sync()
+    write_time = time.perf_counter() - t0
+
+    drop_page_cache(path)
+    t0 = time.perf_counter()
+    with h5py.File(path, "r") as f:
+        dataset = f["/entry/data/data"]
+        for i in range(dataset.shape[0]):
+            dataset[i]
+    read_time = time.perf_counter() - t0
+
+    return {
+        "write MB/s": raw_bytes / write_time / 1e6,
+        "read MB/s": raw_bytes / read_time / 1e6,
+        "ratio": raw_bytes / os.path.getsize(path),
+    }
+
+
+def main():
+    profiles = load_writer_profiles()
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--directory", default=None, help="where to write test files")
+    parser.add_argument("--num-frames", type=int, default=200)
+    parser.add_argument("--shape", type=int, nargs=2, default=(1216, 1936))
+    parser.add_argument("--dtype", default="uint16")
+    parser.add_argument("--profile", action="append", choices=sorted(profiles))
+    args = parser.parse_args()
+
+    print(f"{'profile':<16s} {'write MB/s':>11s} {'read MB/s':>10s} {'ratio':>6s}")
+    with tempfile.TemporaryDirectory(dir=args.directory) as tmp_dir:
+        for name in args.profile or profiles:
+            path = os.path.join(tmp_dir, f"{name}.h5")
+            try:
+                result = benchmark(
+                    path, profiles[name], args.num_frames, tuple(args.shape), args.dtype
+                )
+            except (ImportError, ValueError) as err:
+                print(f"{name:<16s} skipped: {err}")
+                continue
+            print(
+                f"{name:<16s} {result['write MB/s']:11.1f} "
+                f"{result['read MB/s']:10.1f} {result['ratio']:6.2f}"
+            )
+            os.remove(path)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Check the import cost of the profile against a budget.
+
+All top-level import statements of the startup files are run, in order, in a
+fresh interpreter with ``-X importtime``. The script fails (exit status 1) if
+the total import time or the peak RSS exceeds the budget, or if any module
+that must stay lazy (the ophyd v1 areadetector stack, databroker v0, ...) was
+imported eagerly.
+
+Usage::
+
+    ./scripts/check-import-budget.py --max-seconds 6 --max-rss-mb 400
+"""
+
+import argparse
+import ast
+import subprocess
+import sys
+from pathlib import Path
+
+STARTUP_DIR = Path(__file__).resolve().parent.parent / "startup"
+
+# Modules which must only be imported on first use (see lazy_import in 00-startup.py).
+FORBIDDEN_EAGER_IMPORTS = (
+    "databroker.v0",
+    "nslsii.ad33",
+    "ophyd.areadetector",
+    "ophyd.areadetector.filestore_mixins",
+)
+
+RSS_MARKER = "__IMPORT_BUDGET_MAXRSS_KB__"
+
+
+def startup_imports(startup_dir):
+    """Return the source of every top-level import statement of the startup files."""
+    statements = []
+    for path in sorted(startup_dir.glob("*.py")):
+        text = path.read_text()
+        for node in ast.parse(text, str(path)).body:
+            if isinstance(node, (ast.Import, ast.ImportFrom)):
+                statements.append(ast.get_source_segment(text, node))
+    return statements
+
+
+def measure(statements):
+    """Run the imports with -X importtime and return (timings, maxrss_kb)."""
+    code = "\n".join(
+        statements
+        + [
+            "import resource",
+            f"print({RSS_MARKER!r}, "
+            "resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)",
+        ]
+    )
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True,
+        text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"Importing the profile modules failed:\n{proc.stderr}")
+
+    timings = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        # "import time:       123 |        456 |   package.module"
+        self_us, cumulative_us, name = line.split(":", 1)[1].split("|")
+        timings[name.strip()] = (int(self_us), int(cumulative_us))
+    maxrss_kb = next(
+        int(line.split()[-1])
+        for line in proc.stdout.splitlines()
+        if line.startswith(RSS_MARKER)
+    )
+    return timings, maxrss_kb
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--startup-dir", type=Path, default=STARTUP_DIR)
+    parser.add_argument("--max-seconds", type=float, default=6.0)
+    parser.add_argument("--max-rss-mb", type=float, default=400.0)
+    parser.add_argument("--top", type=int, default=15, help="slowest packages shown")
+    args = parser.parse_args()
+
+    timings, maxrss_kb = measure(startup_imports(args.startup_dir))
+    total = sum(self_us for self_us, _ in timings.values()) / 1e6
+    rss_mb = maxrss_kb / 1024
+
+    top_level = {
+        name: cumulative for name, (_, cumulative) in timings.items() if "." not in name
+    }
+    print(f"{'package':<40s} {'cumulative [s]':>15s}")
+    for name, cumulative in sorted(top_level.items(), key=lambda kv: -kv[1])[
+        : args.top
+    ]:
+        print(f"{name:<40s} {cumulative / 1e6:15.3f}")
+    print(f"\nTotal import time: {total:.3f} s (budget {args.max_seconds} s)")
+    print(f"Peak RSS: {rss_mb:.1f} MB (budget {args.max_rss_mb} MB)")
+
+    failures = []
+    if total > args.max_seconds:
+        failures.append(f"import time {total:.3f} s > {args.max_seconds} s")
+    if rss_mb > args.max_rss_mb:
+        failures.append(f"peak RSS {rss_mb:.1f} MB > {args.max_rss_mb} MB")
+    eager = [m for m in FORBIDDEN_EAGER_IMPORTS if m in timings]
+    if eager:
+        failures.append(f"modules imported eagerly: {', '.join(eager)}")
+
+    for failure in failures:
+        print(f"FAILED: {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""
+Export tomography runs from tiled to Data Exchange (DXchange) HDF5 files.
+
+The file has ``/exchange/data``, ``/exchange/data_dark``, ``/exchange/data_white``
+and ``/exchange/theta``. If the run has a master file (see
+``startup/62-run-consolidation.py``) the frame datasets are virtual datasets
+pointing into it, so no frame is copied. Otherwise the frames are copied from
+tiled in chunks of ``--chunk-frames`` frames, keeping the memory use bounded.
+
+Streams are sorted by name: ``*dark*`` streams are darks, ``*flat*`` or
+``*white*`` streams are flats, and any other stream with image data holds
+the projections. Angles come from the ``tomo`` start metadata of the run.
+
+Usage::
+
+    ./scripts/dxchange-export.py <uid> [<uid> ...]
+    ./scripts/dxchange-export.py --watch           # export new runs as they finish
+"""
+
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+import h5py
+import numpy as np
+
+DEFAULT_TILED_URI = "http://localhost:8000"
+
+
+def frame_type(stream_name):
+    name = stream_name.lower()
+    if "dark" in name:
+        return "data_dark"
+    if "flat" in name or "white" in name:
+        return "data_white"
+    return "data"
+
+
+def theta_from_metadata(start, num_frames):
+    """
+    Return the angle [deg] of each of the ``num_frames`` projections of a run.
+
+    Multi-series runs list the angular range and frame indices of each series
+    under ``tomo.series``; other runs cover ``start_deg`` to ``stop_deg``.
+    """
+    tomo = start.get("tomo", {})
+    if "series" in tomo:
+        theta = np.concatenate(
+            [
+                np.linspace(
+                    series["start_deg"],
+                    series["stop_deg"],
+                    series["indices"][1] - series["indices"][0],
+                )
+                for series in tomo["series"]
+            ]
+        )
+        if theta.size != num_frames:
+            print(
+                f"Run {start['uid']}: {num_frames} projections for the "
+                f"{theta.size} angles of its {len(tomo['series'])} series"
+            )
+        return theta[:num_frames]
+    if "start_deg" not in tomo:
+        return None
+    return np.linspace(tomo["start_deg"], tomo["stop_deg"], num_frames)
+
+
+def master_sources(master_file, detector=None):
+    """Return ``{dxchange name: (stream, data_key, shape, dtype)}`` from a master file."""
+    sources = {}
+    with h5py.File(master_file, "r") as f:
+        for stream_name, group in sorted(f["entry"].items()):
+            for data_key, dataset in group.items():
+                if dataset.ndim != 3 or (
+                    detector and not data_key.startswith(detector)
+                ):
+                    continue
+                sources.setdefault(
+                    frame_type(stream_name),
+                    (stream_name, data_key, dataset.shape, dataset.dtype),
+                )
+    return sources
+
+
+def _tiled_image_arrays(run, detector=None):
+    """Return ``{dxchange name: array client}`` of the image data in a run."""
+    arrays = {}
+    for stream_name in sorted(run):
+        stream = run[stream_name]
+        data = stream["external"] if "external" in stream else stream
+        for data_key in data:
+            if detector and not data_key.startswith(detector):
+                continue
+            array = data[data_key]
+            if len(getattr(array, "shape", ())) == 3:
+                arrays.setdefault(frame_type(stream_name), array)
+    return arrays
+
+
+def export_run(run, output_dir=None, detector=None, chunk_frames=64):
+    """Write the DXchange file of a tiled run and return its path."""
+    start = run.metadata["start"]
+    master_file = run.metadata.get("master_file")
+    if output_dir is None:
+        if master_file is None:
+            raise ValueError("No master file: an output directory is required")
+        output_dir = Path(master_file).parent
+    path = Path(output_dir) / (
+        f"scan_{start.get('scan_id', 0):05d}_{start['uid'][:8]}_dxchange.h5"
+    )
+
+    with h5py.File(path, "w", libver="latest") as f:
+        exchange = f.create_group("exchange")
+        num_projections = 0
+        if master_file is not None:
+            relative = os.path.relpath(master_file, path.parent)
+            for name, (stream_name, data_key, shape, dtype) in master_sources(
+                master_file, detector
+            ).items():
+                layout = h5py.VirtualLayout(shape=shape, dtype=dtype)
+                layout[:] = h5py.VirtualSource(
+                    relative, f"/entry/{stream_name}/{data_key}", shape=shape
+                )
+                exchange.create_virtual_dataset(name, layout, fillvalue=0)
+                if name == "data":
+                    num_projections = shape[0]
+        else:
+            for name, array in _tiled_image_arrays(run, detector).items():
+                dataset = exchange.create_dataset(
+                    name,
+                    shape=array.shape,
+                    dtype=array.dtype,
+                    chunks=(1, *array.shape[1:]),
+                )
+                for i in range(0, array.shape[0], chunk_frames):
+                    stop = min(i + chunk_frames, array.shape[0])
+                    dataset[i:stop] = array[i:stop]
+                if name == "data":
+                    num_projections = array.shape[0]
+
+        theta = theta_from_metadata(start, num_projections)
+        if theta is not None:
+            exchange.create_dataset("theta", data=theta)
+            exchange["theta"].attrs["units"] = "degrees"
+        f.create_dataset("implements", data="exchange")
+        f.attrs["run_uid"] = start["uid"]
+    return path
+
+
+def export_and_record(client, uid, output_dir=None, detector=None, chunk_frames=64):
+    run = client[uid]
+    path = export_run(
+        run, output_dir=output_dir, detector=detector, chunk_frames=chunk_frames
+    )
+    # Only this key is patched, so metadata written meanwhile by other
+    # processes (e.g. the post-run callbacks of the profile) is kept.
+    try:
+        run.patch_metadata(
+            [{"op": "add", "path": "/dxchange_file", "value": str(path)}]
+        )
+    except Exception as err:
+        print(f"Could not store the DXchange path for run {uid}: {err!r}")
+    print(f"Exported run {uid} to {path}")
+    return path
+
+
+def watch(client, output_dir=None, detector=None, interval=10.0, recent=20):
+    """Poll tiled and export every finished tomography run not exported yet."""
+    exported = set()
+    while True:
+        for uid in list(client.keys()[-recent:]):
+            if uid in exported:
+                continue
+            metadata = client[uid].metadata
+            if metadata.get("stop") is None:
+                continue
+            exported.add(uid)
+            if "tomo" not in metadata["start"] or "dxchange_file" in metadata:
+                continue
+            try:
+                export_and_record(client, uid, output_dir, detector)
+            except Exception as err:
+                print(f"Export of run {uid} failed: {err!r}")
+        time.sleep(interval)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("uids", nargs="*")
+    parser.add_argument("--watch", action="store_true")
+    parser.add_argument("--interval", type=float, default=10.0)
+    parser.add_argument("--output-dir", type=Path, default=None)
+    parser.add_argument("--detector", default=None, help="data key prefix of frames")
+    parser.add_argument("--chunk-frames", type=int, default=64)
+    parser.add_argument("--tiled-uri", default=DEFAULT_TILED_URI)
+    args = parser.parse_args()
+
+    from tiled.client import from_uri
+
+    client = from_uri(args.tiled_uri, api_key=os.getenv("TILED_API_KEY", ""))
+    for uid in args.uids:
+        export_and_record(
+            client, uid, args.output_dir, args.detector, args.chunk_frames
+        )
+    if args.watch:
+        watch(client, args.output_dir, args.detector, interval=args.interval)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,398 @@
+#!/usr/bin/env python3
+"""
+Regenerate startup/existing_plans_and_devices.yaml without starting the profile.
+
+The startup files are parsed instead of executed: only imports, function and
+class definitions, and assignments whose calls resolve to profile code or to
+ophyd-async constructors are run. ``DeviceCollector`` only names the devices
+and ``redis`` / ``RedisJSONDict`` are replaced by in-memory dicts, so no IOC,
+redis or tiled connection is made.
+
+Plans and devices whose names start with ``_`` are internal helpers and are
+not published.
+
+Entries are cached in a JSON file keyed on the library versions and on the
+source of every plan/device definition, so only entries whose inputs changed
+are regenerated. If neither the startup files nor the library versions changed
+the script exits before importing anything heavy.
+
+The plan annotations depend on the library versions, so the file is only
+written with the versions in ``PINNED_VERSIONS``.
+
+Usage::
+
+    ./scripts/gen-existing-plans-and-devices.py            # update the YAML file
+    ./scripts/gen-existing-plans-and-devices.py --check    # exit 1 if it is stale
+"""
+
+import argparse
+import ast
+import functools
+import hashlib
+import inspect
+import json
+import sys
+import tempfile
+import time
+import types
+from importlib import metadata
+from pathlib import Path
+
+STARTUP_DIR = Path(__file__).resolve().parent.parent / "startup"
+OUTPUT_NAME = "existing_plans_and_devices.yaml"
+CACHE_NAME = ".existing_plans_and_devices.cache.json"
+
+VERSIONED_PACKAGES = (
+    "bluesky",
+    "bluesky-queueserver",
+    "nslsii",
+    "ophyd",
+    "ophyd-async",
+)
+
+# Versions the committed YAML file is generated with. Other versions describe
+# the same plans differently (e.g. the annotations of ``mv``).
+PINNED_VERSIONS = {
+    "bluesky": "1.13",
+    "bluesky-queueserver": "0.0.21",
+    "ophyd-async": "0.5.2",
+}
+
+# Modules whose callables may be invoked while building the namespace.
+SAFE_CALL_MODULES = ("__main__", "ophyd_async", "uuid", "builtins")
+# Other callables which may be invoked, by qualified name.
+SAFE_CALLABLES = ("bluesky.utils.make_decorator",)
+
+EXECUTED_NODES = (
+    ast.Import,
+    ast.ImportFrom,
+    ast.FunctionDef,
+    ast.AsyncFunctionDef,
+    ast.ClassDef,
+    ast.Assign,
+    ast.AnnAssign,
+    ast.With,
+)
+
+
+def _sha256(data):
+    return hashlib.sha256(data.encode() if isinstance(data, str) else data).hexdigest()
+
+
+def library_versions():
+    versions = {}
+    for package in VERSIONED_PACKAGES:
+        try:
+            versions[package] = metadata.version(package)
+        except metadata.PackageNotFoundError:
+            versions[package] = None
+    versions["python"] = sys.version.split()[0]
+    return versions
+
+
+def startup_files(startup_dir):
+    return sorted(startup_dir.glob("*.py"))
+
+
+def file_hashes(startup_dir):
+    return {f.name: _sha256(f.read_bytes()) for f in startup_files(startup_dir)}
+
+
+class _InMemoryRedis(dict):
+    """Stands for ``redis.Redis`` in the namespace: an empty in-memory store."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__()
+
+
+def _in_memory_json_dict(redis_client, prefix=""):
+    """Stands for ``RedisJSONDict``: a plain dict, nothing is read from redis."""
+    return {}
+
+
+@functools.lru_cache(maxsize=None)
+def _no_connect_device_collector():
+    import asyncio
+
+    from ophyd_async.core import DeviceCollector
+
+    class NoConnectDeviceCollector(DeviceCollector):
+        """``DeviceCollector`` naming the devices without connecting them."""
+
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **{**kwargs, "connect": False})
+
+        def __exit__(self, type_, value, traceback):
+            # Naming needs no bluesky event loop, so none is started.
+            self._objects_on_exit = self._caller_locals()
+            asyncio.run(self._on_exit())
+
+    return NoConnectDeviceCollector
+
+
+def _stubs():
+    """Names replaced in the namespace, so that nothing connects to hardware or redis."""
+    return {
+        "DeviceCollector": _no_connect_device_collector(),
+        "redis": types.SimpleNamespace(Redis=_InMemoryRedis),
+        "RedisJSONDict": _in_memory_json_dict,
+    }
+
+
+def _install_stubs(ns):
+    for name, stub in _stubs().items():
+        if name in ns:
+            ns[name] = stub
+
+
+def _is_safe(node, ns):
+    """Check that every call in ``node`` resolves to an allowed callable."""
+    stubs = (_no_connect_device_collector(), _InMemoryRedis, _in_memory_json_dict)
+    for call in (n for n in ast.walk(node) if isinstance(n, ast.Call)):
+        try:
+            func = eval(compile(ast.Expression(call.func), "<call>", "eval"), ns)
+        except Exception:
+            return False
+        if any(func is stub for stub in stubs):
+            continue
+        module = getattr(func, "__module__", None) or ""
+        if f"{module}.{getattr(func, '__qualname__', '')}" in SAFE_CALLABLES:
+            continue
+        if module.split(".")[0] not in SAFE_CALL_MODULES:
+            return False
+    return True
+
+
+def _execute(node, ns, filename):
+    code = compile(ast.Module([node], type_ignores=[]), filename, "exec")
+    exec(code, ns)
+
+
+def build_namespace(startup_dir, verbose=False):
+    """
+    Build the profile namespace from the startup files without touching hardware.
+
+    Returns the namespace and a mapping of every top-level name to the source
+    of the statement that defined it.
+    """
+    import nslsii
+
+    ns = {"__name__": "__main__"}
+    # Mirror the convenience imports done by nslsii.configure_base().
+    for module_name in (
+        "bluesky.callbacks",
+        "bluesky.plans",
+        "bluesky.plan_stubs",
+        "bluesky.callbacks.broker",
+        "bluesky.simulators",
+    ):
+        module = __import__(module_name, fromlist=["*"])
+        nslsii.import_star(module, ns)
+    import bluesky.plan_stubs
+    import bluesky.plans
+    import bluesky.preprocessors
+
+    ns.update(bp=bluesky.plans, bps=bluesky.plan_stubs, bpp=bluesky.preprocessors)
+
+    sources = {}
+    for path in startup_files(startup_dir):
+        text = path.read_text()
+        ns["__file__"] = str(path)
+        for node in ast.parse(text, str(path)).body:
+            if not isinstance(node, EXECUTED_NODES):
+                continue
+            if isinstance(node, (ast.Import, ast.ImportFrom)):
+                _execute(node, ns, str(path))
+                _install_stubs(ns)
+                continue
+            if isinstance(node, (ast.Assign, ast.AnnAssign, ast.With)):
+                if not _is_safe(node, ns):
+                    if verbose:
+                        print(f"Skipping {path.name}:{node.lineno}")
+                    continue
+            try:
+                _execute(node, ns, str(path))
+            except Exception as err:
+                if verbose:
+                    print(f"Failed {path.name}:{node.lineno}: {err!r}")
+                continue
+            segment = _source_segment(text, node)
+            for name in _defined_names(node):
+                sources[name] = segment
+    return ns, sources
+
+
+def _source_segment(text, node):
+    """Source of ``node``, including its decorators."""
+    decorators = getattr(node, "decorator_list", [])
+    if not decorators:
+        return ast.get_source_segment(text, node)
+    first = min(decorator.lineno for decorator in decorators)
+    return "\n".join(text.splitlines()[first - 1 : node.end_lineno])
+
+
+def _signature(obj):
+    """Text of the signature of ``obj`` with its defaults resolved, if callable."""
+    try:
+        return str(inspect.signature(obj))
+    except (TypeError, ValueError):
+        return None
+
+
+def _defined_names(node):
+    if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+        return [node.name]
+    if isinstance(node, ast.With):
+        return [name for child in node.body for name in _defined_names(child)]
+    targets = node.targets if isinstance(node, ast.Assign) else [node.target]
+    return [t.id for t in targets if isinstance(t, ast.Name)]
+
+
+def _public(objects):
+    return {name: obj for name, obj in objects.items() if not name.startswith("_")}
+
+
+def entry_key(name, obj, sources, versions):
+    """
+    Cache key of a plan/device: its defining source (with decorators), resolved
+    signature, module, type and the library versions.
+
+    The signature covers defaults taken from module constants, which the
+    source of the definition does not show.
+    """
+    origin = [
+        name,
+        sources.get(name),
+        _signature(obj),
+        getattr(obj, "__module__", None),
+        f"{type(obj).__module__}.{type(obj).__qualname__}",
+    ]
+    return _sha256(json.dumps([origin, versions], sort_keys=True))
+
+
+def generate(startup_dir, check=False, force=False, verbose=False):
+    output = startup_dir / OUTPUT_NAME
+    cache_file = startup_dir / CACHE_NAME
+    versions = library_versions()
+    hashes = file_hashes(startup_dir)
+    unpinned = {
+        package: version
+        for package, version in PINNED_VERSIONS.items()
+        if versions.get(package) != version
+    }
+    if unpinned:
+        for package, version in unpinned.items():
+            print(f"{package}=={version} is required, {versions.get(package)} found.")
+        return 1
+
+    cache = {}
+    if cache_file.exists() and not force:
+        cache = json.loads(cache_file.read_text())
+    if (
+        output.exists()
+        and cache.get("versions") == versions
+        and cache.get("files") == hashes
+        and cache.get("output") == _sha256(output.read_bytes())
+    ):
+        print(f"{output.name} is up to date.")
+        return 0
+
+    from bluesky_queueserver.manager.profile_ops import (
+        devices_from_nspace,
+        existing_plans_and_devices_from_nspace,
+        plans_from_nspace,
+        save_existing_plans_and_devices,
+    )
+
+    ns, sources = build_namespace(startup_dir, verbose=verbose)
+    # Names starting with "_" are profile internals, forbidden to every user
+    # group by user_group_permissions.yaml, so they are not published.
+    plans_in_nspace = _public(plans_from_nspace(ns))
+    devices_in_nspace = _public(devices_from_nspace(ns))
+
+    cached = {"plans": cache.get("plans", {}), "devices": cache.get("devices", {})}
+    entries = {"plans": {}, "devices": {}}
+    stale = {"plans": {}, "devices": {}}
+    for kind, objects in (("plans", plans_in_nspace), ("devices", devices_in_nspace)):
+        for name, obj in objects.items():
+            key = entry_key(name, obj, sources, versions)
+            previous = cached[kind].get(name)
+            if previous is not None and previous["key"] == key:
+                entries[kind][name] = previous
+            else:
+                stale[kind][name] = (key, obj)
+
+    if stale["plans"] or stale["devices"]:
+        stale_ns = {
+            name: obj for kind in stale.values() for name, (_, obj) in kind.items()
+        }
+        existing_plans, existing_devices, _, _ = existing_plans_and_devices_from_nspace(
+            nspace=stale_ns
+        )
+        for kind, existing in (
+            ("plans", existing_plans),
+            ("devices", existing_devices),
+        ):
+            for name, (key, _) in stale[kind].items():
+                if name in existing:
+                    entries[kind][name] = {"key": key, "entry": existing[name]}
+    print(
+        f"Regenerated {len(stale['plans'])} plan(s) and {len(stale['devices'])} "
+        f"device(s), {len(entries['plans'])} plans and {len(entries['devices'])} "
+        "devices in total."
+    )
+
+    existing_plans = {name: e["entry"] for name, e in sorted(entries["plans"].items())}
+    existing_devices = {
+        name: e["entry"] for name, e in sorted(entries["devices"].items())
+    }
+    previous_output = output.read_bytes() if output.exists() else None
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        save_existing_plans_and_devices(
+            existing_plans=existing_plans,
+            existing_devices=existing_devices,
+            file_dir=tmp_dir,
+            file_name=OUTPUT_NAME,
+            overwrite=True,
+        )
+        new_output = (Path(tmp_dir) / OUTPUT_NAME).read_bytes()
+
+    if new_output == previous_output:
+        print(f"{output.name} is unchanged.")
+    elif check:
+        print(f"{output.name} is out of date.")
+        return 1
+    else:
+        output.write_bytes(new_output)
+        print(f"Updated {output}")
+
+    cache = {
+        "versions": versions,
+        "files": hashes,
+        "output": _sha256(output.read_bytes()),
+        **entries,
+    }
+    cache_file.write_text(json.dumps(cache, indent=1, sort_keys=True))
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--startup-dir", type=Path, default=STARTUP_DIR)
+    parser.add_argument(
+        "--check", action="store_true", help="only check whether the file is current"
+    )
+    parser.add_argument("--force", action="store_true", help="ignore the cache")
+    parser.add_argument("-v", "--verbose", action="store_true")
+    args = parser.parse_args()
+
+    t0 = time.monotonic()
+    status = generate(
+        args.startup_dir, check=args.check, force=args.force, verbose=args.verbose
+    )
+    print(f"Done in {time.monotonic() - t0:.3f} s")
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -130,38 +130,8 @@ get_ipython().run_line_magic("autoawait", "call_in_bluesky_event_loop")
 #         self._writer = writer
 #         super().__init__(*args, **kwargs)
 
-#     async def find_all_selected_captures(self):
-#         selected_captures = []
-
-#         for name, block_type in dict(self.children()).items():
-#             blocks_dict = {"1": block_type}
-#             if isinstance(block_type, DeviceVector):
-#                 blocks_dict = dict(block_type.children())
-#             for number, block in blocks_dict.items():
-#                 for signal_name, signal in dict(block.children()).items():
-#                     print(f"Checking signal: {signal_name} in block {name}{number}")
-#                     if signal_name.endswith("_capture"):
-#                         signal_val = await signal.get_value()
-#                         if signal_val.value != "No":
-#                             print(
-#                                 f"*******Saving signal: {signal_name} in block {name}{number}"
-#                             )
-#                             selected_captures.append(signal)
-#         return selected_captures
-
-#     def create_fields(self):
-
-#         for i, cpt in enumerate(self.positions.component_names):
-#             cpt_obj = getattr(self.panda.positions, cpt)
-#             capture = cpt_obj.capture.get()
-#             param_name = cpt_obj.param_name.get()
-#             if capture == "Value":
-#                 self.fields[f"{param_name.replace(':', '_').lower()}"] = {
-#                     "value": f"{param_name.replace(':', '.')}.{capture}",  # e.g., "COUNTER1.OUT.Value",
-#                     "dtype_str": self._writer._type_map[
-#                         "float64"
-#                     ],  # TODO: figure out how to assign dtypes properly based on the info from the IOC.
-#                 }
+#     # Capture discovery and per-field dtypes: see PandACaptureDiscovery in
+#     # startup/11-panda-captures.py.
 
 
 if __name__ == "__main__":
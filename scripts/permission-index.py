@@ -0,0 +1,592 @@
+#!/usr/bin/env python3
+"""
+Precompiled index of the queueserver user group permissions.
+
+The rules of ``startup/user_group_permissions.yaml`` are compiled once per
+group into a single matcher: the plan regexes are merged into one regular
+expression, and the device patterns are evaluated together in a single pass
+over the device tree. A pattern stops being evaluated below the first level
+where it no longer matches, the way a trie is walked. The queueserver
+instead applies every pattern to a deep copy of the whole tree. The lists of
+allowed plans and devices of every group are then computed from
+``startup/existing_plans_and_devices.yaml`` and cached in
+``$PERMISSION_INDEX_DIR`` (``~/.cache/permission_index``) under the hash of
+both files, so they are only recomputed when either file changes.
+
+``install()`` replaces ``load_allowed_plans_and_devices`` in the RE Manager
+and RE Worker with the compiled version, which reads that cache and also keeps
+the last results in memory; ``scripts/start-re-manager-prewarmed.py`` calls
+it. The output is identical to the queueserver's (checked with ``--check``
+for the versions in ``QUEUESERVER_VERSIONS``).
+
+Usage::
+
+    ./scripts/permission-index.py                  # build the cache
+    ./scripts/permission-index.py --check          # compare with the queueserver
+    ./scripts/permission-index.py --benchmark --synthetic-pandas 4
+"""
+
+import argparse
+import hashlib
+import os
+import pickle
+import re
+import sys
+import time
+from pathlib import Path
+
+STARTUP_DIR = Path(__file__).resolve().parent.parent / "startup"
+DEFAULT_PERMISSIONS_FILE = STARTUP_DIR / "user_group_permissions.yaml"
+DEFAULT_EXISTING_FILE = STARTUP_DIR / "existing_plans_and_devices.yaml"
+INDEX_DIR = Path(
+    os.getenv("PERMISSION_INDEX_DIR", Path.home() / ".cache" / "permission_index")
+)
+
+# Number of results of load_allowed_plans_and_devices kept in memory by install().
+MEMORY_CACHE_SIZE = 4
+
+# Queueserver versions whose private pattern helpers (_split_name_pattern,
+# _get_device_type_condition) were checked to give the same results (--check).
+QUEUESERVER_VERSIONS = ("0.0.25",)
+
+
+def _matches_all(patterns, forbid):
+    # ``[None]`` allows everything but forbids nothing.
+    return not forbid and bool(patterns) and patterns[0] is None
+
+
+def _matches_none(patterns):
+    return not patterns or patterns[0] is None
+
+
+class NameMatcher:
+    """All the patterns of a plan or function rule list, as one regex and one set."""
+
+    def __init__(self, patterns, forbid=False):
+        from bluesky_queueserver.manager.profile_ops import _split_name_pattern
+
+        self.match_all = _matches_all(patterns, forbid)
+        self.names = set()
+        regexes = []
+        if not self.match_all and not _matches_none(patterns):
+            for pattern in patterns:
+                components, uses_re, _ = _split_name_pattern(pattern)
+                if len(components) != 1:
+                    raise ValueError(f"Plan pattern {pattern!r} has several components")
+                if uses_re:
+                    regexes.append(f"(?:{components[0][0]})")
+                else:
+                    self.names.add(components[0][0])
+        self.regex = re.compile("|".join(regexes)) if regexes else None
+
+    def __call__(self, name):
+        if self.match_all or name in self.names:
+            return True
+        return self.regex is not None and self.regex.search(name) is not None
+
+
+class _DevicePattern:
+    """
+    One device pattern, e.g. ``:^det:?.*:depth=5``.
+
+    ``components`` are ``(regex, include, full_name, depth)`` as parsed by the
+    queueserver; ``full`` is the index of the full name component, if any.
+    """
+
+    def __init__(self, components, device_type):
+        from bluesky_queueserver.manager.profile_ops import _get_device_type_condition
+
+        self.regexes = [re.compile(c[0]) for c in components]
+        self.include = [c[1] for c in components]
+        self.full = next((n for n, c in enumerate(components) if c[2]), None)
+        self.depth = components[self.full][3] if self.full is not None else None
+        self.condition = _get_device_type_condition(device_type)
+        self.num_components = len(components)
+
+
+class DeviceMatcher:
+    """
+    All the device patterns of a rule list, evaluated in one walk of the tree.
+
+    Full name patterns that only differ by their regex are merged into one.
+    """
+
+    def __init__(self, patterns, forbid=False):
+        from bluesky_queueserver.manager.profile_ops import _split_name_pattern
+
+        self.match_all = _matches_all(patterns, forbid)
+        self.names = set()
+        self.patterns = []
+        merged = {}
+        if self.match_all or _matches_none(patterns):
+            return
+        for pattern in patterns:
+            components, uses_re, device_type = _split_name_pattern(pattern)
+            if not uses_re:
+                self.names.add(tuple(c[0] for c in components))
+            elif len(components) == 1 and components[0][2]:
+                key = (device_type, components[0][3])
+                merged.setdefault(key, []).append(f"(?:{components[0][0]})")
+            else:
+                self.patterns.append(_DevicePattern(components, device_type))
+        for (device_type, depth), regexes in merged.items():
+            components = [("|".join(regexes), True, True, depth)]
+            self.patterns.append(_DevicePattern(components, device_type))
+        self.parents = {name[:n] for name in self.names for n in range(1, len(name))}
+
+    def initial_state(self):
+        return tuple(range(len(self.patterns)))
+
+    def can_match_below(self, state, path):
+        """Return False if no subdevice of ``path`` can match any more."""
+        return self.match_all or bool(state) or path in self.parents
+
+    def step(self, state, path, dparams):
+        """
+        Match the device at ``path`` against the live patterns of its parent.
+
+        Returns (matched, live patterns for the subdevices).
+        """
+        if not state and not self.names:
+            return False, ()
+        level = len(path) - 1
+        matched = path in self.names
+        live = []
+        for i in state:
+            pattern = self.patterns[i]
+            if pattern.full is not None and level >= pattern.full:
+                length = level - pattern.full + 1
+                if pattern.depth is not None and length > pattern.depth:
+                    continue
+                if not matched and pattern.condition(dparams):
+                    suffix = ".".join(path[pattern.full :])
+                    matched = pattern.regexes[pattern.full].search(suffix) is not None
+                if pattern.depth is None or length < pattern.depth:
+                    live.append(i)
+                continue
+            if pattern.regexes[level].search(path[-1]) is None:
+                continue
+            if not matched and pattern.include[level] and pattern.condition(dparams):
+                matched = True
+            if level + 1 < pattern.num_components:
+                live.append(i)
+        return matched, tuple(live)
+
+
+def filter_device_tree(devices, allowed, forbidden):
+    """
+    Return the device tree filtered by compiled allow and forbid matchers.
+
+    Same result as the queueserver ``_filter_device_tree``: devices neither
+    allowed nor with allowed subdevices are removed, excluded devices kept for
+    their subdevices are marked ``"excluded": True``.
+    """
+
+    def walk(items, prefix, allow_state, forbid_state):
+        result = {}
+        for name, dparams in items.items():
+            path = prefix + (name,)
+            if allowed.match_all:
+                allow, allow_next = True, ()
+            else:
+                allow, allow_next = allowed.step(allow_state, path, dparams)
+            forbid, forbid_next = forbidden.step(forbid_state, path, dparams)
+            excluded = dparams.get("excluded", False) or forbid or not allow
+
+            components = None
+            # Subdevices that cannot be allowed any more are all dropped.
+            if "components" in dparams and allowed.can_match_below(allow_next, path):
+                components = walk(dparams["components"], path, allow_next, forbid_next)
+            if excluded and not components:
+                continue
+            entry = {k: v for k, v in dparams.items() if k != "components"}
+            if components:
+                entry["components"] = components
+            if excluded:
+                entry["excluded"] = True
+            result[name] = entry
+        return result
+
+    return walk(devices, (), allowed.initial_state(), forbidden.initial_state())
+
+
+def allowed_device_names(devices, prefix=""):
+    """Return the dotted names of the devices of a filtered tree that are not excluded."""
+    names = set()
+    for name, dparams in devices.items():
+        full_name = f"{prefix}{name}"
+        if not dparams.get("excluded", False):
+            names.add(full_name)
+        if "components" in dparams:
+            names |= allowed_device_names(dparams["components"], f"{full_name}.")
+    return names
+
+
+def select_plans(plans, allowed, forbidden):
+    return {
+        name: plan
+        for name, plan in plans.items()
+        if allowed(name) and not forbidden(name)
+    }
+
+
+def filter_plan(plan, plan_names, device_names):
+    """
+    Keep only the allowed plans and devices in the annotations of ``plan``.
+
+    Only the annotations listing plans or devices are copied, the rest of the
+    description is shared with ``plan``.
+    """
+    parameters = []
+    for parameter in plan.get("parameters", []):
+        annotation = parameter.get("annotation")
+        if annotation and ("plans" in annotation or "devices" in annotation):
+            annotation = dict(annotation)
+            for key, allowed in (("plans", plan_names), ("devices", device_names)):
+                if key in annotation:
+                    annotation[key] = {
+                        kind: [name for name in names if name in allowed]
+                        for kind, names in annotation[key].items()
+                    }
+            parameter = dict(parameter, annotation=annotation)
+        parameters.append(parameter)
+    if "parameters" not in plan:
+        return plan
+    return dict(plan, parameters=parameters)
+
+
+def compile_permissions(existing_plans, existing_devices, user_group_permissions):
+    """
+    Compute the allowed plans and devices of every group.
+
+    Returns the same ``(allowed_plans, allowed_devices)`` dictionaries as the
+    queueserver ``load_allowed_plans_and_devices``.
+    """
+    groups = user_group_permissions["user_groups"]
+    allowed_plans, allowed_devices = {}, {}
+    plans_root, devices_root = existing_plans, existing_devices
+    if "root" in groups:
+        plans_root, devices_root = _apply_group(
+            groups["root"], existing_plans, existing_devices
+        )
+    for group, permissions in groups.items():
+        if group == "root":
+            plans, devices = plans_root, devices_root
+        else:
+            plans, devices = _apply_group(permissions, plans_root, devices_root)
+        device_names = allowed_device_names(devices)
+        plan_names = set(plans)
+        allowed_plans[group] = {
+            name: filter_plan(plan, plan_names, device_names)
+            for name, plan in plans.items()
+        }
+        allowed_devices[group] = devices
+    return allowed_plans, allowed_devices
+
+
+def _apply_group(permissions, plans, devices):
+    selected_devices = {}
+    if devices:
+        selected_devices = filter_device_tree(
+            devices,
+            DeviceMatcher(permissions.get("allowed_devices", [])),
+            DeviceMatcher(permissions.get("forbidden_devices", []), forbid=True),
+        )
+    selected_plans = {}
+    if plans:
+        selected_plans = select_plans(
+            plans,
+            NameMatcher(permissions.get("allowed_plans", [])),
+            NameMatcher(permissions.get("forbidden_plans", []), forbid=True),
+        )
+    return selected_plans, selected_devices
+
+
+def _content_key(*items):
+    # Pickling is much faster than JSON; a different key order only costs a miss.
+    return hashlib.sha256(
+        pickle.dumps(items, protocol=pickle.HIGHEST_PROTOCOL)
+    ).digest()
+
+
+def index_path(permissions_file, existing_file, index_dir=INDEX_DIR):
+    digest = hashlib.sha256()
+    for path in (permissions_file, existing_file):
+        digest.update(Path(path).read_bytes())
+    return Path(index_dir, f"{digest.hexdigest()}.pickle")
+
+
+def load_index(
+    permissions_file=DEFAULT_PERMISSIONS_FILE,
+    existing_file=DEFAULT_EXISTING_FILE,
+    index_dir=INDEX_DIR,
+):
+    """
+    Return the allowed plans and devices of every group, from the cache if current.
+
+    The cache file is named after the hash of both files, so editing either
+    one makes the next call compile the index again.
+    """
+    from bluesky_queueserver.manager.profile_ops import (
+        load_existing_plans_and_devices,
+        load_user_group_permissions,
+    )
+
+    path = index_path(permissions_file, existing_file, index_dir)
+    if path.exists():
+        with open(path, "rb") as f:
+            return pickle.load(f)
+
+    existing_plans, existing_devices = load_existing_plans_and_devices(existing_file)
+    permissions = load_user_group_permissions(permissions_file)
+    index = compile_permissions(existing_plans, existing_devices, permissions)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    with open(tmp, "wb") as f:
+        pickle.dump(index, f)
+    os.replace(tmp, path)
+    return index
+
+
+def check_queueserver_version():
+    """
+    Raise RuntimeError if the installed queueserver was not checked with ``--check``.
+
+    `NameMatcher` and `DeviceMatcher` use private helpers of
+    ``bluesky_queueserver.manager.profile_ops`` to parse the patterns, which may
+    change in any release.
+    """
+    import bluesky_queueserver
+
+    version = bluesky_queueserver.__version__
+    if version not in QUEUESERVER_VERSIONS:
+        raise RuntimeError(
+            f"bluesky-queueserver {version} is not one of the checked versions "
+            f"{', '.join(QUEUESERVER_VERSIONS)}; run ./scripts/permission-index.py "
+            "--check and add it to QUEUESERVER_VERSIONS"
+        )
+
+
+def install():
+    """
+    Use the compiled permissions in the queueserver of this process.
+
+    Called with the paths of the files, as the RE Manager does, the index is
+    read from the cache of `load_index`. Results are also kept in memory for
+    the last `MEMORY_CACHE_SIZE` inputs, so an environment update that does not
+    change the plans, devices or permissions costs one hash of the inputs.
+    Every call returns a new copy, so the callers can modify it. Errors fall
+    back to the queueserver. Returns the installed function, or None for a
+    queueserver version not listed in `QUEUESERVER_VERSIONS`.
+    """
+    from bluesky_queueserver.manager import manager, profile_ops
+
+    logger = profile_ops.logger
+    original = profile_ops.load_allowed_plans_and_devices
+    try:
+        check_queueserver_version()
+    except RuntimeError as err:
+        logger.warning("Not using the compiled permissions: %s", err)
+        return None
+
+    # Pickled results: unpickling is a cheap deep copy.
+    results = {}
+
+    def cached(key, build):
+        if key not in results:
+            if len(results) >= MEMORY_CACHE_SIZE:
+                results.pop(next(iter(results)))
+            results[key] = pickle.dumps(build(), protocol=pickle.HIGHEST_PROTOCOL)
+        return pickle.loads(results[key])
+
+    def load_allowed_plans_and_devices(
+        *,
+        path_existing_plans_and_devices=None,
+        path_user_group_permissions=None,
+        existing_plans=None,
+        existing_devices=None,
+        user_group_permissions=None,
+    ):
+        kwargs = dict(
+            path_existing_plans_and_devices=path_existing_plans_and_devices,
+            path_user_group_permissions=path_user_group_permissions,
+            existing_plans=existing_plans,
+            existing_devices=existing_devices,
+            user_group_permissions=user_group_permissions,
+        )
+        try:
+            if (
+                path_existing_plans_and_devices is not None
+                and path_user_group_permissions is not None
+                and existing_plans is None
+                and existing_devices is None
+                and user_group_permissions is None
+            ):
+                paths = (path_user_group_permissions, path_existing_plans_and_devices)
+                return cached(index_path(*paths), lambda: load_index(*paths))
+
+            if user_group_permissions is None:
+                user_group_permissions = profile_ops.load_user_group_permissions(
+                    path_user_group_permissions
+                )
+            if existing_plans is None or existing_devices is None:
+                plans, devices = profile_ops.load_existing_plans_and_devices(
+                    path_existing_plans_and_devices
+                )
+                existing_plans = plans if existing_plans is None else existing_plans
+                existing_devices = (
+                    devices if existing_devices is None else existing_devices
+                )
+            if not user_group_permissions.get("user_groups"):
+                return original(**kwargs)
+            return cached(
+                _content_key(existing_plans, existing_devices, user_group_permissions),
+                lambda: compile_permissions(
+                    existing_plans, existing_devices, user_group_permissions
+                ),
+            )
+        except Exception as err:
+            logger.warning(
+                "Compiled permissions failed, using the queueserver: %r", err
+            )
+            return original(**kwargs)
+
+    # The RE Worker module imports the function from profile_ops when loaded.
+    for module in (
+        profile_ops,
+        manager,
+        sys.modules.get(profile_ops.__package__ + ".worker"),
+    ):
+        if module is not None:
+            module.load_allowed_plans_and_devices = load_allowed_plans_and_devices
+    return load_allowed_plans_and_devices
+
+
+def synthetic_panda_tree(num_pandas, blocks=24, instances=4, signals=12):
+    """PandA-like device descriptions: panda.block.instance.signal (depth 4)."""
+
+    def device(components=None, movable=False):
+        dparams = {
+            "classname": "SignalRW" if movable else "Device",
+            "is_flyable": False,
+            "is_movable": movable,
+            "is_readable": True,
+            "module": "ophyd_async.core",
+        }
+        if components:
+            dparams["components"] = components
+        return dparams
+
+    return {
+        f"panda{p}": device(
+            {
+                f"block{b}": device(
+                    {
+                        str(i): device(
+                            {f"signal{s}": device(movable=True) for s in range(signals)}
+                        )
+                        for i in range(1, instances + 1)
+                    }
+                )
+                for b in range(blocks)
+            }
+        )
+        for p in range(1, num_pandas + 1)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--permissions", type=Path, default=DEFAULT_PERMISSIONS_FILE)
+    parser.add_argument("--existing", type=Path, default=DEFAULT_EXISTING_FILE)
+    parser.add_argument("--check", action="store_true")
+    parser.add_argument("--benchmark", action="store_true")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "--synthetic-pandas",
+        type=int,
+        default=0,
+        help="add PandA-like device trees to the existing devices",
+    )
+    args = parser.parse_args()
+
+    from bluesky_queueserver.manager.profile_ops import (
+        load_allowed_plans_and_devices,
+        load_existing_plans_and_devices,
+        load_user_group_permissions,
+    )
+
+    if not (args.check or args.benchmark):
+        start = time.perf_counter()
+        load_index(args.permissions, args.existing)
+        path = index_path(args.permissions, args.existing)
+        print(f"Index {path} ready in {time.perf_counter() - start:.3f}s")
+        return 0
+
+    existing_plans, existing_devices = load_existing_plans_and_devices(args.existing)
+    existing_devices = dict(existing_devices)
+    existing_devices.update(synthetic_panda_tree(args.synthetic_pandas))
+    permissions = load_user_group_permissions(args.permissions)
+
+    status = 0
+    if args.check:
+        import bluesky_queueserver
+
+        print(f"bluesky-queueserver {bluesky_queueserver.__version__}")
+    compiled = compile_permissions(existing_plans, existing_devices, permissions)
+    if args.check:
+        reference = load_allowed_plans_and_devices(
+            existing_plans=existing_plans,
+            existing_devices=existing_devices,
+            user_group_permissions=permissions,
+        )
+        for kind, ours, theirs in zip(("plans", "devices"), compiled, reference):
+            for group in sorted(set(ours) | set(theirs)):
+                same = ours.get(group) == theirs.get(group)
+                print(f"{group:>12s} {kind:8s} {'OK' if same else 'DIFFERENT'}")
+                status |= not same
+
+    if args.benchmark:
+        timings = {}
+        for name, func in (
+            (
+                "queueserver",
+                lambda: load_allowed_plans_and_devices(
+                    existing_plans=existing_plans,
+                    existing_devices=existing_devices,
+                    user_group_permissions=permissions,
+                ),
+            ),
+            (
+                "compiled",
+                lambda: compile_permissions(
+                    existing_plans, existing_devices, permissions
+                ),
+            ),
+            (
+                "cached",
+                lambda: _content_key(existing_plans, existing_devices, permissions),
+            ),
+        ):
+            samples = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                func()
+                samples.append(time.perf_counter() - start)
+            timings[name] = min(samples)
+
+        def count(devices):
+            return sum(1 + count(d.get("components", {})) for d in devices.values())
+
+        print(
+            f"{len(existing_plans)} plans, {count(existing_devices)} devices and "
+            f"subdevices, {len(permissions['user_groups'])} groups"
+        )
+        for name, seconds in timings.items():
+            speedup = timings["queueserver"] / seconds if seconds else float("inf")
+            print(f"  {name:12s} {seconds * 1e3:9.2f} ms  x{speedup:.1f}")
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
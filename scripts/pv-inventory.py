@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+Generate a machine-readable PV inventory of an IOC.
+
+The PV names are taken from a ``dbl()`` listing (by default the PandA listing in
+``docs/all_pvs.md``, re-prefixed for the requested IOC) and all of them are read
+in one concurrent ``caget`` with ``FORMAT_CTRL``, recording the data type,
+element count, enum strings, units and precision of each PV.
+
+The inventory is written to ``$PV_INVENTORY_DIR`` (``~/.cache/pv_inventory`` by
+default), one JSON file per IOC prefix and IOC version. The IOC version is a
+hash of the top-level PVI table of the IOC, read over PVA; the profile reads it
+the same way to pick the matching inventory, reads the block PVI tables listed
+in it in bulk and reports drift (see ``07-pv-inventory.py``).
+
+Usage::
+
+    ./scripts/pv-inventory.py --prefix 'XF:31ID1-ES{PANDA:1}:'
+    ./scripts/pv-inventory.py --prefix 'XF:31ID1-ES{PANDA:1}:' --check
+"""
+
+import argparse
+import asyncio
+import datetime
+import hashlib
+import json
+import os
+import re
+import sys
+from pathlib import Path
+
+DEFAULT_PV_LIST = Path(__file__).resolve().parent.parent / "docs" / "all_pvs.md"
+DEFAULT_INVENTORY_DIR = Path(
+    os.getenv("PV_INVENTORY_DIR", Path.home() / ".cache" / "pv_inventory")
+)
+# Prefix of the IOC the dbl() listing in docs/all_pvs.md was captured from.
+LISTING_PREFIX = "XF:31ID1-ES{PANDA:3}:"
+
+DBR_TYPE_NAMES = {
+    0: "string",
+    1: "int16",
+    2: "float32",
+    3: "enum",
+    4: "uint8",
+    5: "int32",
+    6: "float64",
+}
+
+
+def _safe_file_name(text):
+    return re.sub(r"[^A-Za-z0-9_.-]+", "_", text).strip("_")
+
+
+def inventory_file(inventory_dir, prefix, version):
+    return (
+        Path(inventory_dir)
+        / f"{_safe_file_name(prefix)}-{_safe_file_name(version)}.json"
+    )
+
+
+def read_pv_list(path, listing_prefix, prefix):
+    """Read PV names from a ``dbl()`` listing and move them to ``prefix``."""
+    names = []
+    for line in Path(path).read_text().splitlines():
+        line = line.strip()
+        if not line.startswith(listing_prefix):
+            continue
+        names.append(prefix + line[len(listing_prefix) :])
+    return sorted(set(names))
+
+
+async def fetch_metadata(names, timeout):
+    """Return ``({name: metadata}, [unreachable names])`` for all PVs at once."""
+    from aioca import FORMAT_CTRL, caget
+
+    values = await caget(names, format=FORMAT_CTRL, timeout=timeout, throw=False)
+    pvs, missing = {}, []
+    for name, value in zip(names, values):
+        if not value.ok:
+            missing.append(name)
+            continue
+        entry = {
+            "dtype": DBR_TYPE_NAMES.get(value.datatype, str(value.datatype)),
+            "count": value.element_count,
+        }
+        for field in ("enums", "units", "precision"):
+            if hasattr(value, field):
+                entry[field] = getattr(value, field)
+        if "enums" in entry:
+            entry["enums"] = list(entry["enums"])
+        pvs[name] = entry
+    return pvs, missing
+
+
+def pvi_version(pvi_table):
+    """Return the IOC version of a top-level PVI table (as 07-pv-inventory.py)."""
+    text = json.dumps(pvi_table, sort_keys=True)
+    return hashlib.sha256(text.encode()).hexdigest()[:16]
+
+
+async def fetch_pvi_table(prefix, timeout):
+    """Return the top-level PVI table of the IOC at ``prefix``, read over PVA."""
+    from p4p.client.asyncio import Context
+
+    # Same context options as the PVA signals of ophyd-async, which the profile uses.
+    with Context("pva", nt=False) as ctxt:
+        value = await asyncio.wait_for(ctxt.get(prefix + "PVI"), timeout)
+    return value.todict()["pvi"]
+
+
+def block_pvi_tables(pvi_table):
+    """Return the PVI tables of the blocks listed in a top-level PVI table."""
+    return sorted(
+        pv
+        for entry in pvi_table.values()
+        for pv in entry.values()
+        if pv.endswith(":PVI")
+    )
+
+
+def compare_inventories(cached, live):
+    """Return a list of human-readable differences between two PV mappings."""
+    drift = []
+    for name in sorted(set(cached) - set(live)):
+        drift.append(f"removed: {name}")
+    for name in sorted(set(live) - set(cached)):
+        drift.append(f"added: {name}")
+    for name in sorted(set(cached) & set(live)):
+        for field in ("dtype", "count", "enums", "units"):
+            if cached[name].get(field) != live[name].get(field):
+                drift.append(
+                    f"changed: {name} {field} "
+                    f"{cached[name].get(field)!r} -> {live[name].get(field)!r}"
+                )
+    return drift
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--prefix", default="XF:31ID1-ES{PANDA:1}:")
+    parser.add_argument("--pv-list", type=Path, default=DEFAULT_PV_LIST)
+    parser.add_argument("--listing-prefix", default=LISTING_PREFIX)
+    parser.add_argument("--inventory-dir", type=Path, default=DEFAULT_INVENTORY_DIR)
+    parser.add_argument("--timeout", type=float, default=5.0)
+    parser.add_argument(
+        "--check",
+        action="store_true",
+        help="compare the IOC with the cached inventory instead of writing it",
+    )
+    args = parser.parse_args()
+
+    names = read_pv_list(args.pv_list, args.listing_prefix, args.prefix)
+    if not names:
+        print(f"No PVs with prefix {args.listing_prefix!r} in {args.pv_list}")
+        return 1
+
+    try:
+        pvi_table = asyncio.run(fetch_pvi_table(args.prefix, args.timeout))
+    except Exception as err:
+        print(f"Could not read the PVI table of {args.prefix!r}: {err!r}")
+        return 1
+    ioc_version = pvi_version(pvi_table)
+    print(f"IOC version: {ioc_version}")
+
+    pvs, missing = asyncio.run(fetch_metadata(names, args.timeout))
+    print(f"Read metadata of {len(pvs)} PVs, {len(missing)} did not connect")
+    for name in missing:
+        print(f"  not connected: {name}")
+
+    path = inventory_file(args.inventory_dir, args.prefix, ioc_version)
+    if args.check:
+        if not path.exists():
+            print(f"No cached inventory {path}")
+            return 1
+        drift = compare_inventories(json.loads(path.read_text())["pvs"], pvs)
+        for line in drift:
+            print(f"  {line}")
+        print(f"{len(drift)} difference(s) from {path}")
+        return 1 if drift else 0
+
+    inventory = {
+        "prefix": args.prefix,
+        "ioc_version": ioc_version,
+        "pvi_tables": block_pvi_tables(pvi_table),
+        "generated": datetime.datetime.now().isoformat(),
+        "pvs": pvs,
+    }
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(inventory, indent=1, sort_keys=True))
+    print(f"Wrote {path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,419 @@
+#!/usr/bin/env python3
+"""
+Replay recorded document streams into tiled to benchmark the ingest.
+
+Runs exported with ``JSONWriter`` (``startup/00-startup.py``, a JSON array of
+``{"name": ..., "doc": ...}``, or the same as JSON lines) are replayed through
+``TiledWriter`` at their original pace, ``--rate`` times faster, or as fast as
+possible with ``--rate 0``. Every replay gets new uids, so an export can be
+replayed ``--repeat`` times into the same catalog.
+
+The files referenced by ``stream_resource`` documents are replaced by
+synthetic HDF5 files in ``--asset-dir`` with empty datasets of the recorded
+shape and dtype, so no real data is needed.
+
+Reported: documents/s, runs/s and frames/s ingested, TiledWriter latency
+percentiles per document type, the lag behind the original schedule (how long
+the acquisition would have been held up) and the catalog growth. With
+``--output`` the results are appended as a JSON line, to compare runs.
+
+Writer batching is emulated with ``--datum-batch N``, which merges N
+consecutive ``stream_datum`` documents of a resource like a writer flushing N
+times less often; ``--writer-option key=value`` is passed on to TiledWriter
+for the options of the installed version. ``--serve CATALOG_URI`` starts a
+throwaway local server on that catalog (like ``tiled-serve.sh``), to compare
+backends.
+
+Usage::
+
+    ./scripts/replay-tiled-ingest.py run1.json run2.json --rate 10 --repeat 20
+    ./scripts/replay-tiled-ingest.py run1.json --rate 0 --datum-batch 10 \\
+        --serve sqlite+aiosqlite:////tmp/replay/catalog.db --output results.jsonl
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import defaultdict
+from pathlib import Path
+from urllib.parse import urlparse
+
+import h5py
+import numpy as np
+
+DEFAULT_TILED_URI = "http://localhost:8000"
+LATENCY_PERCENTILES = (50, 90, 99)
+
+# numpy dtypes of the data keys without ``dtype_numpy``, from their JSON dtype.
+JSON_DTYPES = {
+    "array": "<u2",
+    "number": "<f8",
+    "integer": "<i8",
+    "boolean": "|b1",
+}
+
+
+def load_export(path):
+    """Return the ``(name, doc)`` pairs of a JSONWriter export."""
+    text = Path(path).read_text()
+    try:
+        items = json.loads(text)
+    except json.JSONDecodeError:
+        items = [json.loads(line) for line in text.splitlines() if line.strip()]
+    docs = [(item["name"], item["doc"]) for item in items]
+    if any(name in ("resource", "datum") for name, _ in docs):
+        raise ValueError(
+            f"{path}: only stream_resource/stream_datum assets are supported"
+        )
+    return docs
+
+
+def synthesize_assets(docs, asset_dir):
+    """
+    Write a synthetic HDF5 file for each ``stream_resource`` of ``docs``.
+
+    The dataset holds as many frames as the ``stream_datum`` documents
+    reference, with the shape and dtype of the descriptor data key. The data
+    are never written, so the files stay small. Returns ``{resource uid: path}``.
+    """
+    data_keys = {}
+    frames = defaultdict(int)
+    resources = {}
+    for name, doc in docs:
+        if name == "descriptor":
+            data_keys.update(doc["data_keys"])
+        elif name == "stream_resource":
+            resources[doc["uid"]] = doc
+        elif name == "stream_datum":
+            resource = doc["stream_resource"]
+            frames[resource] = max(frames[resource], doc["indices"]["stop"])
+
+    paths = {}
+    for uid, doc in resources.items():
+        data_key = data_keys.get(doc["data_key"], {})
+        shape = tuple(data_key.get("shape") or ())
+        dtype = data_key.get("dtype_numpy") or JSON_DTYPES.get(
+            data_key.get("dtype"), "<f8"
+        )
+        parameters = doc.get("parameters", doc.get("resource_kwargs", {}))
+        path = Path(asset_dir, f"{uid}.h5")
+        with h5py.File(path, "w") as f:
+            f.create_dataset(
+                parameters.get("dataset", "/entry/data/data"),
+                shape=(frames[uid], *shape),
+                dtype=np.dtype(dtype),
+                chunks=(1, *shape) if frames[uid] else None,
+            )
+        paths[uid] = path
+    return paths
+
+
+class _UidMap(dict):
+    def __missing__(self, key):
+        self[key] = str(uuid.uuid4())
+        return self[key]
+
+
+def replayed_documents(docs, asset_paths, label=None):
+    """
+    Yield ``(name, doc)`` with fresh uids and assets pointing to the synthetic files.
+
+    Documents keep their ``time``; the start document records the original
+    uid under ``replay``.
+    """
+    uids = _UidMap()
+    for name, doc in docs:
+        doc = dict(doc)
+        if name == "start":
+            doc["replay"] = {"source": doc["uid"], "label": label}
+        elif name == "stream_resource":
+            doc["uri"] = f"file://localhost{asset_paths[doc['uid']]}"
+            doc.pop("root", None)
+            doc.pop("resource_path", None)
+
+        if name == "stream_datum":
+            resource, _, index = doc["uid"].rpartition("/")
+            doc["uid"] = f"{uids[resource]}/{index}"
+            doc["stream_resource"] = uids[doc["stream_resource"]]
+        elif name == "event_page":
+            doc["uid"] = [uids[uid] for uid in doc["uid"]]
+        else:
+            doc["uid"] = uids[doc["uid"]]
+        for key in ("run_start", "descriptor"):
+            # The RunEngine leaves the descriptor of some stream_datum empty.
+            if doc.get(key):
+                doc[key] = uids[doc[key]]
+        yield name, doc
+
+
+def batched_datums(docs, batch):
+    """Merge up to ``batch`` consecutive ``stream_datum`` documents per resource."""
+    pending = {}
+    counts = defaultdict(int)
+
+    def flush():
+        for merged in pending.values():
+            yield "stream_datum", merged
+        pending.clear()
+        counts.clear()
+
+    for name, doc in docs:
+        if name != "stream_datum" or batch <= 1:
+            yield from flush()
+            yield name, doc
+            continue
+        resource = doc["stream_resource"]
+        counts[resource] += 1
+        merged = pending.get(resource)
+        if merged is None:
+            pending[resource] = dict(doc)
+            merged = pending[resource]
+        merged["indices"] = {
+            "start": merged["indices"]["start"],
+            "stop": doc["indices"]["stop"],
+        }
+        merged["seq_nums"] = {
+            "start": merged["seq_nums"]["start"],
+            "stop": doc["seq_nums"]["stop"],
+        }
+        if counts[resource] >= batch:
+            del counts[resource]
+            yield "stream_datum", pending.pop(resource)
+    yield from flush()
+
+
+class IngestStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.runs = 0
+        self.frames = 0
+        self.max_lag = 0.0
+        self.errors = 0
+
+    def add(self, name, doc, latency, lag):
+        with self._lock:
+            self.latencies[name].append(latency)
+            self.max_lag = max(self.max_lag, lag)
+            if name == "stop":
+                self.runs += 1
+            elif name == "stream_datum":
+                self.frames += doc["indices"]["stop"] - doc["indices"]["start"]
+
+    def add_error(self):
+        with self._lock:
+            self.errors += 1
+
+    def summary(self, elapsed):
+        documents = sum(len(v) for v in self.latencies.values())
+        latency = {
+            name: {
+                f"p{p}": float(np.percentile(values, p)) for p in LATENCY_PERCENTILES
+            }
+            for name, values in sorted(self.latencies.items())
+        }
+        return {
+            "elapsed": elapsed,
+            "documents": documents,
+            "runs": self.runs,
+            "frames": self.frames,
+            "errors": self.errors,
+            "documents_per_second": documents / elapsed if elapsed else None,
+            "runs_per_second": self.runs / elapsed if elapsed else None,
+            "frames_per_second": self.frames / elapsed if elapsed else None,
+            "max_lag": self.max_lag,
+            "latency": latency,
+        }
+
+
+def replay_run(writer, docs, stats, rate):
+    """Feed one run to ``writer``, keeping the original pace divided by ``rate``."""
+    t0 = None
+    wall0 = time.monotonic()
+    doc_time = None
+    for name, doc in docs:
+        doc_time = doc.get("time", doc_time)
+        lag = 0.0
+        if rate and doc_time is not None:
+            t0 = doc_time if t0 is None else t0
+            target = wall0 + (doc_time - t0) / rate
+            lag = time.monotonic() - target
+            if lag < 0:
+                time.sleep(-lag)
+                lag = 0.0
+        start = time.perf_counter()
+        try:
+            writer(name, doc)
+        except Exception as err:
+            stats.add_error()
+            print(f"TiledWriter failed on {name!r}: {err!r}")
+        stats.add(name, doc, time.perf_counter() - start, lag)
+
+
+def catalog_size(client, catalog_path=None):
+    size = {"entries": len(client)}
+    if catalog_path and os.path.exists(catalog_path):
+        size["bytes"] = os.path.getsize(catalog_path)
+    return size
+
+
+def serve_catalog(catalog_uri, storage_dir, readable_dir, port, api_key):
+    """Start a throwaway ``tiled serve catalog``; returns (process, uri)."""
+    process = subprocess.Popen(
+        [
+            "tiled",
+            "serve",
+            "catalog",
+            catalog_uri,
+            "--init",
+            "-w",
+            str(storage_dir),
+            "-r",
+            str(readable_dir),
+            "--api-key",
+            api_key,
+            "--port",
+            str(port),
+        ],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    return process, f"http://localhost:{port}"
+
+
+def connect(uri, api_key, timeout=30.0):
+    from tiled.client import from_uri
+
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            return from_uri(uri, api_key=api_key)
+        except Exception:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.5)
+
+
+def parse_writer_options(options):
+    parsed = {}
+    for option in options or []:
+        key, _, value = option.partition("=")
+        try:
+            parsed[key] = json.loads(value)
+        except json.JSONDecodeError:
+            parsed[key] = value
+    return parsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("exports", nargs="+", type=Path)
+    parser.add_argument("--rate", type=float, default=1.0, help="0: no pacing")
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--parallel", type=int, default=1, help="concurrent writers")
+    parser.add_argument("--datum-batch", type=int, default=1)
+    parser.add_argument("--writer-option", action="append", metavar="KEY=VALUE")
+    parser.add_argument("--asset-dir", type=Path, default=None)
+    parser.add_argument("--tiled-uri", default=DEFAULT_TILED_URI)
+    parser.add_argument("--serve", metavar="CATALOG_URI", default=None)
+    parser.add_argument("--port", type=int, default=8010)
+    parser.add_argument("--catalog-file", default=None, help="sqlite file to size")
+    parser.add_argument("--label", default=None)
+    parser.add_argument("--output", type=Path, default=None)
+    args = parser.parse_args()
+
+    from bluesky.callbacks.tiled_writer import TiledWriter
+
+    api_key = os.getenv("TILED_API_KEY", "")
+    asset_dir = args.asset_dir or Path(tempfile.mkdtemp(prefix="replay-assets-"))
+    asset_dir.mkdir(parents=True, exist_ok=True)
+
+    exports = []
+    for path in args.exports:
+        docs = load_export(path)
+        exports.append((docs, synthesize_assets(docs, asset_dir)))
+
+    server = None
+    uri = args.tiled_uri
+    catalog_file = args.catalog_file
+    if args.serve:
+        storage_dir = Path(tempfile.mkdtemp(prefix="replay-storage-"))
+        server, uri = serve_catalog(
+            args.serve, storage_dir, asset_dir.resolve(), args.port, api_key
+        )
+        if catalog_file is None and args.serve.startswith("sqlite"):
+            catalog_file = urlparse(args.serve).path
+    try:
+        client = connect(uri, api_key)
+        writer_options = parse_writer_options(args.writer_option)
+        before = catalog_size(client, catalog_file)
+
+        jobs = [(docs, paths) for _ in range(args.repeat) for docs, paths in exports]
+        stats = IngestStats()
+
+        def worker(worker_jobs):
+            writer = TiledWriter(client, **writer_options)
+            for docs, paths in worker_jobs:
+                replayed = replayed_documents(docs, paths, label=args.label)
+                replay_run(
+                    writer, batched_datums(replayed, args.datum_batch), stats, args.rate
+                )
+
+        threads = [
+            threading.Thread(target=worker, args=(jobs[i :: args.parallel],))
+            for i in range(args.parallel)
+        ]
+        start = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        summary = stats.summary(time.monotonic() - start)
+
+        after = catalog_size(client, catalog_file)
+        summary["catalog"] = {"before": before, "after": after}
+        if "bytes" in after:
+            summary["catalog"]["bytes_per_run"] = (
+                after["bytes"] - before.get("bytes", 0)
+            ) / max(stats.runs, 1)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    summary["settings"] = {
+        "label": args.label,
+        "backend": args.serve or uri,
+        "rate": args.rate,
+        "repeat": args.repeat,
+        "parallel": args.parallel,
+        "datum_batch": args.datum_batch,
+        "writer_options": writer_options,
+    }
+
+    print(
+        f"{summary['runs']} runs, {summary['documents']} documents, "
+        f"{summary['frames']} frames in {summary['elapsed']:.2f}s: "
+        f"{summary['documents_per_second']:.1f} docs/s, "
+        f"{summary['runs_per_second']:.2f} runs/s, "
+        f"{summary['frames_per_second']:.0f} frames/s, "
+        f"max lag {summary['max_lag']:.3f}s, {summary['errors']} errors"
+    )
+    for name, percentiles in summary["latency"].items():
+        values = "  ".join(f"{p}={v * 1e3:8.2f}ms" for p, v in percentiles.items())
+        print(f"  {name:16s} {values}")
+    print(f"Catalog: {before} -> {after}")
+    if args.output:
+        with open(args.output, "a") as f:
+            f.write(json.dumps(summary) + "\n")
+    return 1 if summary["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
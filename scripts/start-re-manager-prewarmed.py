@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Start the queueserver RE Manager with a pre-warmed fork server.
+
+The RE Worker that opens an environment is started through a multiprocessing
+fork server which has already imported the heavy, hardware-independent modules
+used by the profile. Each environment open then forks a worker from that server
+and only has to run device creation and connection, instead of paying the full
+import time on every open/close cycle.
+
+Modules that start threads or open channel access contexts at import time
+(ophyd v1, pyepics) must not be pre-imported, because those threads do not
+survive the fork.
+
+All command line arguments are passed to ``start-re-manager``::
+
+    ./scripts/start-re-manager-prewarmed.py --startup-dir=./startup --keep-re
+
+Extra modules can be pre-imported with a comma-separated list in the
+``QSERVER_PREWARM_MODULES`` environment variable.
+
+The RE Manager computes the lists of allowed plans and devices with the
+precompiled permission index of ``scripts/permission-index.py``; set
+``QSERVER_PERMISSION_INDEX=0`` to use the queueserver's own filtering.
+"""
+
+import importlib.util
+import multiprocessing
+import multiprocessing.forkserver
+import os
+import sys
+
+PREWARM_MODULES = (
+    "numpy",
+    "h5py",
+    "matplotlib",
+    "matplotlib.pyplot",
+    "IPython",
+    "event_model",
+    "bluesky",
+    "bluesky.plans",
+    "bluesky.plan_stubs",
+    "bluesky.preprocessors",
+    "bluesky.callbacks.best_effort",
+    "bluesky.callbacks.tiled_writer",
+    "ophyd_async.core",
+    "ophyd_async.epics.motor",
+    "ophyd_async.epics.advimba",
+    "ophyd_async.fastcs.panda",
+    "tiled.client",
+    "redis",
+)
+
+
+def prewarm_modules():
+    extra = os.getenv("QSERVER_PREWARM_MODULES", "")
+    return list(PREWARM_MODULES) + [m.strip() for m in extra.split(",") if m.strip()]
+
+
+def available_modules(modules):
+    """Drop the modules that are not installed; the fork server fails on them."""
+    available = []
+    for module in modules:
+        try:
+            spec = importlib.util.find_spec(module)
+        except ImportError:
+            spec = None
+        if spec is None:
+            print(f"Not pre-importing {module!r}: module not found")
+            continue
+        available.append(module)
+    return available
+
+
+def install_permission_index():
+    path = os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "permission-index.py"
+    )
+    spec = importlib.util.spec_from_file_location("permission_index", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    if module.install() is not None:
+        print("Using the precompiled user group permission index")
+
+
+def main():
+    from bluesky_queueserver.manager.start_manager import start_manager
+
+    modules = available_modules(prewarm_modules())
+    print(f"Pre-importing {len(modules)} modules in the RE Worker fork server")
+
+    multiprocessing.set_start_method("forkserver", force=True)
+    multiprocessing.set_forkserver_preload(modules)
+    # Start the server now so the first environment open does not pay for it.
+    multiprocessing.forkserver.ensure_running()
+
+    sys.argv[0] = "start-re-manager"
+    return start_manager()
+
+
+if __name__ == "__mp_main__" and os.getenv("QSERVER_PERMISSION_INDEX", "1") != "0":
+    # multiprocessing imports this script as ``__mp_main__`` in the processes it
+    # starts (RE Manager, RE Worker), where the allowed lists are computed.
+    install_permission_index()
+
+if __name__ == "__main__":
+    sys.exit(main())
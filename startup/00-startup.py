@@ -3,33 +3,158 @@ print(f"Loading file {__file__!r} ...")
 
 import asyncio
 import datetime
+import importlib
+import inspect
 import logging
 import os
 import subprocess
+import sys
 import time as ttime
 import warnings
 
 import epicscorelibs.path.pyepics
 import nslsii
-import ophyd.signal
 import redis
-from bluesky.callbacks.broker import post_run, verify_files_saved
 from bluesky.callbacks.tiled_writer import TiledWriter
 from bluesky.run_engine import RunEngine, call_in_bluesky_event_loop
-from databroker.v0 import Broker
 from IPython import get_ipython
 from redis_json_dict import RedisJSONDict
 from tiled.client import from_uri
 
-ophyd.signal.EpicsSignal.set_defaults(connection_timeout=5)
+_LAZY_PROBED_ATTRS = frozenset(
+    (
+        "read",
+        "describe",
+        "read_configuration",
+        "describe_configuration",
+        "set",
+        "trigger",
+        "stage",
+        "unstage",
+        "prepare",
+        "kickoff",
+        "complete",
+        "collect",
+        "describe_collect",
+        "collect_asset_docs",
+        "get_index",
+        "locate",
+        "stop",
+        "pause",
+        "resume",
+        "subscribe",
+        "clear_sub",
+        "hints",
+        "parent",
+        "name",
+        "component_names",
+    )
+)
+
+
+class LazySymbol:
+    """
+    Placeholder for ``module.attr`` which is imported on first use.
+
+    On first access the real object replaces the placeholder in the namespace,
+    so later lookups are direct. The placeholder forwards attribute access and
+    calls, and can be used as a base class or in isinstance/issubclass checks.
+    """
+
+    def __init__(self, module, attr, ns, name, on_import=None):
+        self._module = module
+        self._attr = attr
+        self._ns = ns
+        self._name = name
+        self._on_import = on_import
+        self._obj = None
+
+    def _resolve(self):
+        if self._obj is None:
+            module = importlib.import_module(self._module)
+            self._obj = getattr(module, self._attr) if self._attr else module
+            if self._on_import is not None:
+                self._on_import(module)
+            if self._ns.get(self._name) is self:
+                self._ns[self._name] = self._obj
+        return self._obj
+
+    def __getattr__(self, item):
+        if item in ("_module", "_attr", "_ns", "_name", "_on_import", "_obj"):
+            raise AttributeError(item)
+        # Namespace scanners (queueserver, IPython completion, runtime protocol
+        # checks) probe dunders and device methods; these must not trigger imports.
+        if self._obj is None and (
+            (item.startswith("__") and item.endswith("__"))
+            or item in _LAZY_PROBED_ATTRS
+        ):
+            raise AttributeError(item)
+        return getattr(self._resolve(), item)
+
+    def __call__(self, *args, **kwargs):
+        return self._resolve()(*args, **kwargs)
+
+    def __mro_entries__(self, bases):
+        return (self._resolve(),)
+
+    def __instancecheck__(self, instance):
+        return isinstance(instance, self._resolve())
+
+    def __subclasscheck__(self, subclass):
+        return issubclass(subclass, self._resolve())
+
+    def __repr__(self):
+        state = "resolved" if self._obj is not None else "lazy"
+        return f"<{state} {self._module}.{self._attr or ''}>"
+
+
+def lazy_import(module, *names, on_import=None, ns=None):
+    """
+    Bind names from ``module`` in the profile namespace without importing it.
+
+    ``names`` are attribute names, optionally aliased as ``"attr as alias"``;
+    without names the module itself is bound under its last component.
+    ``on_import(module)`` is called when a placeholder is first resolved. By
+    default the names are bound in the caller's globals.
+    """
+    if ns is None:
+        ns = inspect.currentframe().f_back.f_globals
+    if not names:
+        alias = module.rsplit(".", 1)[-1]
+        ns[alias] = LazySymbol(module, None, ns, alias, on_import)
+        return
+    for name in names:
+        attr, _, alias = (part.strip() for part in name.partition(" as "))
+        alias = alias or attr
+        ns[alias] = LazySymbol(module, attr, ns, alias, on_import)
+
+
+def configure_ophyd_v1(module=None):
+    import ophyd.signal
+
+    ophyd.signal.EpicsSignal.set_defaults(connection_timeout=5)
+    # Verbose ophyd messages for debugging.
+    ophyd.logger.setLevel(logging.DEBUG)
+
+
+# The ophyd v1 stack is only configured if something actually uses it.
+if "ophyd" in sys.modules:
+    configure_ophyd_v1()
+
+lazy_import("bluesky.callbacks.broker", "post_run", "verify_files_saved")
+
 # See docstring for nslsii.configure_base() for more details
 # this command takes away much of the boilerplate for setting up a profile
 # (such as setting up best-effort callback, etc)
 
 
+# No databroker v0 Broker: documents are stored through the TiledWriter below.
+# configure_base documents ``broker_name=None`` as "no RE subscription is made"
+# since nslsii 0.11.0 (setup-dev-env.sh installs the main branch), so databroker
+# is not imported at startup.
 nslsii.configure_base(
     get_ipython().user_ns,
-    Broker.named("temp"),
+    broker_name=None,
     pbar=True,
     bec=True,
     magics=True,
@@ -40,12 +165,11 @@ nslsii.configure_base(
 RE.unsubscribe(0)
 
 RE = RunEngine()
-RE.subscribe(bec)
+bec_token = RE.subscribe(bec)
 
 tiled_client = from_uri("http://localhost:8000", api_key=os.getenv("TILED_API_KEY", ""))
 tw = TiledWriter(tiled_client)
-RE.subscribe(tw)
-# db = Broker()
+tw_token = RE.subscribe(tw)
 
 import json
 
@@ -83,7 +207,7 @@ def dump_doc_to_stdout(name, doc):
     print("============ Done ============")
 
 
-RE.subscribe(dump_doc_to_stdout)
+dump_doc_token = RE.subscribe(dump_doc_to_stdout)
 
 
 def now():
@@ -121,9 +245,6 @@ class FileLoadingTimer:
 # print a confirmation message.
 # RE.subscribe(post_run(verify_files_saved, db), 'stop')
 
-# Uncomment the following lines to turn on verbose messages for
-# debugging.
-ophyd.logger.setLevel(logging.DEBUG)
 # logging.basicConfig(level=logging.DEBUG)
 
 
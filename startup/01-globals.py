@@ -2,15 +2,19 @@ file_loading_timer.start_timer(__file__)
 
 
 import asyncio
+import fnmatch
 from dataclasses import dataclass
 from enum import Enum
+from typing import Any, Optional
 
+import numpy as np
 from ophyd_async.core import (
     DEFAULT_TIMEOUT,
     DetectorControl,
     DetectorTrigger,
     DetectorWriter,
     DeviceCollector,
+    SignalR,
     SignalRW,
     TriggerInfo,
     TriggerLogic,
@@ -23,6 +27,10 @@ class TomoFrameType(Enum):
     proj = "proj"
 
 
+# Fallback deadtime [s] used when a detector has no calibration entry.
+DEFAULT_DEADTIME = 0.1
+
+
 class StandardTriggerState(str, Enum):
     null = "null"
     preparing = "preparing"
@@ -36,6 +44,8 @@ class StandardTriggerSetup:
     num_frames: int
     exposure_time: float
     trigger_mode: DetectorTrigger
+    detector_name: Optional[str] = None
+    deadtime: Optional[float] = None
 
 
 def gen_software_trigger_setup(num_frames, exp_time):
@@ -47,21 +57,29 @@ def gen_software_trigger_setup(num_frames, exp_time):
 
 
 class StandardTriggerLogic(TriggerLogic[int]):
-    def __init__(self):
+    def __init__(self, calibration=None):
         self.state = StandardTriggerState.null
+        self.calibration = calibration
 
     def trigger_info(self, setup) -> TriggerInfo:
         exposure = 0.1
         trigger = DetectorTrigger.internal
         num_images = setup
+        deadtime = DEFAULT_DEADTIME
         if isinstance(setup, StandardTriggerSetup):
             trigger = setup.trigger_mode
             exposure = setup.exposure_time
             num_images = setup.num_frames
+            if setup.deadtime is not None:
+                deadtime = setup.deadtime
+            elif self.calibration is not None and setup.detector_name is not None:
+                deadtime = self.calibration.deadtime(
+                    setup.detector_name, trigger, exposure, default=DEFAULT_DEADTIME
+                )
         return TriggerInfo(
             number=num_images,
             trigger=trigger,
-            deadtime=0.1,
+            deadtime=deadtime,
             livetime=exposure,
         )
 
@@ -79,9 +97,166 @@ class StandardTriggerLogic(TriggerLogic[int]):
         self.state = StandardTriggerState.stopping
 
 
+# Maximum number of signals read at the same time by snapshot_device().
+DEFAULT_SNAPSHOT_CONCURRENCY = 200
+
+
+@dataclass
+class SnapshotEntry:
+    value: Any
+    timestamp: float
+    dtype: str
+    shape: list
+
+
+def readable_signals(device, exclude=()):
+    """Return ``{signal.name: signal}`` for all readable signals of a device tree."""
+    signals = {}
+    for _, child in device.children():
+        if isinstance(child, SignalR):
+            if not any(fnmatch.fnmatch(child.name, pattern) for pattern in exclude):
+                signals[child.name] = child
+        else:
+            signals.update(readable_signals(child, exclude))
+    return signals
+
+
+async def _read_signals(signals, max_concurrency):
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def read_one(signal):
+        async with semaphore:
+            return await asyncio.gather(signal.read(), signal.describe())
+
+    results = await asyncio.gather(
+        *(read_one(signal) for signal in signals.values()), return_exceptions=True
+    )
+    readings, descriptions, errors = {}, {}, {}
+    for name, result in zip(signals, results):
+        if isinstance(result, Exception):
+            errors[name] = result
+            continue
+        reading, description = result
+        readings.update(reading)
+        descriptions.update(description)
+    return readings, descriptions, errors
+
+
+async def snapshot_device(
+    *devices, exclude=(), max_concurrency=DEFAULT_SNAPSHOT_CONCURRENCY
+):
+    """
+    Read every signal of one or more ophyd-async devices concurrently.
+
+    All reads are issued at once (at most ``max_concurrency`` in flight), so a
+    snapshot of a full PandA takes about one round-trip time.
+
+    Parameters:
+    -----------
+    devices: Device
+    exclude: sequence of str
+        Glob patterns of signal names to skip, e.g. ``"*seq*table"``.
+    max_concurrency: int
+
+    Returns:
+    --------
+    dict mapping signal names to `SnapshotEntry`. Signals that could not be
+    read are reported and left out.
+    """
+    signals = {}
+    for device in devices:
+        signals.update(readable_signals(device, exclude))
+    readings, descriptions, errors = await _read_signals(signals, max_concurrency)
+    for name, error in errors.items():
+        print(f"Could not read {name}: {error!r}")
+    return {
+        name: SnapshotEntry(
+            value=reading["value"],
+            timestamp=reading["timestamp"],
+            dtype=descriptions[name]["dtype"],
+            shape=list(descriptions[name]["shape"]),
+        )
+        for name, reading in readings.items()
+    }
+
+
+def diff_snapshots(old, new):
+    """
+    Return ``{name: (old_value, new_value)}`` for every signal that changed.
+
+    Signals present in only one of the snapshots are reported with ``None``
+    as the missing value.
+    """
+    diff = {}
+    for name in sorted(set(old) | set(new)):
+        old_value = old[name].value if name in old else None
+        new_value = new[name].value if name in new else None
+        if name in old and name in new:
+            try:
+                equal = bool(np.array_equal(old_value, new_value))
+            except Exception:
+                equal = old_value == new_value
+            if equal:
+                continue
+        diff[name] = (old_value, new_value)
+    return diff
+
+
+class DeviceSnapshot:
+    """
+    Readable reporting every signal of a device tree, for baseline streams.
+
+    ``read()`` and ``describe()`` use the same concurrent reads as
+    `snapshot_device`, unlike the device's own ``read()`` which only covers
+    its configured read signals.
+    """
+
+    def __init__(
+        self, device, exclude=(), max_concurrency=DEFAULT_SNAPSHOT_CONCURRENCY
+    ):
+        self.device = device
+        self.exclude = exclude
+        self.max_concurrency = max_concurrency
+        self.name = f"{device.name}_snapshot"
+        self.parent = None
+
+    async def read(self):
+        signals = readable_signals(self.device, self.exclude)
+        readings, _, errors = await _read_signals(signals, self.max_concurrency)
+        if errors:
+            # An event with missing keys would not match the descriptor.
+            name, error = next(iter(errors.items()))
+            raise RuntimeError(f"{self.name}: could not read {name}") from error
+        return readings
+
+    async def describe(self):
+        signals = readable_signals(self.device, self.exclude)
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def describe_one(signal):
+            async with semaphore:
+                return await signal.describe()
+
+        descriptions = {}
+        for result in await asyncio.gather(
+            *(describe_one(signal) for signal in signals.values()),
+            return_exceptions=True,
+        ):
+            if not isinstance(result, Exception):
+                descriptions.update(result)
+        return descriptions
+
+
+def _snapshot_baseline_wrapper(plan, devices, exclude=()):
+    """Record a snapshot of ``devices`` in the baseline stream at run open and close."""
+    snapshots = [DeviceSnapshot(device, exclude=exclude) for device in devices]
+    return (yield from bpp.baseline_wrapper(plan, snapshots))
+
+
 async def print_children(device):
-    for name, obj in dict(device.children()).items():
-        print(f"{name}: {await obj.read()}")
+    snapshot = await snapshot_device(device)
+    for name, entry in snapshot.items():
+        print(f"{name}: {entry.value!r}")
 
 
 file_loading_timer.stop_timer(__file__)
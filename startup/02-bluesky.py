@@ -1,31 +1,55 @@
 file_loading_timer.start_timer(__file__)
 
 
-import ophyd
 from bluesky.plans import count
-from nslsii.ad33 import SingleTriggerV33, StatsPluginV33
-from ophyd import Component as Cpt
-from ophyd import EpicsSignal, EpicsSignalRO, Kind, Signal
-from ophyd.areadetector import AreaDetector, CamBase
-from ophyd.areadetector import EpicsSignalWithRBV as SignalWithRBV
-from ophyd.areadetector import (
-    ImagePlugin,
-    OverlayPlugin,
-    ProcessPlugin,
-    ROIPlugin,
-    StatsPlugin,
-    TIFFPlugin,
-    TransformPlugin,
+
+# The ophyd v1 stack is not used by the ophyd-async devices; these names are
+# kept for interactive use and only imported on first access.
+lazy_import("nslsii.ad33", "SingleTriggerV33", "StatsPluginV33")
+lazy_import(
+    "ophyd",
+    "Component as Cpt",
+    "Device",
+    "EpicsMotor",
+    "EpicsPathSignal",
+    "EpicsSignal",
+    "EpicsSignalRO",
+    "EpicsSignalWithRBV",
+    "Kind",
+    "Signal",
+    on_import=configure_ophyd_v1,
+)
+lazy_import(
+    "ophyd.areadetector",
+    "AreaDetector",
+    "CamBase",
+    "EpicsSignalWithRBV as SignalWithRBV",
+    "ImagePlugin",
+    "OverlayPlugin",
+    "ProcessPlugin",
+    "ROIPlugin",
+    "StatsPlugin",
+    "TIFFPlugin",
+    "TransformPlugin",
+    on_import=configure_ophyd_v1,
+)
+lazy_import(
+    "ophyd.areadetector.filestore_mixins",
+    "FileStoreBase",
+    "FileStoreHDF5IterativeWrite",
+    "FileStoreIterativeWrite",
+    "FileStoreTIFF",
+    "FileStoreTIFFIterativeWrite",
+    "FileStoreTIFFSquashing",
+    on_import=configure_ophyd_v1,
 )
-from ophyd.areadetector.filestore_mixins import (
-    FileStoreBase,
-    FileStoreHDF5IterativeWrite,
-    FileStoreIterativeWrite,
-    FileStoreTIFF,
-    FileStoreTIFFIterativeWrite,
-    FileStoreTIFFSquashing,
+lazy_import(
+    "ophyd.device",
+    "BlueskyInterface",
+    "DeviceStatus",
+    on_import=configure_ophyd_v1,
 )
-from ophyd.device import BlueskyInterface, Device, DeviceStatus
-from ophyd.status import SubscriptionStatus
+lazy_import("ophyd.status", "SubscriptionStatus", on_import=configure_ophyd_v1)
+lazy_import("epics", "caget", "caput")
 
 file_loading_timer.stop_timer(__file__)
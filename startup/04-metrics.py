@@ -0,0 +1,231 @@
+file_loading_timer.start_timer(__file__)
+
+import os
+import threading
+import time as ttime
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+
+class ProfileMetrics:
+    """
+    Cheap in-process counters exported in the Prometheus text format.
+
+    Documents are counted per type, every RunEngine subscription made after
+    `instrument_run_engine` is timed, and gauges can be fed by signal monitors
+    (frames captured, plugin queue use) and by the event-loop lag probe.
+    Nothing is instrumented or exported unless ``PROFILE_METRICS_PORT`` or
+    ``PROFILE_METRICS_TEXTFILE`` is set (`PROFILE_METRICS_ENABLED`).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.documents = defaultdict(int)
+        self.callback_calls = defaultdict(int)
+        self.callback_seconds = defaultdict(float)
+        self.callback_max_seconds = defaultdict(float)
+        self.gauges = {}
+        self.run_engine = None
+
+    def count_document(self, name, doc):
+        with self._lock:
+            self.documents[name] += 1
+
+    def timed(self, callback, name=None):
+        """Wrap a document callback so that its latency is recorded."""
+        name = name or getattr(callback, "__name__", type(callback).__name__)
+
+        def timed_callback(doc_name, doc):
+            t0 = ttime.perf_counter()
+            try:
+                return callback(doc_name, doc)
+            finally:
+                elapsed = ttime.perf_counter() - t0
+                with self._lock:
+                    self.callback_calls[name] += 1
+                    self.callback_seconds[name] += elapsed
+                    if elapsed > self.callback_max_seconds[name]:
+                        self.callback_max_seconds[name] = elapsed
+
+        timed_callback.__wrapped__ = callback
+        return timed_callback
+
+    def set_gauge(self, metric, value, **labels):
+        with self._lock:
+            self.gauges[(metric, tuple(sorted(labels.items())))] = value
+
+    def render(self):
+        """Return all metrics in the Prometheus text exposition format."""
+        lines = []
+
+        def add(metric, kind, help_text, samples):
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} {kind}")
+            for labels, value in samples:
+                label_text = ",".join(f'{k}="{v}"' for k, v in labels)
+                if label_text:
+                    label_text = f"{{{label_text}}}"
+                lines.append(f"{metric}{label_text} {value}")
+
+        with self._lock:
+            if self.run_engine is not None:
+                add(
+                    "bluesky_run_engine_state",
+                    "gauge",
+                    "RunEngine state (1 for the current state).",
+                    [((("state", self.run_engine.state),), 1)],
+                )
+            add(
+                "bluesky_documents_total",
+                "counter",
+                "Documents emitted by the RunEngine, per type.",
+                [((("type", k),), v) for k, v in sorted(self.documents.items())],
+            )
+            for metric, kind, help_text, values in (
+                (
+                    "bluesky_callback_calls_total",
+                    "counter",
+                    "Calls of each subscribed callback.",
+                    self.callback_calls,
+                ),
+                (
+                    "bluesky_callback_seconds_total",
+                    "counter",
+                    "Time spent in each subscribed callback.",
+                    self.callback_seconds,
+                ),
+                (
+                    "bluesky_callback_max_seconds",
+                    "gauge",
+                    "Longest single call of each subscribed callback.",
+                    self.callback_max_seconds,
+                ),
+            ):
+                add(
+                    metric,
+                    kind,
+                    help_text,
+                    [((("callback", k),), v) for k, v in sorted(values.items())],
+                )
+            by_metric = defaultdict(list)
+            for (metric, labels), value in sorted(self.gauges.items()):
+                by_metric[metric].append((labels, value))
+            for metric, samples in by_metric.items():
+                add(metric, "gauge", metric.replace("_", " ") + ".", samples)
+        return "\n".join(lines) + "\n"
+
+
+profile_metrics = ProfileMetrics()
+
+
+def instrument_run_engine(run_engine, subscriptions=()):
+    """
+    Count documents and time all callbacks subscribed to ``run_engine``.
+
+    ``run_engine.subscribe`` is wrapped so later subscriptions are timed;
+    ``subscriptions`` are ``(token, callback)`` pairs made before and are
+    re-subscribed through the wrapper. Returns the new tokens.
+    """
+    profile_metrics.run_engine = run_engine
+    subscribe = run_engine.subscribe
+
+    def timed_subscribe(func, name="all"):
+        return subscribe(profile_metrics.timed(func), name)
+
+    run_engine.subscribe = timed_subscribe
+    subscribe(profile_metrics.count_document)
+    tokens = []
+    for token, callback in subscriptions:
+        run_engine.unsubscribe(token)
+        tokens.append(run_engine.subscribe(callback))
+    return tokens
+
+
+def monitor_metric(signal, metric, **labels):
+    """Feed a gauge from a signal monitor; call from the bluesky event loop."""
+    signal.subscribe_value(
+        lambda value: profile_metrics.set_gauge(metric, value, **labels)
+    )
+
+
+def _probe_loop_lag(loop, interval):
+    expected = loop.time() + interval
+
+    def probe():
+        nonlocal expected
+        profile_metrics.set_gauge(
+            "bluesky_event_loop_lag_seconds", max(loop.time() - expected, 0)
+        )
+        expected = loop.time() + interval
+        loop.call_later(interval, probe)
+
+    loop.call_soon_threadsafe(loop.call_later, interval, probe)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = profile_metrics.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def _write_textfile(path, period):
+    path = Path(path)
+    while True:
+        tmp = path.with_suffix(".tmp")
+        tmp.write_text(profile_metrics.render())
+        os.replace(tmp, path)
+        ttime.sleep(period)
+
+
+def start_metrics_exporter(port=None, textfile=None, period=5.0, lag_interval=0.5):
+    """
+    Export the profile metrics.
+
+    Parameters:
+    -----------
+    port: int, optional
+        Serve ``http://localhost:<port>/metrics`` for a Prometheus scraper.
+    textfile: str, optional
+        Rewrite this file every ``period`` seconds for the node-exporter
+        textfile collector (the name must end in ``.prom``).
+    lag_interval: float
+        Period [s] of the event-loop lag probe.
+    """
+    _probe_loop_lag(RE.loop, lag_interval)
+    if port is not None:
+        server = ThreadingHTTPServer(("127.0.0.1", port), _MetricsHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        print(f"Serving profile metrics on http://localhost:{port}/metrics")
+    if textfile is not None:
+        threading.Thread(
+            target=_write_textfile, args=(textfile, period), daemon=True
+        ).start()
+        print(f"Writing profile metrics to {textfile}")
+
+
+# Opt in with e.g. PROFILE_METRICS_PORT=9101 or
+# PROFILE_METRICS_TEXTFILE=/path/tst.prom. Without either, neither the RunEngine
+# nor the devices are instrumented.
+PROFILE_METRICS_ENABLED = bool(
+    os.getenv("PROFILE_METRICS_PORT") or os.getenv("PROFILE_METRICS_TEXTFILE")
+)
+
+if PROFILE_METRICS_ENABLED:
+    bec_token, tw_token, dump_doc_token = instrument_run_engine(
+        RE, [(bec_token, bec), (tw_token, tw), (dump_doc_token, dump_doc_to_stdout)]
+    )
+    start_metrics_exporter(
+        port=int(os.getenv("PROFILE_METRICS_PORT", 0)) or None,
+        textfile=os.getenv("PROFILE_METRICS_TEXTFILE"),
+    )
+
+
+file_loading_timer.stop_timer(__file__)
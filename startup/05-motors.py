@@ -1,7 +1,5 @@
 file_loading_timer.start_timer(__file__)
 
-from ophyd import Component as Cpt
-from ophyd import EpicsMotor, EpicsSignal
 from ophyd_async.epics.motor import Motor
 
 # class EpicsMotorWithSPMG(EpicsMotor):
@@ -0,0 +1,149 @@
+file_loading_timer.start_timer(__file__)
+
+import numpy as np
+from ophyd_async.core import DetectorTrigger, TriggerInfo
+
+
+class DeadtimeCalibration:
+    """
+    Persistent table of measured detector deadtimes.
+
+    The table is a mapping ``{detector_name: {trigger_mode: {exposure: entry}}}``
+    where each entry holds the measured ``deadtime`` and ``max_frame_rate``.
+    Any mutable mapping can be used as storage; in the profile it is backed by
+    redis so that all sessions and queueserver workers share the same values.
+    """
+
+    def __init__(self, storage):
+        self._storage = storage
+
+    def entries(self, detector_name, trigger_mode):
+        """Return the (exposure, entry) pairs for a detector/mode sorted by exposure."""
+        modes = self._storage.get(detector_name, {})
+        entries = modes.get(DetectorTrigger(trigger_mode).value, {})
+        return sorted((float(exp), entry) for exp, entry in entries.items())
+
+    def deadtime(self, detector_name, trigger_mode, exposure, default=None):
+        """
+        Return the calibrated deadtime for the given detector, mode and exposure.
+
+        The value is linearly interpolated between the calibrated exposures and
+        clamped to the nearest entry outside of that range. Detectors without an
+        entry for ``trigger_mode`` fall back to their internal trigger calibration,
+        and to ``default`` if they were never calibrated.
+        """
+        entries = self.entries(detector_name, trigger_mode)
+        if not entries and DetectorTrigger(trigger_mode) != DetectorTrigger.internal:
+            entries = self.entries(detector_name, DetectorTrigger.internal)
+        if not entries:
+            return default
+        exposures = [exp for exp, _ in entries]
+        deadtimes = [entry["deadtime"] for _, entry in entries]
+        return float(np.interp(exposure or 0, exposures, deadtimes))
+
+    def max_frame_rate(self, detector_name, trigger_mode, exposure, default=None):
+        """Return the maximum sustained frame rate [Hz] for the given settings."""
+        deadtime = self.deadtime(detector_name, trigger_mode, exposure)
+        if deadtime is None or (exposure or 0) + deadtime <= 0:
+            return default
+        return 1 / ((exposure or 0) + deadtime)
+
+    def record(self, detector_name, trigger_mode, exposure, deadtime, **extra):
+        """Store a measurement, replacing any previous one at the same exposure."""
+        modes = dict(self._storage.get(detector_name, {}))
+        mode_key = DetectorTrigger(trigger_mode).value
+        entries = dict(modes.get(mode_key, {}))
+        entries[f"{exposure:.6g}"] = {
+            "deadtime": float(deadtime),
+            "max_frame_rate": float(1 / (exposure + deadtime)),
+            "timestamp": ttime.time(),
+            **extra,
+        }
+        modes[mode_key] = entries
+        # Reassign the top-level key so that the storage backend persists it.
+        self._storage[detector_name] = modes
+
+    def clear(self, detector_name):
+        self._storage.pop(detector_name, None)
+
+
+deadtime_calibration = DeadtimeCalibration(
+    RedisJSONDict(redis.Redis("info.tst.nsls2.bnl.gov"), prefix="deadtime_calibration-")
+)
+
+
+def calibrate_deadtime(
+    detector,
+    exposures=(0.001, 0.005, 0.01, 0.05, 0.1),
+    num_frames=50,
+    # Values rather than enum members, so the queueserver can describe the default.
+    trigger_modes=("internal", "edge_trigger"),
+    safety_margin=1.1,
+):
+    """
+    Measure the minimum deadtime and maximum frame rate of an AD detector.
+
+    For each exposure the detector free-runs ``num_frames`` frames in internal
+    trigger mode with the smallest deadtime its controller accepts; the achieved
+    frame period is taken from the ``NDArrayTimeStamp`` attribute in the HDF5
+    file written for that exposure (the detector is staged per exposure). The result, scaled by ``safety_margin``, is stored in
+    ``deadtime_calibration`` for every mode in ``trigger_modes``. Externally
+    triggered modes cannot be paced faster than the readout, so they reuse the
+    internal trigger measurement and are marked with ``measured_with``.
+
+    Parameters:
+    -----------
+    detector: StandardDetector
+    exposures: sequence of float
+    num_frames: int
+    trigger_modes: sequence of str
+        `DetectorTrigger` values, e.g. ``"internal"``.
+    safety_margin: float
+    """
+    stream_name = f"{detector.name}_stream"
+    results = {}
+
+    yield from bps.open_run(
+        md={"purpose": "deadtime_calibration", "exposures": list(exposures)}
+    )
+    for exposure in exposures:
+        yield from bps.stage(detector, wait=True)
+        trigger_info = TriggerInfo(
+            number=num_frames,
+            trigger=DetectorTrigger.internal,
+            deadtime=detector._controller.get_deadtime(exposure),
+            livetime=exposure,
+        )
+        yield from bps.prepare(detector, trigger_info, wait=True)
+        yield from bps.declare_stream(detector, name=stream_name)
+        yield from bps.kickoff(detector, wait=True)
+        yield from bps.complete(detector, wait=True)
+        yield from bps.collect(detector, name=stream_name)
+        yield from bps.unstage(detector, wait=True)
+
+        file_name = yield from bps.rd(detector._writer.hdf.full_file_name)
+        with open_hdf5_swmr(file_name) as f:
+            # Only the frames of this exposure, should the file have been reused.
+            timestamps = np.ravel(f[AD_HDF5_TIMESTAMP_PATH][()])[-num_frames:]
+        period = float(np.median(np.diff(timestamps)))
+        results[exposure] = max(period - exposure, 0) * safety_margin
+        print(
+            f"{detector.name}: exposure={exposure}s period={period:.6f}s "
+            f"deadtime={results[exposure]:.6f}s"
+        )
+    yield from bps.close_run()
+
+    for trigger_mode in trigger_modes:
+        for exposure, deadtime in results.items():
+            deadtime_calibration.record(
+                detector.name,
+                trigger_mode,
+                exposure,
+                deadtime,
+                num_frames=num_frames,
+                measured_with=DetectorTrigger.internal.value,
+            )
+    return results
+
+
+file_loading_timer.stop_timer(__file__)
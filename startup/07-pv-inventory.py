@@ -0,0 +1,168 @@
+file_loading_timer.start_timer(__file__)
+
+import asyncio
+import hashlib
+import json
+import os
+import re
+from pathlib import Path
+
+from ophyd_async.core import DEFAULT_TIMEOUT, Signal
+
+# Written by scripts/pv-inventory.py, one file per IOC prefix and IOC version.
+PV_INVENTORY_DIR = Path(
+    os.getenv("PV_INVENTORY_DIR", Path.home() / ".cache" / "pv_inventory")
+)
+
+
+def _safe_file_name(text):
+    return re.sub(r"[^A-Za-z0-9_.-]+", "_", text).strip("_")
+
+
+def pv_inventory_file(prefix, ioc_version):
+    """Return the inventory file of the IOC at ``prefix`` for ``ioc_version``."""
+    return (
+        PV_INVENTORY_DIR
+        / f"{_safe_file_name(prefix)}-{_safe_file_name(ioc_version)}.json"
+    )
+
+
+def pva_context():
+    """
+    Return the p4p context shared by all ophyd-async PVA signals.
+
+    HDFPanda walks its PVI tables and connects its signals through it, so
+    channels opened on this context are the ones the device reuses.
+    """
+    from ophyd_async.epics.signal import PvaSignalBackend
+
+    # The context is created by the first backend that asks for it, then shared.
+    return PvaSignalBackend(None, "", "").ctxt
+
+
+def pvi_version(pvi_table):
+    """
+    Return the IOC version of a top-level PVI table, as scripts/pv-inventory.py does.
+
+    The table lists the blocks of the IOC and their own PVI tables, so its hash
+    changes when blocks are added, removed or renamed.
+    """
+    text = json.dumps(pvi_table, sort_keys=True)
+    return hashlib.sha256(text.encode()).hexdigest()[:16]
+
+
+async def read_ioc_version(prefix, timeout=5.0):
+    """Read the top-level PVI table of the IOC at ``prefix`` and return its version."""
+    value = await asyncio.wait_for(pva_context().get(prefix + "PVI"), timeout)
+    return pvi_version(value.todict()["pvi"])
+
+
+def load_pv_inventory(prefix, timeout=5.0):
+    """
+    Return the cached PV inventory of the IOC at ``prefix``, or None.
+
+    The IOC version is read from the IOC and only the inventory generated for
+    that version is used: an inventory of another version is rejected, as its
+    PV list may not match the IOC any more.
+    """
+    try:
+        ioc_version = call_in_bluesky_event_loop(
+            read_ioc_version(prefix, timeout=timeout)
+        )
+    except Exception as err:
+        print(f"Could not read the IOC version of {prefix!r}: {err!r}")
+        return None
+
+    path = pv_inventory_file(prefix, ioc_version)
+    if not path.exists():
+        others = sorted(
+            f.name for f in PV_INVENTORY_DIR.glob(f"{_safe_file_name(prefix)}-*.json")
+        )
+        print(
+            f"No PV inventory of {prefix!r} for IOC version {ioc_version!r}"
+            + (f", rejecting {', '.join(others)}" if others else "")
+            + "; run scripts/pv-inventory.py to generate it"
+        )
+        return None
+
+    inventory = json.loads(path.read_text())
+    if inventory.get("prefix") != prefix or inventory.get("ioc_version") != ioc_version:
+        print(
+            f"Rejecting {path}: made for {inventory.get('prefix')!r} version "
+            f"{inventory.get('ioc_version')!r}, the IOC is {prefix!r} {ioc_version!r}"
+        )
+        return None
+    print(
+        f"Loaded {len(inventory['pvs'])} PVs of {prefix!r} "
+        f"(IOC version {ioc_version}) from {path}"
+    )
+    return inventory
+
+
+async def preconnect_pvs(names, timeout=DEFAULT_TIMEOUT):
+    """
+    Read the PVs ``names`` concurrently on the shared context (see `pva_context`).
+
+    The channels stay open in the context, so the device reuses them.
+    Returns the PVs that could not be read.
+    """
+    ctxt = pva_context()
+    results = await asyncio.gather(
+        *(asyncio.wait_for(ctxt.get(name), timeout) for name in names),
+        return_exceptions=True,
+    )
+    return [
+        name for name, result in zip(names, results) if isinstance(result, Exception)
+    ]
+
+
+def preconnect_from_inventory(inventory, timeout=DEFAULT_TIMEOUT):
+    """
+    Read all block PVI tables listed in ``inventory`` at once.
+
+    HDFPanda reads these tables one after the other while it walks its PVI
+    structure; afterwards it finds their channels open. The signals themselves
+    are connected concurrently by the device. Returns the tables that could
+    not be read.
+    """
+    if inventory is None:
+        return []
+    return call_in_bluesky_event_loop(
+        preconnect_pvs(sorted(inventory.get("pvi_tables", [])), timeout=timeout)
+    )
+
+
+def _device_pvs(device):
+    """Yield the PV names of all signals of an ophyd-async device."""
+    for _, child in device.children():
+        if isinstance(child, Signal):
+            yield child.source.split("://", 1)[-1]
+        else:
+            yield from _device_pvs(child)
+
+
+def report_pv_drift(device, inventory, unreachable=()):
+    """
+    Compare a connected device with the cached PV inventory and print the drift.
+
+    PVs of the device missing from the inventory were added to the IOC; PVI
+    tables of the inventory that could not be read (``unreachable``) were
+    removed from it. Returns the list of differences; regenerate the inventory
+    with ``scripts/pv-inventory.py`` if any.
+    """
+    if inventory is None:
+        return []
+    drift = [f"removed: {name}" for name in sorted(unreachable)]
+    added = set(_device_pvs(device)) - set(inventory["pvs"])
+    drift += [f"added: {name}" for name in sorted(added)]
+    if drift:
+        print(
+            f"{device.name}: {len(drift)} PV(s) differ from the cached inventory "
+            f"(IOC version {inventory['ioc_version']}):"
+        )
+        for line in drift:
+            print(f"  {line}")
+    return drift
+
+
+file_loading_timer.stop_timer(__file__)
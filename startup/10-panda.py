@@ -13,9 +13,6 @@ import bluesky.plan_stubs as bps
 import bluesky.preprocessors as bpp
 from bluesky import RunEngine
 from bluesky.utils import ProgressBarManager
-from epics import caget, caput
-from ophyd import Component as Cpt
-from ophyd import Device, EpicsMotor, EpicsPathSignal, EpicsSignal, EpicsSignalWithRBV
 from ophyd_async.core import (
     DEFAULT_TIMEOUT,
     AsyncStatus,
@@ -40,22 +37,29 @@ from ophyd_async.fastcs.panda import HDFPanda
 #                                                                        #
 ##########################################################################
 
-panda_trigger_logic = StandardTriggerLogic()
+panda_trigger_logic = StandardTriggerLogic(calibration=deadtime_calibration)
 panda_flyer = StandardFlyer(panda_trigger_logic, [], name="panda_flyer")
 
 
 def instantiate_panda_async(panda_id):
     print(f"Connecting to PandA #{panda_id}")
+    prefix = f"XF:31ID1-ES{{PANDA:{panda_id}}}:"
+
+    # Read all block PVI tables in one batch before the PVI structure is walked.
+    inventory = load_pv_inventory(prefix)
+    unreachable = preconnect_from_inventory(inventory)
 
     with DeviceCollector():
         panda_path_provider = ProposalNumYMDPathProvider(default_filename_provider)
         panda_async = HDFPanda(
-            f"XF:31ID1-ES{{PANDA:{panda_id}}}:",
+            prefix,
             panda_path_provider,
             name=f"panda{panda_id}_async",
         )
         # print_children(panda_async)
 
+    report_pv_drift(panda_async, inventory, unreachable)
+
     return panda_async
 
 
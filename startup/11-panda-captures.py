@@ -0,0 +1,204 @@
+file_loading_timer.start_timer(__file__)
+
+import asyncio
+from dataclasses import dataclass
+from typing import Optional
+
+from ophyd_async.core import DeviceVector, SignalR
+
+# Capture modes of position fields whose result is not an integer.
+FLOAT_CAPTURE_MODES = ("Mean",)
+# PCAP fields which the PandA always writes as float64 seconds.
+FLOAT_PCAP_FIELDS = ("ts_start", "ts_end", "ts_trig", "gate_duration")
+
+
+@dataclass
+class PandACaptureField:
+    block: str
+    field: str
+    capture: str
+    scale: Optional[float] = None
+    offset: Optional[float] = None
+    units: str = ""
+    name: str = ""
+
+    @property
+    def dataset(self):
+        """Dataset name written by the PandA, e.g. ``COUNTER1.OUT.Value``."""
+        return f"{self.block.upper()}.{self.field.upper()}.{self.capture}"
+
+    @property
+    def hdf_names(self):
+        """
+        Names of the datasets of this field in the PandA HDF5 file.
+
+        The PandA IOC names them after the ``DATASET`` PV, with ``-min`` and
+        ``-max`` suffixes for the "Min Max" captures; fields without a dataset
+        name are written under `dataset`.
+        """
+        if not self.name:
+            return [self.dataset]
+        names = [self.name]
+        if "Min Max" in self.capture:
+            names += [f"{self.name}-min", f"{self.name}-max"]
+        return names
+
+    @property
+    def dtype_numpy(self):
+        """
+        Dtype of the datasets of this field in the PandA HDF5 file.
+
+        The PandA IOC captures raw data: position fields (the ones with a scale
+        and offset) and timestamps are written as float64, the other fields
+        (``PCAP.BITS*``, ``PCAP.SAMPLES``) as the uint32 the PandA sends.
+        """
+        if (
+            self.scale is not None
+            or self.offset is not None
+            or self.capture in FLOAT_CAPTURE_MODES
+            or (self.block.startswith("pcap") and self.field in FLOAT_PCAP_FIELDS)
+        ):
+            return "<f8"
+        return "<u4"
+
+    @property
+    def dtype(self):
+        return "number" if self.dtype_numpy == "<f8" else "integer"
+
+
+def _capture_signals(panda):
+    """Yield (block name, field name, {suffix: signal}) for all capturable fields."""
+    for name, block_type in panda.children():
+        blocks = {"": block_type}
+        if isinstance(block_type, DeviceVector):
+            blocks = dict(block_type.children())
+        for number, block in blocks.items():
+            signals = {n: s for n, s in block.children() if isinstance(s, SignalR)}
+            for signal_name, signal in signals.items():
+                if not signal_name.endswith("_capture"):
+                    continue
+                field = signal_name[: -len("_capture")]
+                related = {"capture": signal}
+                for suffix in ("scale", "offset", "units", "dataset"):
+                    if f"{field}_{suffix}" in signals:
+                        related[suffix] = signals[f"{field}_{suffix}"]
+                yield f"{name}{number}", field, related
+
+
+class PandACaptureDiscovery:
+    """
+    Find the captured fields of an ``HDFPanda`` and their dtypes.
+
+    All capture, scale, offset and units signals are read concurrently. The
+    result is cached and monitors on those signals invalidate the cache as soon
+    as the PandA layout changes, so repeated calls cost no channel access.
+    """
+
+    def __init__(self, panda):
+        self.panda = panda
+        self._fields = None
+        self._monitored = {}
+
+    def _on_update(self, signal):
+        def callback(value):
+            if self._monitored.get(signal.name, value) != value:
+                self._fields = None
+            self._monitored[signal.name] = value
+
+        return callback
+
+    def _monitor(self, signal, value):
+        if signal.name not in self._monitored:
+            self._monitored[signal.name] = value
+            signal.subscribe_value(self._on_update(signal))
+
+    async def captures(self):
+        """Return the list of enabled `PandACaptureField` entries."""
+        if self._fields is not None:
+            return self._fields
+
+        entries = list(_capture_signals(self.panda))
+        signals = [signal for _, _, related in entries for signal in related.values()]
+        values = await asyncio.gather(*(signal.get_value() for signal in signals))
+        value_by_signal = dict(zip((s.name for s in signals), values))
+
+        fields = []
+        for block, field, related in entries:
+            read = {k: value_by_signal[s.name] for k, s in related.items()}
+            for key, signal in related.items():
+                self._monitor(signal, read[key])
+            capture = getattr(read["capture"], "value", read["capture"])
+            if capture == "No":
+                continue
+            fields.append(
+                PandACaptureField(
+                    block=block,
+                    field=field,
+                    capture=capture,
+                    scale=float(read["scale"]) if "scale" in read else None,
+                    offset=float(read["offset"]) if "offset" in read else None,
+                    units=str(read.get("units", "")),
+                    name=str(read.get("dataset", "")),
+                )
+            )
+        self._fields = fields
+        return fields
+
+    async def describe(self):
+        """Return event-model data keys for the captured fields."""
+        return {
+            f"{self.panda.name}-{f.dataset.lower().replace('.', '_')}": {
+                "source": f"{self.panda.name}:{f.dataset}",
+                "shape": [],
+                "dtype": f.dtype,
+                "dtype_numpy": f.dtype_numpy,
+                "units": f.units,
+                "external": "STREAM:",
+            }
+            for f in await self.captures()
+        }
+
+    async def dataset_dtypes(self):
+        """Return the dtype of each dataset of the PandA HDF5 file by name."""
+        return {
+            name: f.dtype_numpy for f in await self.captures() for name in f.hdf_names
+        }
+
+    def invalidate(self):
+        self._fields = None
+
+
+def use_capture_dtypes(panda, discovery):
+    """
+    Declare the dtypes found by ``discovery`` in the documents of ``panda``.
+
+    The ophyd-async PandA writer describes every dataset as float64. Its
+    ``_describe``, called when the writer is opened, is wrapped on this
+    instance to set the dtype of each dataset from the captured fields, so the
+    descriptors and stream resources match what the PandA writes. Datasets of
+    unknown fields keep float64.
+    """
+    writer = panda._writer
+    describe = writer._describe
+
+    async def _describe():
+        data_keys = await describe()
+        dtypes = await discovery.dataset_dtypes()
+        for ds in writer._datasets:
+            dtype_numpy = dtypes.get(ds.dataset.lstrip("/"), "<f8")
+            ds.dtype_numpy = dtype_numpy
+            data_key = data_keys[ds.data_key]
+            data_key["dtype_numpy"] = dtype_numpy
+            if data_key["dtype"] == "number" and dtype_numpy != "<f8":
+                data_key["dtype"] = "integer"
+        return data_keys
+
+    writer._describe = _describe
+    return writer
+
+
+panda1_captures = PandACaptureDiscovery(panda1)
+use_capture_dtypes(panda1, panda1_captures)
+
+
+file_loading_timer.stop_timer(__file__)
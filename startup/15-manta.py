@@ -8,7 +8,6 @@ import asyncio
 from dataclasses import dataclass
 from enum import Enum
 
-from ophyd import EpicsSignalRO
 from ophyd_async.core import (
     DEFAULT_TIMEOUT,
     DetectorControl,
@@ -21,7 +20,7 @@ from ophyd_async.core import (
 )
 from ophyd_async.epics.advimba import VimbaDetector
 
-manta_trigger_logic = StandardTriggerLogic()
+manta_trigger_logic = StandardTriggerLogic(calibration=deadtime_calibration)
 manta_flyer = StandardFlyer(manta_trigger_logic, [], name="manta_flyer")
 
 
@@ -0,0 +1,168 @@
+file_loading_timer.start_timer(__file__)
+
+from dataclasses import dataclass
+from typing import Optional
+
+from ophyd_async.core import Device
+from ophyd_async.epics.signal import epics_signal_r, epics_signal_rw
+
+
+@dataclass
+class HDF5WriterProfile:
+    """
+    Compression, chunking and flushing settings of the HDF5 writers.
+
+    ``compression`` and ``blosc_*`` are the choices of the areaDetector
+    NDFileHDF5 plugin. Chunks hold ``frames_per_chunk`` frames of
+    ``rows_per_chunk`` rows (the full frame height if None).
+    """
+
+    compression: str = "None"
+    blosc_compressor: str = "LZ4"
+    blosc_level: int = 5
+    blosc_shuffle: str = "Byte"
+    zlib_level: int = 6
+    frames_per_chunk: int = 1
+    rows_per_chunk: Optional[int] = None
+    flush_frames: int = 0
+    panda_flush_period: float = 1.0
+
+
+WRITER_PROFILES = {
+    "fast-lossless": HDF5WriterProfile(
+        compression="Blosc",
+        blosc_compressor="LZ4",
+        blosc_level=5,
+        blosc_shuffle="Byte",
+        frames_per_chunk=1,
+        flush_frames=10,
+        panda_flush_period=1.0,
+    ),
+    "max-throughput": HDF5WriterProfile(
+        compression="None",
+        frames_per_chunk=8,
+        flush_frames=100,
+        panda_flush_period=5.0,
+    ),
+    "archival": HDF5WriterProfile(
+        compression="Blosc",
+        blosc_compressor="ZSTD",
+        blosc_level=9,
+        blosc_shuffle="Bit",
+        frames_per_chunk=4,
+        flush_frames=50,
+        panda_flush_period=5.0,
+    ),
+}
+
+
+class ADHDF5CompressionIO(Device):
+    """NDFileHDF5 plugin PVs not exposed by the ophyd-async HDF writer."""
+
+    def __init__(self, prefix: str, drv_prefix: str, name: str = "") -> None:
+        self.compression = epics_signal_rw(str, prefix + "Compression")
+        self.zlib_level = epics_signal_rw(int, prefix + "ZLevel")
+        self.blosc_compressor = epics_signal_rw(str, prefix + "BloscCompressor")
+        self.blosc_level = epics_signal_rw(int, prefix + "BloscCompressLevel")
+        self.blosc_shuffle = epics_signal_rw(str, prefix + "BloscShuffle")
+        self.num_row_chunks = epics_signal_rw(int, prefix + "NumRowChunks")
+        self.num_col_chunks = epics_signal_rw(int, prefix + "NumColChunks")
+        self.num_frames_chunks = epics_signal_rw(int, prefix + "NumFramesChunks")
+        self.num_frames_flush = epics_signal_rw(int, prefix + "NumFramesFlush")
+        self.array_size_x = epics_signal_r(int, prefix + "ArraySize0_RBV")
+        self.array_size_y = epics_signal_r(int, prefix + "ArraySize1_RBV")
+        self.max_size_x = epics_signal_r(int, drv_prefix + "MaxSizeX_RBV")
+        self.max_size_y = epics_signal_r(int, drv_prefix + "MaxSizeY_RBV")
+        self.queue_size = epics_signal_r(int, prefix + "QueueSize")
+        self.queue_free = epics_signal_r(int, prefix + "QueueFree")
+        super().__init__(name=name)
+
+
+def hdf_writer_prefix(detector):
+    """Return the PV prefix of the HDF5 plugin ``detector`` writes through."""
+    source = detector._writer.hdf.unique_id.source
+    return source.split("://", 1)[-1][: -len("UniqueId_RBV")]
+
+
+def driver_prefix(detector):
+    """Return the PV prefix of the camera driver of ``detector``."""
+    source = detector.drv.array_size_x.source
+    return source.split("://", 1)[-1][: -len("ArraySizeX_RBV")]
+
+
+def instantiate_hdf5_compression(detector, name):
+    with DeviceCollector():
+        hdf5_compression = ADHDF5CompressionIO(
+            hdf_writer_prefix(detector), driver_prefix(detector), name=name
+        )
+    return hdf5_compression
+
+
+manta1_hdf5_compression = instantiate_hdf5_compression(
+    manta1, name="manta1_hdf5_compression"
+)
+manta2_hdf5_compression = instantiate_hdf5_compression(
+    manta2, name="manta2_hdf5_compression"
+)
+hdf5_compression_devices = {
+    manta1.name: manta1_hdf5_compression,
+    manta2.name: manta2_hdf5_compression,
+}
+
+
+def set_writer_profile(profile, detectors=(), pandas=()):
+    """
+    Apply an HDF5 writer profile before a scan.
+
+    The AD HDF5 plugin of each detector gets the compression, chunk shape and
+    flush period of the profile. The plugin only knows the frame size once it
+    has seen a frame; before that the chunks span the sensor size. The PandA
+    writes through its own server, which only exposes the flush period, so for
+    PandAs only that is set.
+
+    Parameters:
+    -----------
+    profile: str or HDF5WriterProfile
+        One of WRITER_PROFILES or a custom profile.
+    detectors: sequence of StandardDetector
+    pandas: sequence of HDFPanda
+    """
+    if isinstance(profile, str):
+        profile = WRITER_PROFILES[profile]
+
+    for detector in detectors:
+        hdf = hdf5_compression_devices[detector.name]
+        height = yield from bps.rd(hdf.array_size_y)
+        width = yield from bps.rd(hdf.array_size_x)
+        if not height or not width:
+            height = yield from bps.rd(hdf.max_size_y)
+            width = yield from bps.rd(hdf.max_size_x)
+        rows = profile.rows_per_chunk or height
+        yield from bps.mv(
+            hdf.compression,
+            profile.compression,
+            hdf.blosc_compressor,
+            profile.blosc_compressor,
+            hdf.blosc_level,
+            profile.blosc_level,
+            hdf.blosc_shuffle,
+            profile.blosc_shuffle,
+            hdf.zlib_level,
+            profile.zlib_level,
+            hdf.num_row_chunks,
+            rows,
+            hdf.num_col_chunks,
+            width,
+            hdf.num_frames_chunks,
+            profile.frames_per_chunk,
+            hdf.num_frames_flush,
+            profile.flush_frames,
+        )
+
+    for panda in pandas:
+        yield from bps.mv(panda.data.flush_period, profile.panda_flush_period)
+
+    return profile
+
+
+file_loading_timer.stop_timer(__file__)
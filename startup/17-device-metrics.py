@@ -0,0 +1,31 @@
+file_loading_timer.start_timer(__file__)
+
+
+async def monitor_device_metrics(detectors, pandas):
+    """
+    Feed the frame and HDF5 queue gauges of the profile metrics.
+
+    Each AD detector reports the frames captured by its HDF5 writer and the
+    queue use of the plugin; each PandA the frames captured by its writer.
+    """
+    for detector in detectors:
+        hdf = hdf5_compression_devices[detector.name]
+        monitor_metric(
+            detector._writer.hdf.num_captured,
+            "ad_frames_captured",
+            detector=detector.name,
+        )
+        monitor_metric(hdf.queue_size, "ad_hdf5_queue_size", detector=detector.name)
+        monitor_metric(hdf.queue_free, "ad_hdf5_queue_free", detector=detector.name)
+    for panda in pandas:
+        monitor_metric(
+            panda.data.num_captured, "panda_frames_captured", panda=panda.name
+        )
+
+
+# The monitors only run when the metrics are exported (see 04-metrics.py).
+if PROFILE_METRICS_ENABLED:
+    call_in_bluesky_event_loop(monitor_device_metrics((manta1, manta2), (panda1,)))
+
+
+file_loading_timer.stop_timer(__file__)
@@ -0,0 +1,43 @@
+file_loading_timer.start_timer(__file__)
+
+from pathlib import Path
+from urllib.parse import urlparse
+
+import h5py
+
+# Default dataset locations inside the files written by the AD HDF5 plugin.
+AD_HDF5_DATA_PATH = "/entry/data/data"
+AD_HDF5_TIMESTAMP_PATH = "/entry/instrument/NDAttributes/NDArrayTimeStamp"
+
+
+def stream_resource_path(doc):
+    """
+    Return the local file path referenced by a ``stream_resource`` document.
+
+    Handles both the ``uri`` form used by recent event-model releases and the
+    older ``root``/``resource_path`` form.
+    """
+    if "uri" in doc:
+        return Path(urlparse(doc["uri"]).path)
+    return Path(doc.get("root", "/"), doc["resource_path"])
+
+
+def stream_resource_dataset(doc, default=AD_HDF5_DATA_PATH):
+    """Return the HDF5 dataset path referenced by a ``stream_resource`` document."""
+    parameters = doc.get("parameters", doc.get("resource_kwargs", {}))
+    return parameters.get("dataset", default)
+
+
+def open_hdf5_swmr(path):
+    """
+    Open an HDF5 file for reading while it may still be written to.
+
+    Falls back to a regular read-only open for files not written in SWMR mode.
+    """
+    try:
+        return h5py.File(path, "r", libver="latest", swmr=True)
+    except OSError:
+        return h5py.File(path, "r")
+
+
+file_loading_timer.stop_timer(__file__)
@@ -0,0 +1,38 @@
+file_loading_timer.start_timer(__file__)
+
+from concurrent.futures import ThreadPoolExecutor
+
+# One worker, so the post-run tasks are done in the order they were submitted
+# (e.g. the DXchange export starts after the master file has been written).
+post_run_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="post-run")
+
+
+def submit_post_run(description, func, *args, **kwargs):
+    """
+    Run ``func(*args, **kwargs)`` after the current run, off the RunEngine thread.
+
+    Document callbacks use it for file reads and tiled writes, so that they
+    do not delay the next plan. Errors are printed with ``description``.
+    """
+
+    def task():
+        try:
+            return func(*args, **kwargs)
+        except Exception as err:
+            print(f"{description} failed: {err!r}")
+
+    return post_run_executor.submit(task)
+
+
+def patch_run_metadata(client, uid, key, value):
+    """
+    Set the top-level ``key`` of the metadata of the run ``uid`` in tiled.
+
+    Only this key is sent, as a JSON patch, so concurrent updates of other
+    keys (by other callbacks or processes) are not overwritten.
+    """
+    pointer = "/" + str(key).replace("~", "~0").replace("/", "~1")
+    client[uid].patch_metadata([{"op": "add", "path": pointer, "value": value}])
+
+
+file_loading_timer.stop_timer(__file__)
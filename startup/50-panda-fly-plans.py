@@ -11,7 +11,6 @@ from pprint import pprint
 from typing import AsyncGenerator, AsyncIterator, Dict, List, Optional
 
 from event_model import compose_resource
-from ophyd.status import SubscriptionStatus
 
 
 def panda_fly(panda, num=724):
@@ -52,21 +52,72 @@ def manta_collect(
     yield from bps.close_run()
 
 
-def _manta_collect_dark_flat(manta_detector, num=10, exposure_time=0.1):
-
-    manta_exp_setup = gen_software_trigger_setup(num, exposure_time)
-
-    yield from bps.open_run()
+def _wait_for_group(group, timeout=0.5):
+    """Wait up to ``timeout`` for the status ``group``; return True if it is done."""
+    try:
+        yield from bps.wait(group=group, timeout=timeout)
+    except TimeoutError:
+        return False
+    return True
+
+
+def _collect_until_complete(device, group, stream_name, timeout=0.5):
+    """
+    Collect ``device`` into ``stream_name`` until the status ``group`` is done.
+
+    The frames written while waiting are collected every ``timeout`` seconds,
+    and once more after completion.
+    """
+    done = False
+    while not done:
+        done = yield from _wait_for_group(group, timeout=timeout)
+        yield from bps.collect(device, name=stream_name)
 
-    yield from bps.stage_all(manta_detector)
 
+def _collect_frame_type_stream(
+    detector, frame_type, num=10, exposure_time=0.1, stream_name=None
+):
+    """
+    Acquire ``num`` internally triggered frames into their own file and stream.
+
+    The detector is staged for this phase only, so that its writer opens a new
+    file named for ``frame_type`` and closes it once the frames are collected
+    in the ``stream_name`` stream (the frame type by default) of the open run.
+    """
+    stream_name = stream_name or frame_type.value
+    detector._writer._path_provider._filename_provider.set_frame_type(frame_type)
+    yield from bps.stage(detector, wait=True)
+
+    setup = StandardTriggerSetup(
+        num_frames=num,
+        exposure_time=exposure_time,
+        trigger_mode=DetectorTrigger.internal,
+        detector_name=detector.name,
+    )
+    yield from bps.mv(detector._writer.hdf.num_capture, num)
     yield from bps.prepare(
-        manta_detector, default_trigger_logic.trigger_info(manta_exp_setup), wait=True
+        detector, default_trigger_logic.trigger_info(setup), wait=True
     )
+    yield from bps.declare_stream(detector, name=stream_name)
+
+    group = f"complete_{stream_name}"
+    yield from bps.kickoff(detector, wait=True)
+    yield from bps.complete(detector, group=group)
+    yield from _collect_until_complete(detector, group, stream_name)
+    yield from bps.unstage(detector, wait=True)
+
 
-    yield from inner_manta_collect()
+def _manta_collect_dark_flat(
+    manta_detector, num=10, exposure_time=0.1, frame_type="dark"
+):
+    # ``frame_type`` is a TomoFrameType value, so the queueserver can describe it.
+    frame_type = TomoFrameType(frame_type)
+
+    yield from bps.open_run(md={"frame_type": frame_type.value})
 
-    yield from bps.unstage_all(manta_detector)
+    yield from _collect_frame_type_stream(
+        manta_detector, frame_type, num=num, exposure_time=exposure_time
+    )
 
     yield from bps.close_run()
 
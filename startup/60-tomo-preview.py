@@ -0,0 +1,304 @@
+file_loading_timer.start_timer(__file__)
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import matplotlib.pyplot as plt
+import numpy as np
+from bluesky.callbacks.mpl_plotting import QtAwareCallback
+
+
+def fbp_reconstruct(sinogram, angles_deg, center=None):
+    """
+    Filtered back-projection of one or more parallel-beam sinograms.
+
+    Parameters:
+    -----------
+    sinogram: np.ndarray
+        Array of shape (n_angles, n_det) or (n_angles, n_rows, n_det).
+    angles_deg: array-like
+        Projection angles in degrees, one per sinogram line.
+    center: float, optional
+        Rotation axis position in detector pixels, defaults to the middle.
+
+    Returns:
+    --------
+    np.ndarray of shape (n_det, n_det) or (n_rows, n_det, n_det).
+    """
+    sinogram = np.asarray(sinogram, dtype=np.float32)
+    single_row = sinogram.ndim == 2
+    if single_row:
+        sinogram = sinogram[:, np.newaxis, :]
+    n_angles, n_rows, n_det = sinogram.shape
+    if center is None:
+        center = (n_det - 1) / 2
+
+    # Ram-Lak filter applied along the detector axis, zero-padded to avoid wrap-around.
+    n_pad = max(64, 1 << int(np.ceil(np.log2(2 * n_det))))
+    ramp = 2 * np.abs(np.fft.rfftfreq(n_pad)).astype(np.float32)
+    filtered = np.fft.irfft(np.fft.rfft(sinogram, n=n_pad, axis=-1) * ramp, axis=-1)
+    filtered = filtered[..., :n_det]
+
+    coords = np.arange(n_det, dtype=np.float32) - (n_det - 1) / 2
+    x, y = np.meshgrid(coords, -coords)
+    x, y = x.ravel(), y.ravel()
+    det_idx = np.arange(n_det, dtype=np.float32)
+
+    recon = np.zeros((n_rows, n_det * n_det), dtype=np.float32)
+    for theta, projections in zip(np.deg2rad(angles_deg), filtered):
+        t = x * np.cos(theta) + y * np.sin(theta) + center
+        for row, projection in enumerate(projections):
+            recon[row] += np.interp(t, det_idx, projection, left=0, right=0)
+    recon *= np.pi / (2 * max(n_angles, 1))
+    recon = recon.reshape(n_rows, n_det, n_det)
+    return recon[0] if single_row else recon
+
+
+class TomoPreview(QtAwareCallback):
+    """
+    Live sinogram and quick reconstruction preview for rotation fly scans.
+
+    The callback tails the detector HDF5 file announced by the ``stream_resource``
+    documents, extracts a few (binned) rows from each new projection and
+    reconstructs them with `fbp_reconstruct` on a small worker pool.
+
+    The document handlers never block: frame reads and reconstructions are
+    submitted to the pool, and new work is decimated or dropped when the pool
+    falls behind the acquisition. After the stop document, the figure is
+    redrawn with a final reconstruction once the pool is idle.
+
+    The angles are taken from the ``tomo`` start metadata. Without it, the
+    frames are assumed to span 180 degrees and the sinogram grows as they
+    arrive.
+
+    Subscribe it explicitly when needed::
+
+        RE.subscribe(tomo_preview)
+    """
+
+    def __init__(
+        self,
+        data_key=None,
+        rows=(0.25, 0.5, 0.75),
+        bin_factor=4,
+        max_workers=2,
+        max_pending=4,
+        *,
+        use_teleporter=None,
+    ):
+        super().__init__(use_teleporter=use_teleporter)
+        self.data_key = data_key
+        self.rows = tuple(rows)
+        self.bin_factor = int(bin_factor)
+        self.max_pending = int(max_pending)
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="tomo-preview"
+        )
+        self._lock = threading.Lock()
+        self._fig = None
+        self._timer = None
+        self._pending = 0
+        self._recon_pending = False
+        self._reset()
+
+    def _reset(self):
+        self._run_uid = None
+        self._angle_range = (0, 180)
+        self._num_angles = None
+        self._num_frames = 0
+        self._final_recon = None
+        self._resources = {}
+        self._dirty = False
+        self.sinogram = None
+        self.filled = None
+        self.reconstruction = None
+        self.frames_seen = 0
+        self.frames_dropped = 0
+
+    def _submit(self, func, *args):
+        with self._lock:
+            self._pending += 1
+        future = self._executor.submit(func, *args)
+        future.add_done_callback(self._job_done)
+        return future
+
+    def _job_done(self, future):
+        with self._lock:
+            self._pending -= 1
+        if future.exception() is not None:
+            print(f"TomoPreview job failed: {future.exception()!r}")
+
+    def start(self, doc):
+        self._reset()
+        self._run_uid = doc["uid"]
+        tomo = doc.get("tomo", {})
+        start_deg = tomo.get("start_deg", 0)
+        self._angle_range = (start_deg, tomo.get("stop_deg", start_deg + 180))
+        self._num_angles = tomo.get("num_images")
+        super().start(doc)
+
+    def stream_resource(self, doc):
+        if self.data_key is not None and doc["data_key"] != self.data_key:
+            return
+        if stream_resource_dataset(doc) != AD_HDF5_DATA_PATH:
+            return
+        self._resources[doc["uid"]] = (
+            stream_resource_path(doc),
+            stream_resource_dataset(doc),
+        )
+
+    def stream_datum(self, doc):
+        resource = self._resources.get(doc["stream_resource"])
+        if resource is None:
+            return
+        start, stop = doc["indices"]["start"], doc["indices"]["stop"]
+        num_frames = stop - start
+        self.frames_seen += num_frames
+
+        with self._lock:
+            pending = self._pending
+        if pending >= self.max_pending:
+            self.frames_dropped += num_frames
+        else:
+            # Read every n-th frame only if the workers are lagging behind.
+            decimation = 1 + pending
+            self.frames_dropped += num_frames - len(range(start, stop, decimation))
+            self._submit(
+                self._read_frames, self._run_uid, *resource, start, stop, decimation
+            )
+
+        self._redraw()
+
+    def stop(self, doc):
+        self._redraw()
+        if self.frames_seen > self.frames_dropped:
+            # Reads and reconstructions may still be running: poll until the pool
+            # is idle, then reconstruct all frames once more and draw the result.
+            if self._timer is not None:
+                self._timer.stop()
+            self._timer = self._figure().canvas.new_timer(interval=250)
+            self._timer.add_callback(self._finish, self._timer, self._run_uid)
+            self._timer.start()
+        super().stop(doc)
+
+    def _finish(self, timer, run_uid):
+        with self._lock:
+            if run_uid != self._run_uid:
+                timer.stop()
+                return
+            if self._pending:
+                return
+            final_submitted = self._final_recon is not None
+            if not final_submitted:
+                self._recon_pending = True
+        if not final_submitted:
+            self._final_recon = self._submit(self._reconstruct, run_uid)
+            return
+        timer.stop()
+        self._redraw()
+
+    def _read_frames(self, run_uid, path, dataset, start, stop, decimation):
+        with open_hdf5_swmr(path) as f:
+            dset = f[dataset]
+            if hasattr(dset, "refresh"):
+                dset.refresh()
+            stop = min(stop, dset.shape[0])
+            if stop <= start:
+                return
+            height, width = dset.shape[-2:]
+            row_idx = sorted({min(int(r * height), height - 1) for r in self.rows})
+            frame_idx = np.arange(start, stop, decimation)
+            frames = dset[start:stop:decimation, row_idx, :].astype(np.float32)
+
+        width_binned = width // self.bin_factor
+        frames = frames[..., : width_binned * self.bin_factor]
+        frames = frames.reshape(*frames.shape[:-1], width_binned, self.bin_factor)
+        frames = frames.mean(axis=-1)
+
+        with self._lock:
+            if run_uid != self._run_uid:
+                return
+            if self._num_angles:
+                frame_idx = frame_idx[frame_idx < self._num_angles]
+                self._num_frames = self._num_angles
+            else:
+                self._num_frames = max(self._num_frames, stop)
+            self._grow(self._num_frames, len(row_idx), width_binned)
+            self.sinogram[frame_idx] = frames[: len(frame_idx)]
+            self.filled[frame_idx] = True
+            self._dirty = True
+            submit_recon = not self._recon_pending
+            if submit_recon:
+                self._recon_pending = True
+        if submit_recon:
+            self._submit(self._reconstruct, run_uid)
+
+    def _grow(self, num_frames, num_rows, width):
+        # Called with the lock held. Without ``tomo.num_images`` the number of
+        # frames is only known at the end, so the buffers double when full.
+        if self.sinogram is not None and num_frames <= len(self.sinogram):
+            return
+        capacity = num_frames
+        if self.sinogram is not None:
+            capacity = max(num_frames, 2 * len(self.sinogram))
+        sinogram = np.zeros((capacity, num_rows, width), dtype=np.float32)
+        filled = np.zeros(capacity, dtype=bool)
+        if self.sinogram is not None:
+            sinogram[: len(self.sinogram)] = self.sinogram
+            filled[: len(self.filled)] = self.filled
+        self.sinogram, self.filled = sinogram, filled
+
+    def _reconstruct(self, run_uid):
+        try:
+            with self._lock:
+                if run_uid != self._run_uid or self.sinogram is None:
+                    return
+                num_frames = self._num_frames
+                filled = self.filled[:num_frames].copy()
+                sinogram = self.sinogram[:num_frames][filled].copy()
+            angles = np.linspace(*self._angle_range, num_frames)[filled]
+            # Use -log transmission when the frames look like raw intensities.
+            if sinogram.size and sinogram.min() > 0:
+                sinogram = -np.log(sinogram / sinogram.max())
+            recon = fbp_reconstruct(sinogram, angles)
+            with self._lock:
+                if run_uid != self._run_uid:
+                    return
+                self.reconstruction = recon
+                self._dirty = True
+        finally:
+            with self._lock:
+                self._recon_pending = False
+
+    def _figure(self):
+        if self._fig is None or not plt.fignum_exists(self._fig.number):
+            self._fig, _ = plt.subplots(1, 2, figsize=(12, 5))
+        return self._fig
+
+    def _redraw(self):
+        with self._lock:
+            if not self._dirty or self.sinogram is None:
+                return
+            sinogram = self.sinogram[: self._num_frames, self.sinogram.shape[1] // 2]
+            sinogram = sinogram.copy()
+            recon = self.reconstruction
+            self._dirty = False
+
+        ax_sino, ax_recon = self._figure().axes
+        ax_sino.clear()
+        ax_sino.imshow(sinogram, aspect="auto", cmap="gray")
+        ax_sino.set_title(
+            f"Sinogram ({self.frames_seen} frames, {self.frames_dropped} dropped)"
+        )
+        ax_recon.clear()
+        if recon is not None:
+            ax_recon.imshow(recon[len(recon) // 2], cmap="gray")
+            ax_recon.set_title("FBP preview")
+        self._fig.canvas.draw_idle()
+
+
+tomo_preview = TomoPreview()
+# RE.subscribe(tomo_preview)
+
+
+file_loading_timer.stop_timer(__file__)
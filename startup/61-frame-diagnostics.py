@@ -0,0 +1,184 @@
+file_loading_timer.start_timer(__file__)
+
+import numpy as np
+from bluesky.callbacks.core import CallbackBase
+
+
+def _match_frames_to_triggers(trigger_ts, frame_ts, period, tolerance):
+    """
+    Assign every frame to its nearest trigger for the best clock offset.
+
+    The PandA timestamps are relative to the PCAP arm while the camera stamps
+    frames with the IOC wall clock, so the offset between the two is estimated
+    by trying to align the first frame with each of the first few triggers.
+    Frames lost before the first received frame cannot be told apart from a
+    clock offset, so those drops may be reported at the end of the scan instead.
+    """
+    best = None
+    for k in range(min(len(trigger_ts), 10)):
+        offset = frame_ts[0] - trigger_ts[k]
+        shifted = frame_ts - offset
+        idx = np.clip(np.searchsorted(trigger_ts, shifted), 1, len(trigger_ts) - 1)
+        left, right = trigger_ts[idx - 1], trigger_ts[idx]
+        idx = np.where(shifted - left < right - shifted, idx - 1, idx)
+        residuals = shifted - trigger_ts[idx]
+        # Refine the offset with the median residual of the good matches.
+        good = np.abs(residuals) < tolerance * period
+        if good.any():
+            offset += np.median(residuals[good])
+            residuals = frame_ts - offset - trigger_ts[idx]
+            good = np.abs(residuals) < tolerance * period
+        score = np.unique(idx[good]).size
+        if best is None or score > best[0]:
+            best = (score, offset, idx, residuals, good)
+    return best[1:]
+
+
+def frame_timing_diagnostics(
+    trigger_ts, frame_ts, exposure_time=None, tolerance=0.5, max_listed=20
+):
+    """
+    Compare PandA trigger timestamps with camera frame timestamps.
+
+    Parameters:
+    -----------
+    trigger_ts: array-like
+        PandA ``PCAP.TS_TRIG`` values in seconds.
+    frame_ts: array-like
+        Camera ``NDArrayTimeStamp`` values in seconds.
+    exposure_time: float, optional
+        Configured exposure, used to derive the deadtime between frames.
+    tolerance: float
+        Maximum distance between a frame and its trigger, as a fraction of the
+        trigger period, to count as a match.
+    max_listed: int
+        Maximum number of dropped/duplicated trigger indices listed in the summary.
+
+    Returns:
+    --------
+    dict with the frame-loss, jitter and deadtime statistics.
+    """
+    trigger_ts = np.asarray(trigger_ts, dtype=np.float64)
+    frame_ts = np.asarray(frame_ts, dtype=np.float64)
+    summary = {"num_triggers": int(trigger_ts.size), "num_frames": int(frame_ts.size)}
+    if trigger_ts.size < 2 or frame_ts.size < 1:
+        return summary
+
+    trigger_dt = np.diff(trigger_ts)
+    period = float(np.median(trigger_dt))
+    offset, idx, residuals, good = _match_frames_to_triggers(
+        trigger_ts, frame_ts, period, tolerance
+    )
+
+    frames_per_trigger = np.bincount(idx[good], minlength=trigger_ts.size)
+    dropped = np.flatnonzero(frames_per_trigger == 0)
+    duplicated = np.flatnonzero(frames_per_trigger > 1)
+    # The constant trigger-to-frame latency is part of ``clock_offset``, so
+    # only the spread of the residuals is meaningful.
+    jitter = residuals[good]
+
+    summary.update(
+        {
+            "dropped_frames": int(dropped.size),
+            "dropped_indices": dropped[:max_listed].tolist(),
+            "duplicated_frames": int((frames_per_trigger[duplicated] - 1).sum()),
+            "duplicated_indices": duplicated[:max_listed].tolist(),
+            "unmatched_frames": int((~good).sum()),
+            "clock_offset": float(offset),
+            "trigger_period_mean": float(trigger_dt.mean()),
+            "trigger_period_std": float(trigger_dt.std()),
+            "trigger_jitter_std": float(jitter.std()) if jitter.size else None,
+            "trigger_jitter_p2p": float(np.ptp(jitter)) if jitter.size else None,
+        }
+    )
+
+    if frame_ts.size > 1:
+        frame_dt = np.diff(frame_ts)
+        summary["frame_period_mean"] = float(frame_dt.mean())
+        summary["frame_period_std"] = float(frame_dt.std())
+        summary["frame_period_min"] = float(frame_dt.min())
+        if exposure_time:
+            deadtime = frame_dt - exposure_time
+            summary["deadtime_min"] = float(deadtime.min())
+            summary["deadtime_mean"] = float(deadtime.mean())
+    return summary
+
+
+class FrameTimingDiagnostics(CallbackBase):
+    """
+    Post-run check of dropped/duplicated frames and trigger jitter.
+
+    At the end of every run with both a PandA ``ts_trig`` dataset and an AD
+    detector dataset, the timestamps are read back from the HDF5 files and the
+    result of `frame_timing_diagnostics` is printed and stored under the
+    ``frame_diagnostics`` key of the run metadata in tiled. This is done by the
+    post-run worker (`submit_post_run`), after the stop document.
+    """
+
+    def __init__(self, client=None):
+        super().__init__()
+        self.client = client
+        self.last_summary = None
+        self._start = None
+        self._trigger_resources = []
+        self._frame_resources = {}
+
+    def start(self, doc):
+        self._start = doc
+        self._trigger_resources = []
+        self._frame_resources = {}
+
+    def stream_resource(self, doc):
+        names = f"{doc['data_key']} {stream_resource_dataset(doc, '')}".lower()
+        if "ts_trig" in names:
+            self._trigger_resources.append(doc)
+        elif stream_resource_dataset(doc) == AD_HDF5_DATA_PATH:
+            self._frame_resources.setdefault(doc["data_key"], []).append(doc)
+
+    def stop(self, doc):
+        if not self._trigger_resources or not self._frame_resources:
+            return
+        # The files are read after the run, off the RunEngine thread.
+        submit_post_run(
+            "Frame timing diagnostics",
+            self._diagnose,
+            doc["run_start"],
+            list(self._trigger_resources),
+            dict(self._frame_resources),
+            self._start.get("tomo", {}).get("exposure_time"),
+        )
+
+    def _diagnose(self, uid, trigger_resources, frame_resources, exposure_time):
+        trigger_ts = self._read_all(trigger_resources)
+        summary = {}
+        for data_key, resources in frame_resources.items():
+            frame_ts = self._read_all(resources, AD_HDF5_TIMESTAMP_PATH)
+            summary[data_key] = frame_timing_diagnostics(
+                trigger_ts, frame_ts, exposure_time=exposure_time
+            )
+
+        self.last_summary = summary
+        for data_key, stats in summary.items():
+            print(
+                f"{data_key}: {stats['num_frames']} frames for {stats['num_triggers']} "
+                f"triggers, dropped={stats.get('dropped_frames')} "
+                f"duplicated={stats.get('duplicated_frames')} "
+                f"jitter={stats.get('trigger_jitter_std')}"
+            )
+        if self.client is not None:
+            patch_run_metadata(self.client, uid, "frame_diagnostics", summary)
+
+    @staticmethod
+    def _read_all(resources, dataset=None):
+        arrays = []
+        for resource in resources:
+            with open_hdf5_swmr(stream_resource_path(resource)) as f:
+                arrays.append(f[dataset or stream_resource_dataset(resource)][()])
+        return np.concatenate([np.ravel(a) for a in arrays])
+
+
+frame_timing_diag = FrameTimingDiagnostics(tiled_client)
+RE.subscribe(frame_timing_diag)
+
+
+file_loading_timer.stop_timer(__file__)
@@ -0,0 +1,170 @@
+file_loading_timer.start_timer(__file__)
+
+import os
+from pathlib import Path
+
+import event_model
+import h5py
+import numpy as np
+from bluesky.callbacks.core import CallbackBase
+
+
+def write_master_file(path, streams, events=None, attrs=None):
+    """
+    Write an HDF5 file linking the data of a run through virtual datasets.
+
+    Parameters:
+    -----------
+    path: Path
+    streams: dict
+        ``{stream_name: {data_key: [(file, dataset, start, stop), ...]}}``,
+        the slices in the order of the event sequence numbers.
+    events: dict, optional
+        ``{stream_name: {data_key: list of values}}`` of data stored in the
+        events; these are small and copied into the master file.
+    attrs: dict, optional
+        Attributes of the ``/entry`` group.
+
+    Source files are referenced relative to the master file, so the directory
+    can be moved as a whole.
+    """
+    path = Path(path)
+    with h5py.File(path, "w", libver="latest") as f:
+        entry = f.create_group("entry")
+        for key, value in (attrs or {}).items():
+            entry.attrs[key] = value
+        for stream_name, data_keys in streams.items():
+            group = entry.require_group(stream_name)
+            for data_key, slices in data_keys.items():
+                sources = []
+                for file_name, dataset, start, stop in slices:
+                    with open_hdf5_swmr(file_name) as source:
+                        shape, dtype = source[dataset].shape, source[dataset].dtype
+                    sources.append((file_name, dataset, shape, dtype, start, stop))
+                total = sum(stop - start for *_, start, stop in sources)
+                _, _, shape, dtype, _, _ = sources[0]
+                layout = h5py.VirtualLayout(shape=(total, *shape[1:]), dtype=dtype)
+                position = 0
+                for file_name, dataset, shape, _, start, stop in sources:
+                    relative = os.path.relpath(file_name, path.parent)
+                    vsource = h5py.VirtualSource(relative, dataset, shape=shape)
+                    layout[position : position + stop - start] = vsource[start:stop]
+                    position += stop - start
+                group.create_virtual_dataset(data_key, layout, fillvalue=0)
+        for stream_name, data_keys in (events or {}).items():
+            group = entry.require_group(stream_name)
+            for data_key, values in data_keys.items():
+                try:
+                    group.create_dataset(data_key, data=np.asarray(values))
+                except TypeError:
+                    group.create_dataset(data_key, data=[str(v) for v in values])
+
+
+class RunConsolidator(CallbackBase):
+    """
+    Build one master HDF5 file per run from all the files it wrote.
+
+    Every ``stream_datum`` becomes a slice of a virtual dataset at
+    ``/entry/<stream>/<data_key>``, so detector frames, PandA fields and
+    dark/flat frames are reachable from a single file with the same indexing
+    as the events, without copying any data. Values stored in the events
+    themselves (e.g. motor readings) are copied. The file is written next to
+    the asset files by the post-run worker and its path stored as
+    ``master_file`` in the tiled run metadata.
+    """
+
+    def __init__(self, client=None):
+        super().__init__()
+        self.client = client
+        self.last_path = None
+        self._start = None
+        self._descriptors = {}
+        self._resources = {}
+        self._slices = {}
+        self._events = {}
+
+    def start(self, doc):
+        self._start = doc
+        self._descriptors = {}
+        self._resources = {}
+        self._slices = {}
+        self._events = {}
+
+    def descriptor(self, doc):
+        self._descriptors[doc["uid"]] = doc
+
+    def stream_resource(self, doc):
+        self._resources[doc["uid"]] = doc
+
+    def stream_datum(self, doc):
+        resource = self._resources[doc["stream_resource"]]
+        stream_name = self._descriptors[doc["descriptor"]]["name"]
+        self._slices.setdefault(stream_name, {}).setdefault(
+            resource["data_key"], []
+        ).append(
+            (
+                doc["seq_nums"]["start"],
+                str(stream_resource_path(resource)),
+                stream_resource_dataset(resource),
+                doc["indices"]["start"],
+                doc["indices"]["stop"],
+            )
+        )
+
+    def event(self, doc):
+        descriptor = self._descriptors[doc["descriptor"]]
+        data_keys = descriptor["data_keys"]
+        events = self._events.setdefault(descriptor["name"], {})
+        for key, value in doc["data"].items():
+            if not data_keys.get(key, {}).get("external"):
+                events.setdefault(key, []).append(value)
+
+    def event_page(self, doc):
+        for event in event_model.unpack_event_page(doc):
+            self.event(event)
+
+    def stop(self, doc):
+        if not self._slices:
+            return
+        streams = {
+            stream_name: {
+                data_key: [entry[1:] for entry in sorted(slices)]
+                for data_key, slices in data_keys.items()
+            }
+            for stream_name, data_keys in self._slices.items()
+        }
+        first_file = next(
+            Path(entry[0])
+            for data_keys in streams.values()
+            for slices in data_keys.values()
+            for entry in slices
+        )
+        uid = self._start["uid"]
+        path = (
+            first_file.parent
+            / f"scan_{self._start.get('scan_id', 0):05d}_{uid[:8]}_master.h5"
+        )
+        # The source files are opened after the run, off the RunEngine thread.
+        submit_post_run(
+            f"Consolidation of run {uid}",
+            self._consolidate,
+            path,
+            streams,
+            self._events,
+            {"run_uid": uid, "scan_id": self._start.get("scan_id", 0)},
+        )
+
+    def _consolidate(self, path, streams, events, attrs):
+        uid = attrs["run_uid"]
+        write_master_file(path, streams, events=events, attrs=attrs)
+        self.last_path = path
+        print(f"Consolidated run {uid[:8]} into {path}")
+        if self.client is not None:
+            patch_run_metadata(self.client, uid, "master_file", str(path))
+
+
+run_consolidator = RunConsolidator(tiled_client)
+RE.subscribe(run_consolidator)
+
+
+file_loading_timer.stop_timer(__file__)
@@ -0,0 +1,43 @@
+file_loading_timer.start_timer(__file__)
+
+import subprocess
+import sys
+from pathlib import Path
+
+DXCHANGE_EXPORT_SCRIPT = (
+    Path(__file__).resolve().parent.parent / "scripts" / "dxchange-export.py"
+)
+
+
+class DXchangeExportLauncher:
+    """
+    Start ``scripts/dxchange-export.py`` in the background after tomography runs.
+
+    The export runs in its own process once the run (and its master file) has
+    been written, so the next scan can start immediately. Runs are selected
+    by the ``tomo`` key of their start document.
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self._start = None
+
+    def __call__(self, name, doc):
+        if name == "start":
+            self._start = doc
+        elif name == "stop" and self.enabled and "tomo" in (self._start or {}):
+            # Queued behind the master file of the run (see `submit_post_run`).
+            submit_post_run(
+                "DXchange export",
+                subprocess.Popen,
+                [sys.executable, str(DXCHANGE_EXPORT_SCRIPT), doc["run_start"]],
+                stdout=subprocess.DEVNULL,
+                start_new_session=True,
+            )
+
+
+dxchange_export = DXchangeExportLauncher()
+RE.subscribe(dxchange_export)
+
+
+file_loading_timer.stop_timer(__file__)
@@ -0,0 +1,207 @@
+file_loading_timer.start_timer(__file__)
+
+import os
+import re
+import time as ttime
+from collections import Counter, defaultdict
+
+from bluesky.callbacks.core import CallbackBase
+from bluesky.utils import Msg
+
+ACCOUNTING_STREAM_NAME = "accounting"
+
+
+class RunAccounting(CallbackBase):
+    """
+    Per-run resource accounting, per device and per stream.
+
+    The callback counts documents, frames (from ``stream_datum`` indices) and
+    files of every run; `_accounting_wrapper` marks the phases of the plans it
+    wraps (see `accounting_decorator`).
+    ``summary()`` returns, per stream and data key:
+
+    - ``frames``: frames referenced by the run,
+    - ``bytes``: size of the files written,
+    - ``frame_rate``: frames per second of acquisition,
+    - ``flushes``: ``stream_datum`` documents, i.e. file flushes observed,
+
+    and per run the document counts and the ``setup`` (open run to first
+    kickoff), ``acquisition`` (to the last collect) and ``teardown`` (to close
+    run) durations. The summary is saved in the ``accounting`` stream and, with
+    the final document counts, as ``accounting`` in the tiled run metadata.
+    """
+
+    def __init__(self, client=None):
+        super().__init__()
+        self.client = client
+        self.last_summary = None
+        self._phases = {}
+        self._reset()
+
+    def _reset(self):
+        self._descriptors = {}
+        self._resources = {}
+        self._frames = Counter()
+        self._flushes = Counter()
+        self._files = defaultdict(set)
+        self._documents = Counter()
+
+    def __call__(self, name, doc):
+        self._documents[name] += 1
+        return super().__call__(name, doc)
+
+    def mark(self, phase, first=True):
+        """Record the time of a plan phase boundary, keeping the first by default."""
+        if phase == "open_run":
+            self._phases = {}
+        if not first or phase not in self._phases:
+            self._phases[phase] = ttime.monotonic()
+
+    def start(self, doc):
+        self._reset()
+        self._documents["start"] = 1
+
+    def descriptor(self, doc):
+        self._descriptors[doc["uid"]] = doc["name"]
+
+    def stream_resource(self, doc):
+        self._resources[doc["uid"]] = doc
+
+    def stream_datum(self, doc):
+        resource = self._resources[doc["stream_resource"]]
+        key = (self._descriptors[doc["descriptor"]], resource["data_key"])
+        self._frames[key] += doc["indices"]["stop"] - doc["indices"]["start"]
+        self._flushes[key] += 1
+        self._files[key].add(str(stream_resource_path(resource)))
+
+    def _durations(self):
+        phases = self._phases
+        durations = {}
+        for name, begin, end in (
+            ("setup", "open_run", "kickoff"),
+            ("acquisition", "kickoff", "collect"),
+            ("teardown", "collect", "close_run"),
+        ):
+            if begin in phases and end in phases:
+                durations[name] = phases[end] - phases[begin]
+        return durations
+
+    def summary(self):
+        durations = self._durations()
+        streams = {}
+        for (stream_name, data_key), frames in self._frames.items():
+            files = self._files[(stream_name, data_key)]
+            acquisition = durations.get("acquisition")
+            streams.setdefault(stream_name, {})[data_key] = {
+                "frames": frames,
+                "bytes": sum(os.path.getsize(f) for f in files if os.path.exists(f)),
+                "files": len(files),
+                "frame_rate": frames / acquisition if acquisition else None,
+                "flushes": self._flushes[(stream_name, data_key)],
+            }
+        return {
+            "streams": streams,
+            "durations": durations,
+            "documents": dict(self._documents),
+        }
+
+    def stop(self, doc):
+        self.last_summary = self.summary()
+        if self.client is None:
+            return
+        submit_post_run(
+            "Storing the run accounting",
+            patch_run_metadata,
+            self.client,
+            doc["run_start"],
+            "accounting",
+            self.last_summary,
+        )
+
+
+class AccountingReadable:
+    """Flattened `RunAccounting.summary` read into the accounting stream."""
+
+    def __init__(self, accounting, name="run_accounting"):
+        self.accounting = accounting
+        self.name = name
+        self.parent = None
+        self._values = None
+
+    def _flatten(self):
+        summary = self.accounting.summary()
+        values = {}
+        for stream_name, data_keys in summary["streams"].items():
+            for data_key, stats in data_keys.items():
+                for stat, value in stats.items():
+                    values[f"{stream_name}_{data_key}_{stat}"] = value
+        for phase, duration in summary["durations"].items():
+            values[f"{phase}_duration"] = duration
+        for name, count in summary["documents"].items():
+            values[f"{name}_documents"] = count
+        # Values that are not known (e.g. no acquisition phase) are left out.
+        return {
+            re.sub(r"[^A-Za-z0-9_]", "_", key): value
+            for key, value in values.items()
+            if value is not None
+        }
+
+    def describe(self):
+        self._values = self._flatten()
+        return {
+            key: {
+                "source": "run_accounting",
+                "dtype": "integer" if isinstance(value, int) else "number",
+                "shape": [],
+            }
+            for key, value in self._values.items()
+        }
+
+    def read(self):
+        values = self._values if self._values is not None else self._flatten()
+        self._values = None
+        now = ttime.time()
+        return {
+            key: {"value": value, "timestamp": now} for key, value in values.items()
+        }
+
+
+def _accounting_wrapper(plan, accounting=None):
+    """
+    Mark the phases of every run in ``plan`` and save its accounting stream.
+
+    The accounting is read into the ``accounting`` stream right before each
+    ``close_run``.
+    """
+    accounting = accounting or run_accounting
+    readable = AccountingReadable(accounting)
+
+    def msg_proc(msg):
+        if msg.command == "open_run":
+            accounting.mark("open_run", first=False)
+        elif msg.command in ("kickoff", "collect"):
+            accounting.mark(msg.command, first=msg.command == "kickoff")
+        elif msg.command == "close_run":
+
+            def insert_accounting():
+                accounting.mark("close_run", first=False)
+                yield Msg("create", name=ACCOUNTING_STREAM_NAME)
+                yield Msg("read", readable)
+                yield Msg("save")
+                return (yield msg)
+
+            return insert_accounting(), None
+        return None, None
+
+    return (yield from bpp.plan_mutator(plan, msg_proc))
+
+
+# Opt-in per plan: decorate it with ``@accounting_decorator()`` (as the tomo
+# plans are) or run ``accounting_decorator()(plan)``. Other plans are left as is.
+accounting_decorator = bpp.make_decorator(_accounting_wrapper)
+
+run_accounting = RunAccounting(tiled_client)
+RE.subscribe(run_accounting)
+
+
+file_loading_timer.stop_timer(__file__)
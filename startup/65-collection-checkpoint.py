@@ -0,0 +1,391 @@
+file_loading_timer.start_timer(__file__)
+
+import atexit
+import copy
+import functools
+import itertools
+import json
+import threading
+import uuid
+
+from bluesky.callbacks.core import CallbackBase
+
+
+class CollectionCheckpoint(CallbackBase):
+    """
+    Checkpoint the stream documents of runs that write external files.
+
+    For every run with ``stream_resource`` documents the descriptors, the
+    resources and, per resource, the last emitted index are kept in a redis
+    hash (``<prefix><run uid>``), so they survive a crash of the client. Each
+    document only writes its own field: a ``stream_datum`` updates the
+    high-water mark of its resource and nothing else. The checkpoint is
+    dropped when the run stops successfully; otherwise `resume_collection` can
+    register the frames written after it.
+
+    The fields are written to redis by a background thread every
+    ``flush_period`` seconds, only the latest value of each field, so the
+    RunEngine never waits on redis. A crash loses at most the last period,
+    whose frames `resume_collection` then registers again.
+
+    Parameters:
+    -----------
+    redis_factory: callable
+        Returns the redis client, called on first use.
+    prefix: str
+        Prefix of the redis keys.
+    flush_period: float
+        Seconds between writes to redis.
+    """
+
+    def __init__(
+        self, redis_factory, prefix="collection_checkpoint-", flush_period=1.0
+    ):
+        super().__init__()
+        self._redis_factory = redis_factory
+        self._redis_client = None
+        self._prefix = prefix
+        self._flush_period = flush_period
+        self._uid = None
+        self._pending = None
+        # redis key -> {field: JSON value} and keys to delete, not written yet.
+        self._unwritten = {}
+        self._deleted = set()
+        self._lock = threading.Lock()
+        # Keeps the writes of concurrent flushes in order.
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    @property
+    def _redis(self):
+        if self._redis_client is None:
+            self._redis_client = self._redis_factory()
+        return self._redis_client
+
+    def _key(self, uid):
+        return f"{self._prefix}{uid}"
+
+    def _set(self, **fields):
+        with self._lock:
+            self._unwritten.setdefault(self._key(self._uid), {}).update(
+                {name: json.dumps(value) for name, value in fields.items()}
+            )
+        self._start_thread()
+
+    def _delete(self, key):
+        with self._lock:
+            self._unwritten.pop(key, None)
+            self._deleted.add(key)
+        self._start_thread()
+
+    def _start_thread(self):
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._run, name="collection-checkpoint", daemon=True
+            )
+            self._thread.start()
+            atexit.register(self.flush)
+
+    def _run(self):
+        while True:
+            self._wake.wait(self._flush_period)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as err:
+                print(f"Could not write the collection checkpoint: {err!r}")
+
+    def flush(self):
+        """Write the checkpoint fields not written to redis yet."""
+        with self._flush_lock:
+            self._flush()
+
+    def _flush(self):
+        with self._lock:
+            unwritten, self._unwritten = self._unwritten, {}
+            deleted, self._deleted = self._deleted, set()
+        if not unwritten and not deleted:
+            return
+        try:
+            pipeline = self._redis.pipeline(transaction=False)
+            for key, fields in unwritten.items():
+                pipeline.hset(key, mapping=fields)
+            for key in deleted:
+                pipeline.delete(key)
+            pipeline.execute()
+        except Exception:
+            # Keep them for the next flush, unless newer values came in since.
+            with self._lock:
+                for key, fields in unwritten.items():
+                    if key not in self._deleted:
+                        self._unwritten[key] = {
+                            **fields,
+                            **self._unwritten.get(key, {}),
+                        }
+                self._deleted |= deleted
+            raise
+
+    def start(self, doc):
+        self._uid = doc["uid"]
+        # Written with the first resource, runs without files leave no trace.
+        self._pending = {
+            "start": {k: doc[k] for k in ("uid", "scan_id", "plan_name") if k in doc},
+            "tomo": doc.get("tomo"),
+        }
+
+    def descriptor(self, doc):
+        field = {
+            f"descriptor:{doc['uid']}": {
+                "name": doc["name"],
+                "data_keys": doc["data_keys"],
+            }
+        }
+        if self._pending is not None:
+            self._pending.update(field)
+        else:
+            self._set(**field)
+
+    def stream_resource(self, doc):
+        fields = {f"resource:{doc['uid']}": doc}
+        if self._pending is not None:
+            fields.update(self._pending)
+            self._pending = None
+        self._set(**fields)
+
+    def stream_datum(self, doc):
+        self._set(
+            **{
+                f"index:{doc['stream_resource']}": {
+                    "index": doc["indices"]["stop"],
+                    "descriptor": doc["descriptor"],
+                }
+            }
+        )
+
+    def stop(self, doc):
+        if self._pending is None:
+            if doc.get("exit_status") == "success":
+                self._delete(self._key(self._uid))
+            else:
+                self._set(exit_status=doc.get("exit_status"))
+        self._uid = None
+        self._pending = None
+        self._wake.set()
+
+    def interrupted_runs(self):
+        """Return the uids of the runs with a checkpoint left behind."""
+        self.flush()
+        uids = (
+            key.decode()[len(self._prefix) :]
+            for key in self._redis.scan_iter(match=f"{self._prefix}*")
+        )
+        return [uid for uid in uids if uid != self._uid]
+
+    def get(self, uid):
+        """Return the checkpoint of run ``uid`` as a dict."""
+        self.flush()
+        fields = self._redis.hgetall(self._key(uid))
+        if not fields:
+            raise KeyError(uid)
+        checkpoint = {"descriptors": {}, "resources": {}, "last_indices": {}}
+        groups = {
+            "descriptor": "descriptors",
+            "resource": "resources",
+            "index": "last_indices",
+        }
+        for field, value in fields.items():
+            kind, _, doc_uid = field.decode().partition(":")
+            if kind in groups:
+                checkpoint[groups[kind]][doc_uid] = json.loads(value)
+            else:
+                checkpoint[kind] = json.loads(value)
+        return checkpoint
+
+    def discard(self, uid):
+        self._redis.delete(self._key(uid))
+
+
+collection_checkpoint = CollectionCheckpoint(
+    functools.partial(redis.Redis, "info.tst.nsls2.bnl.gov")
+)
+RE.subscribe(collection_checkpoint)
+
+
+def _equal_width_groups(resources):
+    """
+    Split the slices of all data keys at the same frame counts.
+
+    ``resources`` maps each data key to ``[(stream_resource, start, stop)]``,
+    all data keys having the same number of frames. Returns a list of
+    ``{data_key: (stream_resource, start, stop)}`` in which all data keys have
+    the same width, as the ``stream_datum`` documents of one collect must.
+    """
+    cuts = sorted(
+        {
+            end
+            for slices in resources.values()
+            for end in itertools.accumulate(stop - start for _, start, stop in slices)
+        }
+    )
+    # Per data key: index of the current slice and frames of the slices before.
+    positions = {data_key: (0, 0) for data_key in resources}
+    groups = []
+    begin = 0
+    for end in cuts:
+        group = {}
+        for data_key, slices in resources.items():
+            i, before = positions[data_key]
+            resource, start, stop = slices[i]
+            group[data_key] = (resource, start + begin - before, start + end - before)
+            if start + end - before == stop:
+                positions[data_key] = (i + 1, before + stop - start)
+        groups.append(group)
+        begin = end
+    return groups
+
+
+class ReattachedStream:
+    """
+    Collectable re-registering frames already written to existing HDF5 files.
+
+    ``resources`` maps each data key to ``[(stream_resource, start, stop)]``.
+    A new ``stream_resource`` referencing the same file is emitted for each,
+    and the frames are emitted in groups of equal width across the data keys
+    (see `_equal_width_groups`), one group per `collect_asset_docs` call, so
+    that each collect has one ``stream_datum`` of the same width per data key.
+    """
+
+    def __init__(self, name, data_keys, resources):
+        self.name = name
+        self.parent = None
+        self._data_keys = data_keys
+        self._resources = resources
+        self._groups = _equal_width_groups(resources)
+        self._next_group = 0
+        # Original stream_resource uid -> [new uid, stream_datum count]
+        self._reattached = {}
+
+    @property
+    def remaining(self):
+        """Number of groups of frames not emitted yet."""
+        return len(self._groups) - self._next_group
+
+    def describe_collect(self):
+        return copy.deepcopy(self._data_keys)
+
+    def collect_asset_docs(self, index=None):
+        if not self.remaining:
+            return
+        for resource, start, stop in self._groups[self._next_group].values():
+            if resource["uid"] not in self._reattached:
+                new_resource = {
+                    k: v for k, v in resource.items() if k not in ("run_start", "uid")
+                }
+                new_resource["uid"] = str(uuid.uuid4())
+                self._reattached[resource["uid"]] = [new_resource["uid"], 0]
+                yield "stream_resource", new_resource
+            entry = self._reattached[resource["uid"]]
+            yield "stream_datum", {
+                "uid": f"{entry[0]}/{entry[1]}",
+                "stream_resource": entry[0],
+                "descriptor": "",
+                "indices": {"start": start, "stop": stop},
+                "seq_nums": {"start": 0, "stop": 0},
+            }
+            entry[1] += 1
+        self._next_group += 1
+
+    def get_index(self):
+        return min(
+            sum(stop - start for _, start, stop in slices)
+            for slices in self._resources.values()
+        )
+
+
+def _frames_on_disk(resource):
+    with open_hdf5_swmr(stream_resource_path(resource)) as f:
+        return f[stream_resource_dataset(resource)].shape[0]
+
+
+def reattached_streams(checkpoint, from_start=False):
+    """
+    Build a `ReattachedStream` per stream with the frames not yet registered.
+
+    The frames of a stream are cut to the data key with the fewest frames on
+    disk, so that all data keys of the stream stay aligned.
+    """
+    by_stream = {}
+    for resource_uid, resource in checkpoint["resources"].items():
+        last = checkpoint["last_indices"].get(resource_uid)
+        if last is None:
+            continue
+        descriptor = checkpoint["descriptors"][last["descriptor"]]
+        start = 0 if from_start else last["index"]
+        stop = _frames_on_disk(resource)
+        if stop <= start:
+            continue
+        stream = by_stream.setdefault(descriptor["name"], (descriptor, {}))
+        stream[1].setdefault(resource["data_key"], []).append([resource, start, stop])
+
+    streams = []
+    for stream_name, (descriptor, resources) in by_stream.items():
+        remaining = min(
+            sum(stop - start for _, start, stop in slices)
+            for slices in resources.values()
+        )
+        for slices in resources.values():
+            excess = sum(stop - start for _, start, stop in slices) - remaining
+            for entry in reversed(slices):
+                cut = min(excess, entry[2] - entry[1])
+                entry[2] -= cut
+                excess -= cut
+        resources = {
+            data_key: [tuple(entry) for entry in slices if entry[2] > entry[1]]
+            for data_key, slices in resources.items()
+        }
+        data_keys = {k: v for k, v in descriptor["data_keys"].items() if k in resources}
+        streams.append(ReattachedStream(stream_name, data_keys, resources))
+    return streams
+
+
+def resume_collection(uid, from_start=False, discard=True):
+    """
+    Register the frames of an interrupted fly scan without re-acquiring.
+
+    The HDF5 files of run ``uid`` are reopened and the frames written after
+    its last checkpointed ``stream_datum`` are emitted in a new run linked to
+    the original by ``resumes`` in its start document.
+
+    Parameters:
+    -----------
+    uid: str
+        Run with a checkpoint, see ``collection_checkpoint.interrupted_runs()``.
+    from_start: bool
+        Register all the frames on disk, e.g. if the original run never made
+        it to the database.
+    discard: bool
+        Drop the checkpoint once the frames are registered.
+    """
+    checkpoint = collection_checkpoint.get(uid)
+    streams = reattached_streams(checkpoint, from_start=from_start)
+    if not streams:
+        print(f"No frames of run {uid} left to register")
+        return
+
+    md = {"resumes": uid, "resumed_from_start": from_start}
+    if checkpoint.get("tomo"):
+        md["tomo"] = checkpoint["tomo"]
+    yield from bps.open_run(md=md)
+    for stream in streams:
+        yield from bps.declare_stream(stream, name=stream.name, collect=True)
+        while stream.remaining:
+            yield from bps.collect(stream, name=stream.name)
+        print(f"Registered {stream.get_index()} frames of {stream.name!r}")
+    yield from bps.close_run()
+
+    if discard:
+        collection_checkpoint.discard(uid)
+
+
+file_loading_timer.stop_timer(__file__)
@@ -0,0 +1,260 @@
+file_loading_timer.start_timer(__file__)
+
+import math
+from dataclasses import dataclass
+from typing import Optional
+
+# Number of encoder counts for an entire revolution
+COUNTS_PER_REVOLUTION = 8000
+DEG_PER_REVOLUTION = 360
+COUNTS_PER_DEG = COUNTS_PER_REVOLUTION / DEG_PER_REVOLUTION
+
+# Velocity [deg/s] used for moves outside of the scan when the motor reports no VMAX.
+DEFAULT_ROT_MOVE_VELOCITY = 180 / 2
+
+
+@dataclass
+class RotationTrajectory:
+    num_images: int
+    scan_time: float
+    exposure_time: Optional[float]
+    start_deg: float
+    stop_deg: float
+    velocity: float
+    run_up_deg: float
+    run_out_deg: float
+    pcomp_start: int
+    pcomp_step: int
+    pcomp_width: int
+    pcomp_pulses: int
+
+    @property
+    def move_start_deg(self):
+        return self.start_deg - self.run_up_deg
+
+    @property
+    def move_stop_deg(self):
+        return self.stop_deg + self.run_out_deg
+
+    @property
+    def step_time(self):
+        return self.scan_time / max(self.num_images - 1, 1)
+
+
+class TrajectoryError(ValueError):
+    def __init__(self, message, alternatives=()):
+        self.alternatives = list(alternatives)
+        if self.alternatives:
+            lines = "\n".join(
+                f"  num_images={t.num_images} scan_time={t.scan_time:.3f} "
+                f"exposure_time={t.exposure_time}"
+                for t in self.alternatives
+            )
+            message = f"{message}\nNearest feasible settings:\n{lines}"
+        super().__init__(message)
+
+
+def _check_rotation_trajectory(
+    num_images,
+    scan_time,
+    exposure_time,
+    start_deg,
+    angular_range,
+    acceleration_time,
+    max_velocity,
+    deadtime,
+    settle_time,
+):
+    """Return (trajectory, None) if feasible, else (None, reason)."""
+    if num_images < 2:
+        return None, "At least two images are needed"
+    range_counts = angular_range * COUNTS_PER_DEG
+    step = range_counts / (num_images - 1)
+    if abs(step - round(step)) > 1e-6:
+        return None, (
+            f"The number of encoder counts per pulse ({step:.3f}) is not an integer"
+        )
+    velocity = angular_range / scan_time
+    if max_velocity and velocity > max_velocity:
+        return None, f"Scan velocity {velocity:.3f} deg/s exceeds VMAX={max_velocity}"
+
+    width = 0
+    if exposure_time is not None:
+        step_time = scan_time / (num_images - 1)
+        if exposure_time + deadtime > step_time:
+            return None, (
+                f"Exposure {exposure_time}s plus deadtime {deadtime}s does not fit "
+                f"into the step time {step_time:.4f}s"
+            )
+        width = velocity * COUNTS_PER_DEG * exposure_time
+
+    # An EPICS motor ramps linearly from rest over ACCL seconds, covering v * t / 2.
+    ramp_deg = velocity * acceleration_time / 2 + velocity * settle_time
+    return (
+        RotationTrajectory(
+            num_images=num_images,
+            scan_time=scan_time,
+            exposure_time=exposure_time,
+            start_deg=start_deg,
+            stop_deg=start_deg + angular_range,
+            velocity=velocity,
+            run_up_deg=ramp_deg,
+            run_out_deg=ramp_deg,
+            pcomp_start=int(round(start_deg * COUNTS_PER_DEG)),
+            pcomp_step=int(round(step)),
+            pcomp_width=int(math.ceil(width)),
+            pcomp_pulses=num_images,
+        ),
+        None,
+    )
+
+
+def feasible_rotation_alternatives(
+    num_images,
+    scan_time,
+    exposure_time=None,
+    angular_range=DEG_PER_REVOLUTION / 2,
+    max_velocity=None,
+    deadtime=0,
+    count=5,
+):
+    """
+    List the nearest feasible (num_images, scan_time, exposure_time) settings.
+
+    Candidates use an image count that splits ``angular_range`` into an integer
+    number of encoder counts. The requested scan time is kept when it respects
+    VMAX and the exposure fits, otherwise the shortest scan time that does.
+    """
+    range_counts = int(round(angular_range * COUNTS_PER_DEG))
+    candidates = sorted(
+        (n + 1 for n in range(1, range_counts + 1) if range_counts % n == 0),
+        key=lambda n: (abs(n - num_images), n),
+    )
+    min_scan_time = angular_range / max_velocity if max_velocity else 0
+    alternatives = []
+    for n in candidates[:count]:
+        time_ = max(scan_time, min_scan_time)
+        if exposure_time is not None:
+            time_ = max(time_, (n - 1) * (exposure_time + deadtime))
+        alternatives.append((n, time_, exposure_time))
+    return alternatives
+
+
+def plan_rotation_trajectory(
+    num_images,
+    scan_time,
+    start_deg=0,
+    exposure_time=None,
+    *,
+    angular_range=DEG_PER_REVOLUTION / 2,
+    acceleration_time=0.5,
+    max_velocity=None,
+    deadtime=0,
+    settle_time=0.1,
+):
+    """
+    Compute the motion and PCOMP settings for a rotation fly scan.
+
+    The stage accelerates over ``acceleration_time`` (the motor ACCL field), so
+    it only needs to start ``v * ACCL / 2`` (plus ``settle_time`` at constant
+    velocity) before the first pulse and stop the same distance after the last.
+
+    Parameters:
+    -----------
+    num_images: int
+        Number of pulses over ``angular_range``, including both ends.
+    scan_time: float
+        Time [s] to rotate through ``angular_range``.
+    start_deg: float
+        Position of the first pulse.
+    exposure_time: float, optional
+        Camera exposure, used to size the PCOMP pulse width.
+    angular_range: float
+    acceleration_time: float
+    max_velocity: float, optional
+    deadtime: float
+        Detector deadtime added to ``exposure_time`` when checking the step time.
+    settle_time: float
+        Time at constant velocity before the first and after the last pulse.
+
+    Returns:
+    --------
+    RotationTrajectory
+
+    Raises:
+    -------
+    TrajectoryError listing the nearest feasible settings if the request is not.
+    """
+    trajectory, reason = _check_rotation_trajectory(
+        num_images,
+        scan_time,
+        exposure_time,
+        start_deg,
+        angular_range,
+        acceleration_time,
+        max_velocity,
+        deadtime,
+        settle_time,
+    )
+    if trajectory is not None:
+        return trajectory
+
+    alternatives = []
+    for n, time_, exposure in feasible_rotation_alternatives(
+        num_images,
+        scan_time,
+        exposure_time,
+        angular_range=angular_range,
+        max_velocity=max_velocity,
+        deadtime=deadtime,
+    ):
+        alternative, _ = _check_rotation_trajectory(
+            n,
+            time_,
+            exposure,
+            start_deg,
+            angular_range,
+            acceleration_time,
+            max_velocity,
+            deadtime,
+            settle_time,
+        )
+        if alternative is not None:
+            alternatives.append(alternative)
+    raise TrajectoryError(reason, alternatives)
+
+
+def _read_rotation_trajectory(
+    motor,
+    num_images,
+    scan_time,
+    start_deg=0,
+    exposure_time=None,
+    detector=None,
+    **kwargs,
+):
+    """
+    Plan stub wrapping `plan_rotation_trajectory` with the motor's ACCL/VMAX.
+
+    If ``detector`` is given, its calibrated edge-trigger deadtime is used.
+    """
+    acceleration_time = yield from bps.rd(motor.acceleration_time)
+    max_velocity = yield from bps.rd(motor.max_velocity)
+    deadtime = 0
+    if detector is not None and exposure_time is not None:
+        deadtime = deadtime_calibration.deadtime(
+            detector.name, DetectorTrigger.edge_trigger, exposure_time, default=0
+        )
+    return plan_rotation_trajectory(
+        num_images,
+        scan_time,
+        start_deg,
+        exposure_time,
+        acceleration_time=acceleration_time,
+        max_velocity=max_velocity or None,
+        deadtime=deadtime,
+        **kwargs,
+    )
+
+
+file_loading_timer.stop_timer(__file__)
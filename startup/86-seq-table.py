@@ -0,0 +1,174 @@
+file_loading_timer.start_timer(__file__)
+
+import numpy as np
+from ophyd_async.core import Device
+from ophyd_async.epics.signal import epics_signal_r
+from ophyd_async.fastcs.panda import SeqTrigger, seq_table_from_arrays
+
+# Number of rows the SEQ block holds in its hardware buffer.
+SEQ_TABLE_MAX_ROWS = 4096
+# The tables below count time in microseconds (SEQ prescale of 1 us).
+SEQ_PRESCALE_UNITS = "us"
+GOLDEN_ANGLE_DEG = 180 * (np.sqrt(5) - 1) / 2
+
+
+class SeqStreamIO(Device):
+    """SEQ block PVs used for table streaming, not exposed through PVI."""
+
+    def __init__(self, prefix: str, name: str = "") -> None:
+        self.can_write_next = epics_signal_r(int, prefix + "CAN_WRITE_NEXT")
+        self.table_line = epics_signal_r(int, prefix + "TABLE_LINE")
+        self.table_repeat = epics_signal_r(int, prefix + "TABLE_REPEAT")
+        super().__init__(name=name)
+
+
+def instantiate_seq_stream_io(panda_id, seq_ids=(1, 2)):
+    with DeviceCollector():
+        seq_stream_io = {
+            i: SeqStreamIO(
+                f"XF:31ID1-ES{{PANDA:{panda_id}}}:SEQ{i}:",
+                name=f"panda{panda_id}_seq{i}_stream_io",
+            )
+            for i in seq_ids
+        }
+    return seq_stream_io
+
+
+panda1_seq_stream_io = instantiate_seq_stream_io(1)
+
+
+def golden_angle_positions(num, start_deg=0, angular_range=DEG_PER_REVOLUTION / 2):
+    """
+    Golden-angle sampling of ``angular_range`` for a continuous rotation.
+
+    Angle ``k`` is ``start_deg + (k * golden angle) mod angular_range``; every
+    time the sequence wraps, the next angle is taken one revolution later, so
+    the returned positions [deg] increase monotonically.
+    """
+    base = np.mod(np.arange(num) * GOLDEN_ANGLE_DEG, angular_range)
+    turns = np.concatenate([[0], np.cumsum(np.diff(base) < 0)])
+    return start_deg + base + turns * DEG_PER_REVOLUTION
+
+
+def interlaced_positions(
+    num, n_interlace, start_deg=0, angular_range=DEG_PER_REVOLUTION / 2
+):
+    """
+    Interlaced sampling: ``n_interlace`` rotations, each shifted by a fraction
+    of the angular step, together sampling ``angular_range`` with ``num`` angles.
+    """
+    per_turn = int(np.ceil(num / n_interlace))
+    step = angular_range / per_turn
+    turn, index = np.divmod(np.arange(num), per_turn)
+    return (
+        start_deg + turn * DEG_PER_REVOLUTION + index * step + turn * step / n_interlace
+    )
+
+
+def seq_table_from_positions(positions_deg, pulse_width, direction=1):
+    """
+    Compile target rotation positions into SEQ table rows.
+
+    Each row waits for the position input A to pass the target and then holds
+    output A high for ``pulse_width`` seconds. The SEQ block's POSA must be
+    connected to the rotation encoder in the PandA layout.
+
+    Parameters:
+    -----------
+    positions_deg: array of float
+        Target angles in the order the rotation reaches them.
+    pulse_width: float
+    direction: int
+        +1 if the encoder counts up during the scan, -1 otherwise.
+    """
+    positions = np.rint(np.asarray(positions_deg) * COUNTS_PER_DEG).astype(np.int32)
+    if np.any(np.diff(positions) * direction <= 0):
+        raise ValueError(
+            "Positions must be strictly monotonic in the rotation direction "
+            "and at least one encoder count apart"
+        )
+    trigger = SeqTrigger.POSA_GT if direction > 0 else SeqTrigger.POSA_LT
+    num = len(positions)
+    return seq_table_from_arrays(
+        repeats=np.ones(num, dtype=np.uint16),
+        trigger=[trigger] * num,
+        position=positions,
+        time1=np.full(num, _seq_time(pulse_width), dtype=np.uint32),
+        outa1=np.ones(num, dtype=bool),
+        time2=np.ones(num, dtype=np.uint32),
+        outa2=np.zeros(num, dtype=bool),
+    )
+
+
+def seq_table_from_times(times, pulse_width):
+    """
+    Compile trigger times [s], relative to the SEQ enable, into table rows.
+
+    Row ``k`` holds output A high for ``pulse_width`` and then low until
+    trigger ``k + 1``.
+    """
+    times = np.asarray(times, dtype=float)
+    ticks = np.rint(times / 1e-6).astype(np.int64)
+    width = _seq_time(pulse_width)
+    gaps = np.diff(ticks, append=ticks[-1] + width + 1) - width
+    if ticks[0] < 0 or np.any(gaps < 1):
+        raise ValueError("Trigger times must increase by more than the pulse width")
+    num = len(ticks)
+    # The first row waits for the first trigger time with its output low.
+    return seq_table_from_arrays(
+        repeats=np.ones(num + 1, dtype=np.uint16),
+        trigger=[SeqTrigger.IMMEDIATE] * (num + 1),
+        time1=np.concatenate([[max(ticks[0] - 1, 1)], np.full(num, width)]).astype(
+            np.uint32
+        ),
+        outa1=np.concatenate([[False], np.ones(num, dtype=bool)]),
+        time2=np.concatenate([[1], gaps]).astype(np.uint32),
+        outa2=np.zeros(num + 1, dtype=bool),
+    )
+
+
+def _seq_time(seconds):
+    return max(int(round(seconds / 1e-6)), 1)
+
+
+def split_seq_table(table, max_rows=SEQ_TABLE_MAX_ROWS):
+    """Split a table into chunks that fit into the hardware buffer."""
+    num = len(table["repeats"])
+    return [
+        {key: value[i : i + max_rows] for key, value in table.items()}
+        for i in range(0, num, max_rows)
+    ]
+
+
+def _upload_seq_table(seq, table):
+    """
+    Plan stub writing a table to a SEQ block in one put.
+
+    Returns the chunks which did not fit into the hardware buffer; pass them
+    to `_stream_seq_table` once the sequencer runs.
+    """
+    chunks = split_seq_table(table)
+    yield from bps.mv(seq.prescale, 1, seq.prescale_units, SEQ_PRESCALE_UNITS)
+    yield from bps.mv(seq.repeats, 1)
+    yield from bps.mv(seq.table, chunks[0])
+    return chunks[1:]
+
+
+def _stream_seq_table(seq, stream_io, chunks, poll_period=0.05):
+    """
+    Plan stub refilling a running SEQ block with the remaining ``chunks``.
+
+    Each chunk is written as soon as the block reports ``CAN_WRITE_NEXT``,
+    which requires PandA firmware and IOC support for table streaming.
+    """
+    for i, chunk in enumerate(chunks):
+        while True:
+            can_write_next = yield from bps.rd(stream_io.can_write_next)
+            if can_write_next:
+                break
+            yield from bps.sleep(poll_period)
+        yield from bps.mv(seq.table, chunk)
+        print(f"Wrote SEQ table chunk {i + 2}/{len(chunks) + 1}")
+
+
+file_loading_timer.stop_timer(__file__)
@@ -31,17 +31,17 @@ def tomo_demo_01(theta0=10, n_proj=161, n_series=3):
 
 
 def plot_data(scan_id=-1):
-    hdr = db[scan_id]
-    data = hdr.table(fill=True)
+    hdr = tiled_client[scan_id]
+    data = hdr["primary"].read()
 
     fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(16, 9))
     fig.suptitle(f"scan_id={hdr.start['scan_id']}  uid={hdr.start['uid'][:8]}")
 
-    ax1.plot(data["pcap_ts_trig"][1], data["fmc_in_val3"][1], "b.")
+    ax1.plot(data["pcap_ts_trig"][0], data["fmc_in_val3"][0], "b.")
     ax1.set_xlabel("Relative time [s]")
     ax1.set_ylabel("Signal [arb.u.]")
 
-    ax2.plot(data["inenc1_val"][1], data["fmc_in_val3"][1], "b.")
+    ax2.plot(data["inenc1_val"][0], data["fmc_in_val3"][0], "b.")
     ax2.set_xlabel("Relative time [s]")
     ax2.set_ylabel("Signal [arb.u.]")
 
@@ -104,84 +104,121 @@ def rbuf_plan(t_period=0.00002, n_total=25000, n_after=10000):
     bps.sleep(0.1)
 
 
-# Number of encoder counts for an entire revolution
-COUNTS_PER_REVOLUTION = 8000
-DEG_PER_REVOLUTION = 360
-COUNTS_PER_DEG = COUNTS_PER_REVOLUTION / DEG_PER_REVOLUTION
+def tomo_run_md(trajectory, **extra):
+    """Return the start document metadata of a rotation fly scan along ``trajectory``."""
+    return {
+        "tomo": {
+            "start_deg": trajectory.start_deg,
+            "stop_deg": trajectory.stop_deg,
+            "num_images": trajectory.num_images,
+            "scan_time": trajectory.scan_time,
+            "exposure_time": trajectory.exposure_time,
+            **extra,
+        }
+    }
 
 
-def tomo_demo_async(
-    panda,
-    detector,
-    num_images=21,
-    scan_time=9,
-    start_deg=0,
-    exposure_time=None,
-):
+def _move_to_rotation_start(trajectory):
+    """
+    Move ``rot_motor`` quickly to the run-up position and set the scan velocity.
 
+    Returns the velocity of the fast moves, to be restored after the scan.
+    """
+    max_velocity = yield from bps.rd(rot_motor.max_velocity)
+    move_velocity = max_velocity or DEFAULT_ROT_MOVE_VELOCITY
+    yield from bps.mv(rot_motor.velocity, move_velocity)
+    yield from bps.mv(rot_motor, trajectory.move_start_deg)
+    yield from bps.mv(rot_motor.velocity, trajectory.velocity)
+    return move_velocity
+
+
+def _configure_pcomp(panda, trajectory):
+    """Set up the first PCOMP block of ``panda`` to pulse along ``trajectory``."""
     panda_pcomp1 = panda.pcomp[1]
+    yield from bps.mv(panda_pcomp1.start, trajectory.pcomp_start)
+    # Uncomment if using gate trigger mode on camera
+    # yield from bps.mv(
+    #    panda_pcomp1.width, trajectory.pcomp_width
+    # )  # Width in encoder counts that the pulse will be high
+    yield from bps.mv(panda_pcomp1.step, trajectory.pcomp_step)
+    yield from bps.mv(panda_pcomp1.pulses, trajectory.pcomp_pulses)
 
-    step_width_counts = COUNTS_PER_REVOLUTION / (2 * (num_images - 1))
-    if int(step_width_counts) != round(step_width_counts, 5):
-        raise ValueError(
-            "The number of encoder counts per pulse is not an integer value!"
-        )
 
-    step_time = scan_time / num_images
-    if exposure_time is not None:
-        if exposure_time > step_time:
-            raise RuntimeError(
-                f"Your configured exposure time is longer than the step size {step_time}"
-            )
+def _prepare_panda_fly(panda, num_frames, exposure_time):
+    """Prepare ``panda`` to capture ``num_frames`` gated by PCOMP."""
+    panda_exp_setup = StandardTriggerSetup(
+        num_frames=num_frames,
+        exposure_time=exposure_time,
+        trigger_mode=DetectorTrigger.constant_gate,
+    )
+    yield from bps.prepare(panda_flyer, num_frames, wait=True)
+    yield from bps.prepare(
+        panda, panda_flyer.trigger_logic.trigger_info(panda_exp_setup), wait=True
+    )
 
-    panda_devices = [panda, panda_flyer]
-    detector_devices = [detector, manta_flyer]
-    all_devices = panda_devices + detector_devices
 
+def _prepare_detector_fly(detector, num_frames, exposure_time):
+    """Prepare ``detector`` for ``num_frames`` projections triggered by the PandA."""
     det_exp_setup = StandardTriggerSetup(
-        num_frames=num_images,
+        num_frames=num_frames,
         exposure_time=exposure_time,
         trigger_mode=DetectorTrigger.edge_trigger,
+        detector_name=detector.name,
     )
-
-    panda_exp_setup = StandardTriggerSetup(
-        num_frames=num_images,
-        exposure_time=exposure_time,
-        trigger_mode=DetectorTrigger.constant_gate,
+    detector._writer._path_provider._filename_provider.set_frame_type(
+        TomoFrameType.proj
+    )
+    yield from bps.mv(detector._writer.hdf.num_capture, num_frames)
+    yield from bps.prepare(manta_flyer, det_exp_setup, wait=True)
+    yield from bps.prepare(
+        detector, manta_flyer.trigger_logic.trigger_info(det_exp_setup), wait=True
     )
 
-    yield from bps.mv(
-        rot_motor.velocity, 180 / 2
-    )  # Make it fast to move to the start position
-    yield from bps.mv(rot_motor, start_deg - 20)
-    yield from bps.mv(
-        rot_motor.velocity, 180 / scan_time
-    )  # Set the velocity for the scan
-    start_encoder = start_deg * COUNTS_PER_DEG
-
-    width_in_counts = (180 / scan_time) * COUNTS_PER_DEG * exposure_time
-    if width_in_counts > step_width_counts:
-        raise RuntimeError(
-            f"Your specified exposure time of {exposure_time}s is too long! Calculated width: {width_in_counts}, Step size: {step_width_counts}"
-        )
-    print(f"Exposing camera for {width_in_counts} counts")
 
-    # Set up the pcomp block
-    yield from bps.mv(panda_pcomp1.start, int(start_encoder))
+def _kickoff_rotation_fly(panda, detector, suffix=""):
+    """
+    Kick off the PandA, the detector and their flyers and start their completion.
 
-    # Uncomment if using gate trigger mode on camera
-    # yield from bps.mv(
-    #    panda3_pcomp_1.width, width_in_counts
-    # )  # Width in encoder counts that the pulse will be high
-    yield from bps.mv(panda_pcomp1.step, step_width_counts)
-    yield from bps.mv(panda_pcomp1.pulses, num_images)
+    Returns the status groups ``(complete_panda<suffix>, complete_detector<suffix>)``.
+    """
+    panda_group = f"complete_panda{suffix}"
+    detector_group = f"complete_detector{suffix}"
+    for device in (panda, panda_flyer, detector, manta_flyer):
+        yield from bps.kickoff(device)
+    for flyer_or_panda in (panda, panda_flyer):
+        yield from bps.complete(flyer_or_panda, group=panda_group)
+    for flyer_or_det in (detector, manta_flyer):
+        yield from bps.complete(flyer_or_det, group=detector_group)
+    return panda_group, detector_group
 
-    yield from bps.open_run()
 
-    detector._writer._path_provider._filename_provider.set_frame_type(
-        TomoFrameType.proj
+@accounting_decorator()
+def tomo_demo_async(
+    panda,
+    detector,
+    num_images=21,
+    scan_time=9,
+    start_deg=0,
+    exposure_time=None,
+):
+
+    trajectory = yield from _read_rotation_trajectory(
+        rot_motor, num_images, scan_time, start_deg, exposure_time, detector=detector
     )
 
+    panda_devices = [panda, panda_flyer]
+    detector_devices = [detector, manta_flyer]
+    all_devices = panda_devices + detector_devices
+
+    # Make it fast to move to the start position
+    move_velocity = yield from _move_to_rotation_start(trajectory)
+    print(f"Exposing camera for {trajectory.pcomp_width} counts")
+
+    # Set up the pcomp block
+    yield from _configure_pcomp(panda, trajectory)
+
+    yield from bps.open_run(md=tomo_run_md(trajectory))
+
     # The setup below is happening in the VimbaController's arm method.
     # # Setup camera in trigger mode
     # yield from bps.mv(manta_async.trigger_mode, "On")
@@ -191,74 +228,245 @@ def tomo_demo_async(
 
     # Stage All!
     yield from bps.stage_all(*all_devices)
-    yield from bps.mv(detector._writer.hdf.num_capture, num_images)
+    yield from _prepare_detector_fly(detector, num_images, exposure_time)
+    yield from _prepare_panda_fly(panda, num_images, exposure_time)
 
-    yield from bps.prepare(manta_flyer, det_exp_setup, wait=True)
-    yield from bps.prepare(
-        detector, manta_flyer.trigger_logic.trigger_info(det_exp_setup), wait=True
+    yield from bps.mv(rot_motor, trajectory.move_stop_deg)
+
+    panda_group, detector_group = yield from _kickoff_rotation_fly(panda, detector)
+
+    # Manually incremenet the index as if a frame was taken
+    # detector.writer.index += 1
+
+    panda_stream_name = f"{panda.name}_stream"
+    detector_stream_name = f"{detector.name}_stream"
+    yield from bps.declare_stream(panda, name=panda_stream_name)
+    yield from bps.declare_stream(detector, name=detector_stream_name)
+
+    # Wait for completion of the PandA HDF5 file saving.
+    yield from _collect_until_complete(panda, panda_group, panda_stream_name)
+
+    yield from bps.unstage_all(*panda_devices)
+
+    # Wait for completion of the AD HDF5 file saving.
+    yield from _collect_until_complete(detector, detector_group, detector_stream_name)
+
+    yield from bps.close_run()
+
+    panda_val = yield from bps.rd(panda.data.num_captured)
+    manta_val = yield from bps.rd(detector._writer.hdf.num_captured)
+    print(f"{panda_val = }    {manta_val = }")
+
+    yield from bps.unstage_all(*detector_devices)
+
+    # Reset the velocity back to high.
+    yield from bps.mv(rot_motor.velocity, move_velocity)
+
+
+@accounting_decorator()
+def tomo_dark_flat_proj_async(
+    panda,
+    detector,
+    num_images=21,
+    scan_time=9,
+    start_deg=0,
+    exposure_time=None,
+    num_darks=10,
+    num_flats=10,
+    reference_exposure_time=None,
+    dark_setup=None,
+    flat_setup=None,
+    proj_setup=None,
+):
+    """
+    Acquire darks, flats and projections in one run.
+
+    The PandA and the flyers are staged once for the whole run. The detector is
+    staged for each phase, so that each phase is written to its own file (named
+    by `TomoFrameType`) and collected in its own stream: ``dark``, ``flat`` and
+    ``proj`` for the detector, plus the PandA stream during the projections.
+
+    Parameters:
+    -----------
+    num_darks, num_flats: int
+        Number of reference frames; 0 skips the phase.
+    reference_exposure_time: float, optional
+        Exposure of the darks and flats, ``exposure_time`` by default.
+    dark_setup, flat_setup, proj_setup: callable, optional
+        Plans run before each phase, e.g. to close the shutter or to move the
+        sample out of the beam and back.
+    """
+    reference_exposure_time = reference_exposure_time or exposure_time
+    if (num_darks or num_flats) and reference_exposure_time is None:
+        raise ValueError("An exposure time is needed for the dark and flat frames")
+
+    trajectory = yield from _read_rotation_trajectory(
+        rot_motor, num_images, scan_time, start_deg, exposure_time, detector=detector
     )
 
-    yield from bps.prepare(panda_flyer, num_images, wait=True)
-    yield from bps.prepare(
-        panda, panda_flyer.trigger_logic.trigger_info(panda_exp_setup), wait=True
+    all_devices = [panda, panda_flyer, detector, manta_flyer]
+
+    move_velocity = yield from _move_to_rotation_start(trajectory)
+    yield from _configure_pcomp(panda, trajectory)
+
+    yield from bps.open_run(
+        md=tomo_run_md(
+            trajectory,
+            num_darks=num_darks,
+            num_flats=num_flats,
+            reference_exposure_time=reference_exposure_time,
+        )
     )
 
-    yield from bps.mv(rot_motor, start_deg + DEG_PER_REVOLUTION / 2 + 5)
+    yield from bps.stage_all(panda, panda_flyer, manta_flyer)
+
+    for frame_type, num, setup in (
+        (TomoFrameType.dark, num_darks, dark_setup),
+        (TomoFrameType.flat, num_flats, flat_setup),
+    ):
+        if not num:
+            continue
+        if setup is not None:
+            yield from setup()
+        yield from _collect_frame_type_stream(
+            detector, frame_type, num=num, exposure_time=reference_exposure_time
+        )
 
-    for device in all_devices:
-        yield from bps.kickoff(device)
+    if proj_setup is not None:
+        yield from proj_setup()
 
-    for flyer_or_panda in panda_devices:
-        yield from bps.complete(flyer_or_panda, wait=True, group="complete_panda")
+    yield from bps.stage(detector, wait=True)
+    yield from _prepare_detector_fly(detector, num_images, exposure_time)
+    yield from _prepare_panda_fly(panda, num_images, exposure_time)
 
-    for flyer_or_det in detector_devices:
-        yield from bps.complete(flyer_or_det, wait=True, group="complete_detector")
+    panda_stream_name = f"{panda.name}_stream"
+    detector_stream_name = TomoFrameType.proj.value
+    yield from bps.declare_stream(panda, name=panda_stream_name)
+    yield from bps.declare_stream(detector, name=detector_stream_name)
 
-    # Manually incremenet the index as if a frame was taken
-    # detector.writer.index += 1
+    panda_group, detector_group = yield from _kickoff_rotation_fly(panda, detector)
 
-    # Wait for completion of the PandA HDF5 file saving.
-    done = False
-    while not done:
-        try:
-            yield from bps.wait(group="complete_panda", timeout=0.5)
-        except TimeoutError:
-            pass
-        else:
-            done = True
-
-        panda_stream_name = f"{panda.name}_stream"
-        yield from bps.declare_stream(panda, name=panda_stream_name)
-
-        yield from bps.collect(
-            panda,
-            # stream=True,
-            # return_payload=False,
-            name=panda_stream_name,
-        )
+    yield from bps.mv(rot_motor, trajectory.move_stop_deg)
 
-    yield from bps.unstage_all(*panda_devices)
+    yield from _collect_until_complete(panda, panda_group, panda_stream_name)
+    yield from _collect_until_complete(detector, detector_group, detector_stream_name)
 
-    # Wait for completion of the AD HDF5 file saving.
-    done = False
-    while not done:
-        try:
-            yield from bps.wait(group="complete_detector", timeout=0.5)
-        except TimeoutError:
-            pass
-        else:
-            done = True
-
-        detector_stream_name = f"{detector.name}_stream"
-        yield from bps.declare_stream(detector, name=detector_stream_name)
-
-        yield from bps.collect(
-            detector,
-            # stream=True,
-            # return_payload=False,
-            name=detector_stream_name,
+    yield from bps.close_run()
+
+    yield from bps.unstage_all(*all_devices)
+
+    # Reset the velocity back to high.
+    yield from bps.mv(rot_motor.velocity, move_velocity)
+
+
+# Minimum time [s] the stage needs between two series to re-arm PCOMP.
+PCOMP_REARM_TIME = 0.5
+
+
+@accounting_decorator()
+def tomo_multi_series_async(
+    panda,
+    detector,
+    num_images=21,
+    scan_time=9,
+    n_series=3,
+    start_deg=0,
+    exposure_time=None,
+    series_pitch_deg=DEG_PER_REVOLUTION,
+):
+    """
+    Continuous multi-series rotation fly scan for time-resolved tomography.
+
+    ``rot_motor`` keeps spinning at the scan velocity through all the series.
+    Each series takes ``num_images`` projections over 180 deg starting every
+    ``series_pitch_deg``; PCOMP is re-armed for the next series on the PandA while
+    the stage travels between them. All series are written to the same streams
+    of a single run, series ``i`` occupying the frame indices listed in
+    ``start["tomo"]["series"]``; ``start["tomo"]["stop_deg"]`` is the end of
+    the last series.
+    """
+    panda_pcomp1 = panda.pcomp[1]
+
+    trajectory = yield from _read_rotation_trajectory(
+        rot_motor, num_images, scan_time, start_deg, exposure_time, detector=detector
+    )
+    angular_range = trajectory.stop_deg - trajectory.start_deg
+    rearm_deg = trajectory.velocity * PCOMP_REARM_TIME
+    if series_pitch_deg < angular_range + rearm_deg:
+        raise ValueError(
+            f"The series pitch of {series_pitch_deg} deg leaves no time to re-arm "
+            f"PCOMP, use at least {angular_range + rearm_deg:.1f} deg"
         )
-        yield from bps.sleep(0.01)
+
+    num_frames = num_images * n_series
+    series_starts = [start_deg + i * series_pitch_deg for i in range(n_series)]
+    final_deg = series_starts[-1] + angular_range + trajectory.run_out_deg
+
+    all_devices = [panda, panda_flyer, detector, manta_flyer]
+
+    move_velocity = yield from _move_to_rotation_start(trajectory)
+
+    # PCOMP is re-armed for each series by a rising edge of its enable: toggle it
+    # from ZERO to the configured source, or to ONE if it is not enabled.
+    pcomp_enable = yield from bps.rd(panda_pcomp1.enable)
+    rearm_enable = "ONE" if pcomp_enable == "ZERO" else pcomp_enable
+    assert rearm_enable != "ZERO", "PCOMP must be enabled to be re-armed"
+    yield from _configure_pcomp(panda, trajectory)
+    yield from bps.mv(panda_pcomp1.enable, rearm_enable)
+
+    md = tomo_run_md(
+        trajectory,
+        n_series=n_series,
+        series=[
+            {
+                "start_deg": series_start,
+                "stop_deg": series_start + angular_range,
+                "indices": [i * num_images, (i + 1) * num_images],
+            }
+            for i, series_start in enumerate(series_starts)
+        ],
+    )
+    md["tomo"]["stop_deg"] = series_starts[-1] + angular_range
+    yield from bps.open_run(md=md)
+
+    yield from bps.stage_all(*all_devices)
+    yield from _prepare_detector_fly(detector, num_frames, exposure_time)
+    yield from _prepare_panda_fly(panda, num_frames, exposure_time)
+
+    panda_stream_name = f"{panda.name}_stream"
+    detector_stream_name = f"{detector.name}_stream"
+    yield from bps.declare_stream(panda, name=panda_stream_name)
+    yield from bps.declare_stream(detector, name=detector_stream_name)
+
+    panda_group, detector_group = yield from _kickoff_rotation_fly(panda, detector)
+
+    # Keep spinning through all the series in one move.
+    yield from bps.abs_set(rot_motor, final_deg, group="rotation")
+
+    half_step_deg = trajectory.pcomp_step / COUNTS_PER_DEG / 2
+    for i, series_start in enumerate(series_starts):
+        if i > 0:
+            # Re-arm PCOMP for the next series on a rising edge of its enable.
+            yield from bps.mv(
+                panda_pcomp1.start, int(round(series_start * COUNTS_PER_DEG))
+            )
+            yield from bps.mv(panda_pcomp1.enable, "ZERO")
+            yield from bps.mv(panda_pcomp1.enable, rearm_enable)
+
+        series_stop = series_start + angular_range + half_step_deg
+        position = yield from bps.rd(rot_motor)
+        while position < series_stop:
+            yield from bps.collect(panda, name=panda_stream_name)
+            yield from bps.collect(detector, name=detector_stream_name)
+            yield from bps.sleep(0.1)
+            position = yield from bps.rd(rot_motor)
+        print(f"Series {i + 1}/{n_series} done at {position:.2f} deg")
+
+    yield from bps.wait(group="rotation")
+
+    # Wait for the remaining frames to be written.
+    yield from _collect_until_complete(panda, panda_group, panda_stream_name)
+    yield from _collect_until_complete(detector, detector_group, detector_stream_name)
 
     yield from bps.close_run()
 
@@ -266,10 +474,12 @@ def tomo_demo_async(
     manta_val = yield from bps.rd(detector._writer.hdf.num_captured)
     print(f"{panda_val = }    {manta_val = }")
 
-    yield from bps.unstage_all(*detector_devices)
+    yield from bps.unstage_all(*all_devices)
+    yield from bps.mv(panda_pcomp1.start, trajectory.pcomp_start)
+    yield from bps.mv(panda_pcomp1.enable, pcomp_enable)
 
     # Reset the velocity back to high.
-    yield from bps.mv(rot_motor.velocity, 180 / 2)
+    yield from bps.mv(rot_motor.velocity, move_velocity)
 
 
 file_loading_timer.stop_timer(__file__)
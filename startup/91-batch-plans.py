@@ -0,0 +1,164 @@
+file_loading_timer.start_timer(__file__)
+
+# Resources each setup step of the next scan uses. A step starts as soon as
+# the running scan has released all of them:
+#  - rot_motor when the rotation has reached its stop position
+#    (PCOMP has emitted all its pulses by then),
+#  - panda / detector when their acquisition is complete and collected,
+#  - start_position when the stage is back at the run-up position of the next
+#    scan, so that the PandA is not armed while the stage moves back through
+#    the trigger window.
+BATCH_STEP_DEPENDENCIES = {
+    "move_to_start": {"rot_motor"},
+    "configure_pcomp": {"panda"},
+    "prepare_panda": {"panda", "start_position"},
+    "prepare_detector": {"detector"},
+}
+
+
+@accounting_decorator()
+def tomo_batch_async(panda, detector, scans, dependencies=None):
+    """
+    Run a list of rotation fly scans, overlapping each teardown with the next setup.
+
+    The flyers stay staged for the whole batch. The PandA and the detector are
+    staged for each scan, so each scan is written to its own files, and
+    unstaged as soon as their frames of the scan are collected. While the
+    writers of scan ``i`` finish and its documents are collected, each setup
+    step of scan ``i + 1`` (stage move, PCOMP configuration, PandA and
+    detector prepare) starts as soon as the resources it depends on are
+    released by scan ``i``. Each scan is its own run.
+
+    Parameters:
+    -----------
+    panda: HDFPanda
+    detector: StandardDetector
+    scans: list of dict
+        Keyword arguments of `tomo_demo_async` for each scan (``num_images``,
+        ``scan_time``, ``start_deg``, ``exposure_time``), plus an optional
+        ``md`` dict added to the start document.
+    dependencies: dict, optional
+        Step name to the set of resources (``"rot_motor"``, ``"panda"``,
+        ``"detector"``, ``"start_position"``) it must wait for;
+        `BATCH_STEP_DEPENDENCIES` by default. Adding a resource to a step makes
+        it wait longer.
+    """
+    dependencies = dependencies or BATCH_STEP_DEPENDENCIES
+    scans = [{"scan_time": 9, "start_deg": 0, **scan} for scan in scans]
+
+    trajectories = []
+    for scan in scans:
+        trajectory = yield from _read_rotation_trajectory(
+            rot_motor,
+            scan["num_images"],
+            scan["scan_time"],
+            scan["start_deg"],
+            scan.get("exposure_time"),
+            detector=detector,
+        )
+        trajectories.append(trajectory)
+
+    max_velocity = yield from bps.rd(rot_motor.max_velocity)
+    move_velocity = max_velocity or DEFAULT_ROT_MOVE_VELOCITY
+
+    flyers = [panda_flyer, manta_flyer]
+
+    def setup_step(step, index):
+        scan, trajectory = scans[index], trajectories[index]
+        if step == "move_to_start":
+            yield from bps.mv(rot_motor.velocity, move_velocity)
+            yield from bps.abs_set(
+                rot_motor, trajectory.move_start_deg, group=f"batch_move_{index}"
+            )
+        elif step == "configure_pcomp":
+            yield from _configure_pcomp(panda, trajectory)
+        elif step == "prepare_panda":
+            # Never arm the PandA while the stage is still moving back.
+            yield from bps.wait(group=f"batch_move_{index}")
+            yield from bps.stage(panda, wait=True)
+            yield from _prepare_panda_fly(
+                panda, scan["num_images"], scan.get("exposure_time")
+            )
+        elif step == "prepare_detector":
+            yield from bps.stage(detector, wait=True)
+            yield from _prepare_detector_fly(
+                detector, scan["num_images"], scan.get("exposure_time")
+            )
+        else:
+            raise ValueError(f"Unknown batch setup step {step!r}")
+
+    yield from bps.stage_all(*flyers)
+    for step in dependencies:
+        yield from setup_step(step, 0)
+
+    panda_stream_name = f"{panda.name}_stream"
+    detector_stream_name = f"{detector.name}_stream"
+    for i, (scan, trajectory) in enumerate(zip(scans, trajectories)):
+        yield from bps.open_run(
+            md={
+                **tomo_run_md(trajectory),
+                "batch": {"index": i, "num_scans": len(scans)},
+                **scan.get("md", {}),
+            }
+        )
+        yield from bps.wait(group=f"batch_move_{i}")
+        yield from bps.mv(rot_motor.velocity, trajectory.velocity)
+
+        yield from bps.declare_stream(panda, name=panda_stream_name)
+        yield from bps.declare_stream(detector, name=detector_stream_name)
+
+        panda_group, detector_group = yield from _kickoff_rotation_fly(
+            panda, detector, suffix=f"_{i}"
+        )
+        yield from bps.abs_set(
+            rot_motor, trajectory.move_stop_deg, group=f"rotation_{i}"
+        )
+
+        pending = {
+            "rot_motor": (f"rotation_{i}", None, None),
+            "panda": (panda_group, panda, panda_stream_name),
+            "detector": (detector_group, detector, detector_stream_name),
+        }
+        released = set()
+        launched = set()
+        while pending:
+            for resource, (group, device, stream_name) in list(pending.items()):
+                done = yield from _wait_for_group(group, timeout=0.2)
+                if device is not None:
+                    yield from bps.collect(device, name=stream_name)
+                if done:
+                    if device is not None:
+                        # Closes the file of this scan.
+                        yield from bps.unstage(device, wait=True)
+                    released.add(resource)
+                    del pending[resource]
+
+            if i + 1 < len(scans):
+                for step, required in dependencies.items():
+                    if step not in launched and set(required) <= released:
+                        launched.add(step)
+                        yield from setup_step(step, i + 1)
+                        if step == "move_to_start":
+                            pending["start_position"] = (
+                                f"batch_move_{i + 1}",
+                                None,
+                                None,
+                            )
+
+        yield from bps.close_run()
+
+        # Steps depending on resources outside of the model run after the scan.
+        if i + 1 < len(scans):
+            for step in dependencies:
+                if step not in launched:
+                    yield from setup_step(step, i + 1)
+        print(
+            f"Scan {i + 1}/{len(scans)} done, {len(launched)} setup step(s) overlapped"
+        )
+
+    yield from bps.unstage_all(*flyers)
+    # Reset the velocity back to high.
+    yield from bps.mv(rot_motor.velocity, move_velocity)
+
+
+file_loading_timer.stop_timer(__file__)
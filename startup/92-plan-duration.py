@@ -0,0 +1,381 @@
+file_loading_timer.start_timer(__file__)
+
+import contextlib
+import io
+import math
+import time as ttime
+import uuid
+from collections import Counter, defaultdict
+from dataclasses import dataclass, field
+
+# Overheads [s] assumed for the commands never measured by `plan_overheads`.
+DEFAULT_COMMAND_OVERHEADS = {
+    "stage": 0.5,
+    "unstage": 0.2,
+    "prepare": 0.5,
+    "kickoff": 0.1,
+    "complete": 0.0,
+    "open_run": 0.05,
+    "close_run": 0.05,
+    "declare_stream": 0.01,
+    "collect": 0.02,
+    "read": 0.01,
+    "locate": 0.01,
+    "set": 0.01,
+}
+
+# Commands that block the plan until done; their time is the next message time.
+MEASURED_COMMANDS = (
+    "stage",
+    "unstage",
+    "open_run",
+    "close_run",
+    "declare_stream",
+    "collect",
+    "read",
+    "locate",
+    "create",
+    "save",
+    "configure",
+)
+# Commands returning a status; their time is measured until the wait on their group.
+MEASURED_STATUS_COMMANDS = ("prepare", "kickoff")
+
+# Signal values used by the estimator instead of reading the hardware.
+ESTIMATOR_SIGNAL_VALUES = {
+    "rot_motor": 0,
+    "rot_motor-acceleration_time": 0.5,
+    "rot_motor-max_velocity": DEFAULT_ROT_MOVE_VELOCITY,
+    "rot_motor-velocity": DEFAULT_ROT_MOVE_VELOCITY,
+}
+
+
+class PlanOverheads:
+    """
+    Setup overheads of the plan messages, measured in previous runs.
+
+    ``msg_hook`` is installed as the RunEngine ``msg_hook``: the time between
+    a blocking message (stage, open_run, collect...) and the next one, and
+    between a prepare/kickoff and the end of the wait on its group, is averaged
+    per ``"<command>:<device>"``. Means are kept in memory and written to
+    ``storage`` (redis in the profile) at every ``close_run``.
+    """
+
+    def __init__(self, storage, alpha=0.2, max_sample=60.0):
+        self._storage = storage
+        self.alpha = alpha
+        self.max_sample = max_sample
+        self._means = None
+        self._dirty = set()
+        self._previous = None
+        self._groups = defaultdict(list)
+
+    @property
+    def means(self):
+        if self._means is None:
+            self._means = {key: dict(value) for key, value in self._storage.items()}
+        return self._means
+
+    @staticmethod
+    def key(command, obj=None):
+        name = getattr(obj, "name", None)
+        return f"{command}:{name}" if name else command
+
+    def get(self, command, obj=None, default=None):
+        """Return the mean overhead of ``command`` on ``obj``, or of any device."""
+        for key in (self.key(command, obj), command):
+            if key in self.means:
+                return self.means[key]["mean"]
+        if default is not None:
+            return default
+        return DEFAULT_COMMAND_OVERHEADS.get(command, 0.0)
+
+    def record(self, command, obj, elapsed):
+        if elapsed < 0 or elapsed > self.max_sample:
+            return
+        keys = {self.key(command, obj), command}
+        for key in keys:
+            entry = self.means.setdefault(key, {"mean": elapsed, "count": 0})
+            entry["mean"] += self.alpha * (elapsed - entry["mean"])
+            entry["count"] += 1
+            self._dirty.add(key)
+
+    def flush(self):
+        for key in self._dirty:
+            # Reassign the top-level key so that the storage backend persists it.
+            self._storage[key] = self.means[key]
+        self._dirty.clear()
+
+    def msg_hook(self, msg):
+        now = ttime.monotonic()
+        if self._previous is not None:
+            previous, t0 = self._previous
+            if previous.command in MEASURED_COMMANDS:
+                self.record(previous.command, previous.obj, now - t0)
+            elif previous.command == "wait":
+                for command, obj, issued in self._groups.pop(
+                    previous.kwargs.get("group"), []
+                ):
+                    self.record(command, obj, now - issued)
+        if msg.command in MEASURED_STATUS_COMMANDS:
+            self._groups[msg.kwargs.get("group")].append((msg.command, msg.obj, now))
+        self._previous = (msg, now)
+        if msg.command == "close_run":
+            self._groups.clear()
+            try:
+                self.flush()
+            except Exception as err:
+                print(f"Could not store the plan overheads: {err!r}")
+
+
+plan_overheads = PlanOverheads(
+    RedisJSONDict(redis.Redis("info.tst.nsls2.bnl.gov"), prefix="plan_overheads-")
+)
+RE.msg_hook = plan_overheads.msg_hook
+
+
+@dataclass
+class PlanDurationEstimate:
+    plan_name: str
+    duration: float
+    breakdown: dict = field(default_factory=dict)
+    num_runs: int = 0
+    num_messages: int = 0
+
+    def __str__(self):
+        parts = ", ".join(
+            f"{k}={v:.2f}s"
+            for k, v in sorted(self.breakdown.items(), key=lambda kv: -kv[1])
+            if v
+        )
+        return f"{self.plan_name}: {self.duration:.2f}s ({parts})"
+
+
+def motor_move_time(distance, velocity, acceleration_time):
+    """Duration of a trapezoidal move; short moves never reach ``velocity``."""
+    distance = abs(distance)
+    if distance == 0 or not velocity:
+        return 0.0
+    if distance >= velocity * acceleration_time:
+        return distance / velocity + acceleration_time
+    return 2 * math.sqrt(distance * acceleration_time / velocity)
+
+
+class PlanDurationEstimator:
+    """
+    Predict the duration of a plan by simulating its messages without hardware.
+
+    The plan is run against a virtual clock:
+
+    - motor moves take the time of a trapezoidal profile from the current
+      velocity and ACCL (``set`` on the velocity signal is followed),
+    - a detector completes ``number * (livetime + deadtime)`` of its prepared
+      `TriggerInfo` after its kickoff, and not before the end of the motion in
+      flight when externally triggered,
+    - ``sleep`` advances the clock, waits with a timeout raise `TimeoutError`
+      like in the RunEngine, so polling loops run as in a real scan,
+    - other commands take their overhead measured by `plan_overheads`.
+
+    Reads are answered from ``signal_values`` (by signal name), with bluesky's
+    simulation default (0) for the others.
+    """
+
+    def __init__(self, overheads=None, signal_values=None):
+        self.overheads = overheads or plan_overheads
+        self.signal_values = dict(ESTIMATOR_SIGNAL_VALUES)
+        self.signal_values.update(signal_values or {})
+
+    def _reset(self):
+        self._now = 0.0
+        self._values = dict(self.signal_values)
+        self._groups = defaultdict(list)
+        self._trigger_info = {}
+        self._kickoff = {}
+        self._motion_end = 0.0
+        self._breakdown = Counter()
+        self._num_runs = 0
+
+    def _advance(self, seconds, category):
+        if seconds > 0:
+            self._now += seconds
+            self._breakdown[category] += seconds
+
+    def _status(self, group, duration, category):
+        self._groups[group].append((self._now + duration, category))
+
+    @staticmethod
+    def _is_motor(obj):
+        return hasattr(obj, "velocity") and hasattr(obj, "acceleration_time")
+
+    def _set(self, msg):
+        obj, value = msg.obj, msg.args[0]
+        group = msg.kwargs.get("group")
+        if self._is_motor(obj):
+            start = self._values.get(obj.name, 0)
+            duration = motor_move_time(
+                value - start,
+                self._values.get(obj.velocity.name, 0),
+                self._values.get(obj.acceleration_time.name, 0),
+            )
+            self._values[obj.name] = value
+            self._motion_end = max(self._motion_end, self._now + duration)
+            self._status(group, duration, "motion")
+        else:
+            self._values[obj.name] = value
+            self._status(group, self.overheads.get("set", obj), "set")
+
+    def _complete_time(self, obj):
+        kickoff = self._kickoff.pop(obj.name, None)
+        info = self._trigger_info.get(obj.name)
+        if kickoff is None or info is None:
+            return self._now
+        per_frame = (getattr(info, "livetime", None) or 0) + (
+            getattr(info, "deadtime", None) or 0
+        )
+        done = kickoff + (getattr(info, "number", 0) or 0) * per_frame
+        trigger = getattr(getattr(info, "trigger", None), "value", "internal")
+        if trigger != "internal" and self._motion_end > kickoff:
+            done = max(done, self._motion_end)
+        return max(done, self._now)
+
+    def _wait(self, msg):
+        group = msg.kwargs.get("group")
+        statuses = self._groups.get(group, [])
+        if not statuses:
+            self._groups.pop(group, None)
+            return
+        end, category = max(statuses)
+        timeout = msg.kwargs.get("timeout")
+        if timeout is not None and end - self._now > timeout:
+            self._advance(timeout, category)
+            if not msg.kwargs.get("move_on"):
+                raise TimeoutError(f"Simulated timeout waiting for {group!r}")
+            return
+        self._advance(end - self._now, category)
+        del self._groups[group]
+
+    def _process(self, msg):
+        command = msg.command
+        obj = msg.obj
+        group = msg.kwargs.get("group")
+        if command == "set":
+            self._set(msg)
+        elif command == "wait":
+            self._wait(msg)
+        elif command == "sleep":
+            self._advance(msg.args[0], "sleep")
+        elif command == "prepare":
+            if hasattr(msg.args[0], "livetime"):
+                self._trigger_info[obj.name] = msg.args[0]
+            self._status(group, self.overheads.get("prepare", obj), "prepare")
+        elif command == "kickoff":
+            overhead = self.overheads.get("kickoff", obj)
+            self._kickoff[obj.name] = self._now + overhead
+            self._status(group, overhead, "kickoff")
+        elif command == "complete":
+            self._status(group, self._complete_time(obj) - self._now, "acquisition")
+        elif command == "locate":
+            self._advance(self.overheads.get(command, obj), command)
+            position = self._values.get(obj.name, 0)
+            return {"setpoint": position, "readback": position}
+        elif command == "read":
+            self._advance(self.overheads.get(command, obj), command)
+            if obj.name in self._values:
+                value = self._values[obj.name]
+                return {obj.name: {"value": value, "timestamp": self._now}}
+            return None
+        elif command == "open_run":
+            self._num_runs += 1
+            self._advance(self.overheads.get(command), command)
+            return str(uuid.uuid4())
+        else:
+            self._advance(self.overheads.get(command, obj), command)
+        return None
+
+    def estimate(self, plan, plan_name=None):
+        """
+        Run ``plan`` (a generator) against the virtual clock.
+
+        Returns:
+        --------
+        PlanDurationEstimate with the duration [s] and its breakdown by
+        ``motion``, ``acquisition``, ``sleep`` and command overheads.
+        """
+        self._reset()
+        plan_name = plan_name or getattr(plan, "__name__", "plan")
+        num_messages = 0
+        response, error = None, None
+        # The plans report their progress with prints, not wanted while estimating.
+        with contextlib.redirect_stdout(io.StringIO()):
+            while True:
+                try:
+                    if error is not None:
+                        msg = plan.throw(error)
+                    else:
+                        msg = plan.send(response)
+                except StopIteration:
+                    break
+                num_messages += 1
+                response, error = None, None
+                try:
+                    response = self._process(msg)
+                except TimeoutError as err:
+                    error = err
+        return PlanDurationEstimate(
+            plan_name=plan_name,
+            duration=self._now,
+            breakdown=dict(self._breakdown),
+            num_runs=self._num_runs,
+            num_messages=num_messages,
+        )
+
+
+def _resolve_queue_arg(value):
+    obj = globals().get(value) if isinstance(value, str) else None
+    return obj if hasattr(obj, "name") else value
+
+
+def estimate_plan_duration(plan_name, *args, estimator=None, **kwargs):
+    """
+    Estimate the duration of ``plan_name(*args, **kwargs)``.
+
+    Arguments naming a device of the profile (e.g. ``"panda1"``) are resolved
+    like the queueserver does.
+    """
+    estimator = estimator or PlanDurationEstimator()
+    plan = globals()[plan_name]
+    args = [_resolve_queue_arg(arg) for arg in args]
+    kwargs = {k: _resolve_queue_arg(v) for k, v in kwargs.items()}
+    return estimator.estimate(plan(*args, **kwargs), plan_name=plan_name)
+
+
+def estimate_queue_duration(items, signal_values=None):
+    """
+    Estimate every plan of a queue.
+
+    Parameters:
+    -----------
+    items: sequence of dict
+        Queueserver items, ``{"name": ..., "args": [...], "kwargs": {...}}``.
+    signal_values: dict, optional
+        Signal values overriding `ESTIMATOR_SIGNAL_VALUES`.
+
+    Returns:
+    --------
+    (estimates, total duration [s])
+    """
+    estimator = PlanDurationEstimator(signal_values=signal_values)
+    estimates = [
+        estimate_plan_duration(
+            item["name"],
+            *item.get("args", []),
+            estimator=estimator,
+            **item.get("kwargs", {}),
+        )
+        for item in items
+        if item.get("item_type", "plan") == "plan"
+    ]
+    return estimates, sum(e.duration for e in estimates)
+
+
+file_loading_timer.stop_timer(__file__)